@@ -0,0 +1,260 @@
+import os
+import re
+import sys
+import csv
+import logging
+import argparse
+from collections import defaultdict
+from dotenv import load_dotenv
+import rdflib
+from rdflib.namespace import OWL, RDF, RDFS, XSD
+
+# Reuse the streaming RDF reader of the triple loader and the shared connections
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from connections import Neo4jConnection, retry
+from load_rdf_ontology import read_triples
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Ontology database connection details
+NEO4J_URI_ONTOLOGY = os.getenv("NEO4J_URI_ONTOLOGY", os.getenv("NEO4J_URI"))
+NEO4J_USERNAME_ONTOLOGY = os.getenv("NEO4J_USERNAME_ONTOLOGY", os.getenv("NEO4J_USERNAME"))
+NEO4J_PASSWORD_ONTOLOGY = os.getenv("NEO4J_PASSWORD_ONTOLOGY", os.getenv("NEO4J_PASSWORD"))
+NEO4J_ONTOLOGY_DB_NAME = os.getenv("NEO4J_ONTOLOGY_DB_NAME", "movie_ontology")
+
+LPG = rdflib.Namespace("http://neo4j.com/lpg-ontology#")
+
+# rdf:type object -> (kind of NeoOWL node, extra labels)
+TYPES = {
+    OWL.Class: ("Label", ()),
+    RDFS.Class: ("Label", ()),
+    LPG.Label: ("Label", ()),
+    LPG.PatternDefinedLabel: ("Label", ("PatternDefinedLabel",)),
+    OWL.ObjectProperty: ("Relationship", ()),
+    RDF.Property: ("Relationship", ()),
+    LPG.Relationship: ("Relationship", ()),
+    OWL.SymmetricProperty: ("Relationship", ("Symmetric",)),
+    LPG.Symmetric: ("Relationship", ("Symmetric",)),
+    LPG.PatternDefinedRelationship: ("Relationship", ("PatternDefinedRelationship",)),
+    LPG.Property: ("Property", ()),
+    LPG.PatternDefinedNodeProperty: ("Property", ("PatternDefinedNodeProperty",)),
+}
+
+# Predicate -> (NeoOWL edge type, source kind, target kind); None kinds follow the terms' types
+EDGES = {
+    RDFS.subClassOf: ("SCO", "Label", "Label"),
+    LPG.SCO: ("SCO", "Label", "Label"),
+    RDFS.subPropertyOf: ("IMPLIES", "Relationship", "Relationship"),
+    LPG.IMPLIES: ("IMPLIES", "Relationship", "Relationship"),
+    OWL.equivalentClass: ("EQUIVALENT", "Label", "Label"),
+    OWL.equivalentProperty: ("EQUIVALENT", "Relationship", "Relationship"),
+    LPG.EQUIVALENT: ("EQUIVALENT", None, None),
+    RDFS.domain: ("SOURCE", "Relationship", "Label"),
+    LPG.SOURCE: ("SOURCE", "Relationship", "Label"),
+    RDFS.range: ("TARGET", "Relationship", "Label"),
+    LPG.TARGET: ("TARGET", "Relationship", "Label"),
+    LPG.HAS_PROPERTY: ("HAS_PROPERTY", "Label", "Property"),
+}
+
+# lpg: datatype properties copied onto the NeoOWL nodes
+PROPERTIES = {LPG[name]: name for name in ("name", "pattern", "classElementVariable", "sourceElementVariable",
+                                           "targetElementVariable", "propertyOwnerVariable", "valueVariable")}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def _local_name(iri):
+    return re.split(r"[#/:]", str(iri).rstrip("#/"))[-1]
+
+class OntologyCompiler:
+    """Map RDFS / OWL / lpg: triples straight to NeoOWL Label, Relationship and Property nodes.
+
+    Triples are folded into a compact model as they stream in, so memory
+    grows with the number of classes and properties, not of triples. Blank
+    node class expressions (unions, restrictions) and datatype ranges have no
+    NeoOWL counterpart and are skipped.
+    """
+    def __init__(self):
+        self.kinds = {}
+        self.labels = defaultdict(set)
+        self.properties = defaultdict(dict)
+        self.edges = set()
+        self.skipped = 0
+
+    def add(self, subject, predicate, obj):
+        if isinstance(subject, rdflib.BNode):
+            self.skipped += 1
+        elif predicate == RDF.type and obj in TYPES:
+            kind, labels = TYPES[obj]
+            self.kinds.setdefault(subject, kind)
+            self.labels[subject].update(labels)
+        elif predicate in PROPERTIES and isinstance(obj, rdflib.Literal):
+            self.properties[subject][PROPERTIES[predicate]] = obj.toPython()
+        elif predicate in EDGES and isinstance(obj, rdflib.URIRef) \
+                and not obj.startswith(str(XSD)) and obj != RDFS.Literal:
+            self.edges.add((EDGES[predicate], subject, obj))
+        else:
+            self.skipped += 1
+
+    def add_all(self, triples):
+        for triple in triples:
+            self.add(*triple)
+
+    def compile(self):
+        """Return the NeoOWL nodes as {(kind, name): (labels, properties)} and edges as (type, start, end) keys."""
+        kinds = dict(self.kinds)
+        for (_, source_kind, target_kind), subject, obj in sorted(self.edges, key=str):
+            if source_kind:
+                kinds.setdefault(subject, source_kind)
+            if target_kind:
+                kinds.setdefault(obj, target_kind)
+        for (_, source_kind, target_kind), subject, obj in sorted(self.edges, key=str):
+            # Untyped ends of an lpg:EQUIVALENT edge take the kind of the other end
+            kinds.setdefault(subject, kinds.get(obj, "Label"))
+            kinds.setdefault(obj, kinds[subject])
+
+        def key(term):
+            return kinds[term], str(self.properties[term].get("name") or _local_name(term))
+
+        nodes = {}
+        for term in kinds:
+            labels, properties = nodes.setdefault(key(term), (set(), {}))
+            labels.update(self.labels[term])
+            properties.update(self.properties[term], name=key(term)[1])
+        edges = {(edge_type, key(subject), key(obj)) for (edge_type, _, _), subject, obj in self.edges}
+        return nodes, edges
+
+def _node_groups(nodes):
+    groups = defaultdict(list)
+    for (kind, name), (labels, properties) in sorted(nodes.items()):
+        groups[(kind, tuple(sorted(labels)))].append({"name": name, "properties": properties})
+    return groups
+
+def _edge_groups(edges):
+    groups = defaultdict(list)
+    for edge_type, (start_kind, start), (end_kind, end) in sorted(edges):
+        groups[(edge_type, start_kind, end_kind)].append([start, end])
+    return groups
+
+def _node_statement(kind, labels, rows):
+    extra_labels = f"SET n{''.join(':' + label for label in labels)}\n" if labels else ""
+    return f"""UNWIND {rows} AS node
+MERGE (n:{kind} {{name: node.name}})
+{extra_labels}SET n += node.properties"""
+
+def _edge_statement(edge_type, start_kind, end_kind, rows):
+    return f"""UNWIND {rows} AS edge
+MATCH (a:{start_kind} {{name: edge[0]}})
+MATCH (b:{end_kind} {{name: edge[1]}})
+MERGE (a)-[:{edge_type}]->(b)"""
+
+def statements(nodes, edges, batch_size, rows_for):
+    """Yield (statement, parameters) pairs creating `nodes` then `edges` in UNWIND batches.
+
+    `rows_for(rows)` returns the text standing for the UNWIND list and the
+    parameters to send with it, so the same statements can be run or written out.
+    """
+    for (kind, labels), rows in _node_groups(nodes).items():
+        for i in range(0, len(rows), batch_size):
+            text, params = rows_for(rows[i:i + batch_size])
+            yield _node_statement(kind, labels, text), params
+    for (edge_type, start_kind, end_kind), rows in _edge_groups(edges).items():
+        for i in range(0, len(rows), batch_size):
+            text, params = rows_for(rows[i:i + batch_size])
+            yield _edge_statement(edge_type, start_kind, end_kind, text), params
+
+def cypher_literal(value):
+    """Render a Python value as a Cypher literal."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(cypher_literal(item) for item in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{key if _IDENTIFIER.match(key) else f'`{key}`'}: {cypher_literal(item)}"
+                               for key, item in value.items()) + "}"
+    text = str(value).replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n")
+    return f"'{text}'"
+
+def load_into_neo4j(conn, database, nodes, edges, batch_size=10000):
+    """MERGE the compiled ontology into the ontology database."""
+    with conn.session(database) as session:
+        for kind in ("Label", "Relationship", "Property"):
+            statement = f"CREATE INDEX {kind.lower()}_name IF NOT EXISTS FOR (n:{kind}) ON (n.name)"
+            retry(lambda: session.run(statement).consume(), description="index creation")
+        for statement, params in statements(nodes, edges, batch_size, lambda rows: ("$rows", {"rows": rows})):
+            session.execute_write(lambda tx: tx.run(statement, params).consume())
+    logger.info(f"Loaded {len(nodes)} nodes and {len(edges)} edges into database: {database}")
+
+def write_cypher(path, nodes, edges, batch_size=10000):
+    """Write the compiled ontology as a semicolon-separated Cypher script."""
+    with open(path, "w") as file:
+        for statement, _ in statements(nodes, edges, batch_size, lambda rows: (cypher_literal(rows), None)):
+            file.write(statement + ";\n\n")
+    logger.info(f"Wrote {len(nodes)} nodes and {len(edges)} edges to {path}")
+
+def write_csv(directory, nodes, edges):
+    """Write the compiled ontology as neo4j-admin import nodes.csv and relationships.csv files."""
+    os.makedirs(directory, exist_ok=True)
+    columns = sorted({key for _, properties in nodes.values() for key in properties})
+    with open(os.path.join(directory, "nodes.csv"), "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id:ID"] + columns + [":LABEL"])
+        for (kind, name), (labels, properties) in sorted(nodes.items()):
+            writer.writerow([f"{kind}:{name}"] + [properties.get(column, "") for column in columns]
+                            + [";".join([kind] + sorted(labels))])
+    with open(os.path.join(directory, "relationships.csv"), "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow([":START_ID", ":END_ID", ":TYPE"])
+        for edge_type, start, end in sorted(edges):
+            writer.writerow([":".join(start), ":".join(end), edge_type])
+    logger.info(f"Wrote {len(nodes)} nodes and {len(edges)} edges to {directory}")
+
+def compile_ontology(path, rdf_format=None, chunk_size=100000):
+    """Stream an RDF file through the compiler and return its NeoOWL nodes and edges."""
+    compiler = OntologyCompiler()
+    for chunk in read_triples(path, rdf_format, chunk_size):
+        compiler.add_all(chunk)
+    nodes, edges = compiler.compile()
+    logger.info(f"Compiled {path} to {len(nodes)} nodes and {len(edges)} edges "
+                f"({compiler.skipped} triples without a NeoOWL counterpart)")
+    return nodes, edges
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compile an RDFS / OWL ontology to the NeoOWL meta-model.")
+    parser.add_argument("file", help="RDF file to compile (Turtle, N-Triples, ...)")
+    parser.add_argument("--format", help="rdflib format of the file, guessed from its extension by default")
+    parser.add_argument("--chunk-size", type=int, default=100000,
+                        help="Statements parsed at a time from N-Triples and Turtle files")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per UNWIND statement")
+    parser.add_argument("--cypher", help="Write a Cypher script instead of loading the ontology database")
+    parser.add_argument("--csv", help="Write neo4j-admin import CSV files to this directory instead")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    nodes, edges = compile_ontology(args.file, args.format, args.chunk_size)
+    if args.cypher:
+        write_cypher(args.cypher, nodes, edges, args.batch_size)
+    if args.csv:
+        write_csv(args.csv, nodes, edges)
+    if args.cypher or args.csv:
+        return
+
+    conn = Neo4jConnection(NEO4J_URI_ONTOLOGY, NEO4J_USERNAME_ONTOLOGY, NEO4J_PASSWORD_ONTOLOGY)
+    try:
+        load_into_neo4j(conn, NEO4J_ONTOLOGY_DB_NAME, nodes, edges, args.batch_size)
+    except Exception as e:
+        logger.error(f"Loading failed: {e}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
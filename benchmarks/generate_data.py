@@ -0,0 +1,202 @@
+"""Synthetic movie-graph-shaped data at any size, with the degree skew of real collaboration graphs.
+
+Everything is generated lazily from a seed, so graphs of 10^8 nodes stream
+straight into Neo4j (UNWIND batches) or into neo4j-admin import files
+without being held in memory. For the largest sizes, write CSV files and
+import them offline:
+
+    neo4j-admin database import full --id-type=integer --nodes=movies.csv --nodes=persons.csv \
+        --relationships=acted.csv --relationships=knows.csv <database>
+"""
+import os
+import csv
+import random
+import logging
+import argparse
+from collections import defaultdict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+from generate_ontology import MOVIE, PERSON, add_shape_arguments, delete_all, shape_from_args, vocabulary
+from connections import Neo4jConnection
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Benchmark database connection details
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEOOWL_BENCH_DB_NAME = os.getenv("NEOOWL_BENCH_DB_NAME", "neoowl-bench")
+
+# People the movie ontology's pattern-defined labels single out
+NAMED_PEOPLE = ["Kevin Bacon", "Emil Eifrem"]
+
+
+@dataclass
+class DataShape:
+    """Size and skew of a synthetic movie graph.
+
+    Roles per person follow a Pareto distribution of shape `roles_exponent`
+    (lower means a heavier tail of prolific actors), and the movie or person
+    at the other end of a relationship is drawn with `popularity_skew`
+    (above 1, a few blockbusters and well-connected people attract most edges).
+    """
+    nodes: int = 1000
+    seed: int = 42
+    movie_ratio: float = 0.25
+    roles_exponent: float = 1.5
+    popularity_skew: float = 2.0
+    knows_per_person: float = 1.0
+    director_ratio: float = 0.05
+    producer_ratio: float = 0.03
+    writer_ratio: float = 0.02
+
+    @property
+    def movies(self):
+        return max(1, int(self.nodes * self.movie_ratio))
+
+    @property
+    def persons(self):
+        return max(1, self.nodes - self.movies)
+
+
+def _popular(rng, count, skew):
+    """Draw an index in [0, count), low indexes being the most popular."""
+    return min(int(count * rng.random() ** skew), count - 1)
+
+
+def nodes(shape, words):
+    """Yield (labels, properties) for every movie, then every person."""
+    rng = random.Random(f"{shape.seed}:nodes")
+    for uid in range(shape.movies):
+        yield (MOVIE,), {"uid": uid, "title": f"Movie {uid}", "released": 1950 + rng.randrange(75)}
+    for uid in range(shape.persons):
+        name = NAMED_PEOPLE[uid] if uid < len(NAMED_PEOPLE) else f"Person {uid}"
+        labels = (PERSON, rng.choice(words.person_labels)) if words.person_labels != [PERSON] else (PERSON,)
+        yield labels, {"uid": uid, "name": name, "born": 1920 + rng.randrange(85)}
+
+
+def relationships(shape, words):
+    """Yield (type, start label, end label, [start uid, end uid]) for every relationship."""
+    rng = random.Random(f"{shape.seed}:relationships")
+    movies, persons, skew = shape.movies, shape.persons, shape.popularity_skew
+    crew = [("DIRECTED", shape.director_ratio), ("PRODUCED", shape.producer_ratio), ("WROTE", shape.writer_ratio)]
+    for uid in range(persons):
+        roles = min(int(rng.paretovariate(shape.roles_exponent)), movies)
+        for movie in {_popular(rng, movies, skew) for _ in range(roles)}:
+            yield rng.choice(words.acting_types), PERSON, MOVIE, [uid, movie]
+        for rel_type, ratio in crew:
+            if rng.random() < ratio:
+                yield rel_type, PERSON, MOVIE, [uid, _popular(rng, movies, skew)]
+        if words.symmetric_types:
+            known = int(shape.knows_per_person) + (rng.random() < shape.knows_per_person % 1)
+            for other in {_popular(rng, persons, skew) for _ in range(known)} - {uid}:
+                yield rng.choice(words.symmetric_types), PERSON, PERSON, [uid, other]
+
+
+def _batches(items, batch_size):
+    """Group (key, row) items into (key, rows) batches of at most `batch_size` rows."""
+    groups = defaultdict(list)
+    for key, row in items:
+        rows = groups[key]
+        rows.append(row)
+        if len(rows) >= batch_size:
+            yield key, rows
+            groups[key] = []
+    for key, rows in groups.items():
+        if rows:
+            yield key, rows
+
+
+def load_into_neo4j(conn, database, shape, words, batch_size=10000):
+    """Create the graph in `database` with batched UNWIND statements."""
+    node_count = relationship_count = 0
+    with conn.session(database) as session:
+        for label in (PERSON, MOVIE):
+            session.run(f"CREATE CONSTRAINT {label.lower()}_uid IF NOT EXISTS "
+                        f"FOR (n:{label}) REQUIRE n.uid IS UNIQUE").consume()
+        for labels, rows in _batches(nodes(shape, words), batch_size):
+            session.execute_write(lambda tx: tx.run(f"""UNWIND $rows AS row
+                CREATE (n:{':'.join(labels)})
+                SET n = row""", rows=rows).consume())
+            node_count += len(rows)
+        items = (((rel_type, start, end), row) for rel_type, start, end, row in relationships(shape, words))
+        for (rel_type, start, end), rows in _batches(items, batch_size):
+            session.execute_write(lambda tx: tx.run(f"""UNWIND $rows AS row
+                MATCH (a:{start} {{uid: row[0]}})
+                MATCH (b:{end} {{uid: row[1]}})
+                CREATE (a)-[:{rel_type}]->(b)""", rows=rows).consume())
+            relationship_count += len(rows)
+    logger.info(f"Loaded {node_count} nodes and {relationship_count} relationships into database: {database}")
+
+
+def write_csv(directory, shape, words):
+    """Write the graph as neo4j-admin import files (import with --id-type=integer)."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "movies.csv"), "w", newline="") as movie_file, \
+            open(os.path.join(directory, "persons.csv"), "w", newline="") as person_file:
+        movie_writer, person_writer = csv.writer(movie_file), csv.writer(person_file)
+        movie_writer.writerow([f"uid:ID({MOVIE})", "title", "released:int", ":LABEL"])
+        person_writer.writerow([f"uid:ID({PERSON})", "name", "born:int", ":LABEL"])
+        for labels, properties in nodes(shape, words):
+            writer = movie_writer if labels[0] == MOVIE else person_writer
+            writer.writerow(list(properties.values()) + [";".join(labels)])
+    with open(os.path.join(directory, "acted.csv"), "w", newline="") as acted_file, \
+            open(os.path.join(directory, "knows.csv"), "w", newline="") as knows_file:
+        acted_writer, knows_writer = csv.writer(acted_file), csv.writer(knows_file)
+        acted_writer.writerow([f":START_ID({PERSON})", f":END_ID({MOVIE})", ":TYPE"])
+        knows_writer.writerow([f":START_ID({PERSON})", f":END_ID({PERSON})", ":TYPE"])
+        for rel_type, _, end, (start_uid, end_uid) in relationships(shape, words):
+            writer = acted_writer if end == MOVIE else knows_writer
+            writer.writerow([start_uid, end_uid, rel_type])
+    logger.info(f"Wrote {shape.nodes} nodes to {directory}")
+
+
+def add_data_arguments(parser):
+    defaults = DataShape()
+    for name, value in vars(defaults).items():
+        if name != "nodes":
+            parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value,
+                                help=f"Data {name.replace('_', ' ')} (default: {value})")
+
+
+def data_shape_from_args(args, nodes):
+    return DataShape(nodes=nodes, **{name: getattr(args, name) for name in vars(DataShape()) if name != "nodes"})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic movie graph for an ontology shape.")
+    parser.add_argument("--nodes", type=int, default=DataShape.nodes, help="Number of nodes to generate")
+    add_data_arguments(parser)
+    add_shape_arguments(parser)
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per UNWIND statement")
+    parser.add_argument("--database", default=NEOOWL_BENCH_DB_NAME,
+                        help="Database to replace with the generated graph")
+    parser.add_argument("--csv", help="Write neo4j-admin import CSV files to this directory instead")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    shape, words = data_shape_from_args(args, args.nodes), vocabulary(shape_from_args(args))
+    if args.csv:
+        write_csv(args.csv, shape, words)
+        return
+
+    conn = Neo4jConnection(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+    try:
+        delete_all(conn, args.database)
+        load_into_neo4j(conn, args.database, shape, words, args.batch_size)
+    except Exception as e:
+        logger.error(f"Loading failed: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
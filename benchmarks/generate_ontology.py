@@ -0,0 +1,172 @@
+"""Synthetic NeoOWL ontologies of configurable size, for benchmarking the reasoner."""
+import os
+import sys
+import logging
+import argparse
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+# Reuse the NeoOWL writers of the ontology compiler and the batched delete of the ingestion script
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "OWL2NEOOWL"))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+from connections import Neo4jConnection
+from owl2neoowl import load_into_neo4j, write_csv, write_cypher
+from ingest_databases import delete_all
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Ontology database connection details
+NEO4J_URI_ONTOLOGY = os.getenv("NEO4J_URI_ONTOLOGY", os.getenv("NEO4J_URI"))
+NEO4J_USERNAME_ONTOLOGY = os.getenv("NEO4J_USERNAME_ONTOLOGY", os.getenv("NEO4J_USERNAME"))
+NEO4J_PASSWORD_ONTOLOGY = os.getenv("NEO4J_PASSWORD_ONTOLOGY", os.getenv("NEO4J_PASSWORD"))
+NEOOWL_BENCH_ONTOLOGY_DB_NAME = os.getenv("NEOOWL_BENCH_ONTOLOGY_DB_NAME", "neoowl-bench-ontology")
+
+# The movie graph vocabulary the synthetic hierarchies hang from
+PERSON = "Person"
+MOVIE = "Movie"
+INVOLVED_IN = "INVOLVED_IN"
+
+
+@dataclass
+class OntologyShape:
+    """Size of a synthetic ontology.
+
+    The label hierarchy is a complete tree of `label_width` subclasses per
+    class over `label_depth` levels under Person; the relationship hierarchy
+    is built the same way under INVOLVED_IN. Data is generated with the
+    leaves, so every fact has to climb the whole hierarchy.
+    """
+    label_depth: int = 3
+    label_width: int = 3
+    relationship_depth: int = 2
+    relationship_width: int = 3
+    equivalence_classes: int = 2
+    equivalence_size: int = 2
+    symmetric_types: int = 2
+    pattern_labels: int = 2
+
+
+@dataclass
+class Vocabulary:
+    """The labels and relationship types synthetic data must use to exercise an ontology."""
+    person_labels: list
+    acting_types: list
+    symmetric_types: list
+
+
+def _tree(root, prefix, depth, width):
+    """Return the (child, parent) edges of a complete tree under `root`, and its leaves."""
+    edges, level = [], [root]
+    for d in range(1, depth + 1):
+        children = []
+        for parent in level:
+            for _ in range(width):
+                child = f"{prefix}_{d}_{len(children)}"
+                children.append(child)
+                edges.append((child, parent))
+        level = children
+    return edges, level
+
+
+def vocabulary(shape):
+    _, person_labels = _tree(PERSON, PERSON, shape.label_depth, shape.label_width)
+    _, acting_types = _tree(INVOLVED_IN, "ACTED_IN", shape.relationship_depth, shape.relationship_width)
+    return Vocabulary(person_labels=person_labels, acting_types=acting_types,
+                      symmetric_types=[f"KNOWS_{i}" for i in range(shape.symmetric_types)])
+
+
+def generate_ontology(shape):
+    """Return the ontology as NeoOWL nodes {(kind, name): (labels, properties)} and (type, start, end) edges."""
+    nodes, edges = {}, set()
+
+    def node(kind, name, labels=(), **properties):
+        nodes.setdefault((kind, name), (set(labels), {"name": name, **properties}))
+        return kind, name
+
+    label_edges, person_labels = _tree(PERSON, PERSON, shape.label_depth, shape.label_width)
+    node("Label", PERSON)
+    node("Label", MOVIE)
+    for child, parent in label_edges:
+        edges.add(("SCO", node("Label", child), node("Label", parent)))
+
+    subclasses = [child for child, _ in label_edges] or [PERSON]
+    for i in range(shape.equivalence_classes):
+        member = node("Label", subclasses[i % len(subclasses)])
+        for j in range(1, shape.equivalence_size):
+            equivalent = node("Label", f"{member[1]}_EQ{j}")
+            edges.add(("EQUIVALENT", member, equivalent))
+            member = equivalent
+
+    type_edges, acting_types = _tree(INVOLVED_IN, "ACTED_IN", shape.relationship_depth, shape.relationship_width)
+    for name in [INVOLVED_IN] + [child for child, _ in type_edges]:
+        edges.add(("SOURCE", node("Relationship", name), ("Label", PERSON)))
+        edges.add(("TARGET", ("Relationship", name), ("Label", MOVIE)))
+    for child, parent in type_edges:
+        edges.add(("IMPLIES", ("Relationship", child), ("Relationship", parent)))
+
+    for i in range(shape.symmetric_types):
+        symmetric = node("Relationship", f"KNOWS_{i}", ["Symmetric"])
+        edges.add(("SOURCE", symmetric, ("Label", PERSON)))
+        edges.add(("TARGET", symmetric, ("Label", PERSON)))
+
+    for i in range(shape.pattern_labels):
+        acting_type = acting_types[i % len(acting_types)]
+        pattern_label = node("Label", f"_ActedIn_{acting_type}_{i}", ["PatternDefinedLabel"],
+                             pattern=f"(p:{PERSON}) WHERE EXISTS {{(p)-[:{acting_type}]->()}}",
+                             classElementVariable="p")
+        edges.add(("SCO", pattern_label, ("Label", person_labels[i % len(person_labels)])))
+    return nodes, edges
+
+
+def add_shape_arguments(parser):
+    defaults = OntologyShape()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=value,
+                            help=f"Ontology {name.replace('_', ' ')} (default: {value})")
+
+
+def shape_from_args(args):
+    return OntologyShape(**{name: getattr(args, name) for name in vars(OntologyShape())})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic NeoOWL ontology.")
+    add_shape_arguments(parser)
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per UNWIND statement")
+    parser.add_argument("--database", default=NEOOWL_BENCH_ONTOLOGY_DB_NAME,
+                        help="Ontology database to replace with the generated ontology")
+    parser.add_argument("--cypher", help="Write a Cypher script instead of loading the ontology database")
+    parser.add_argument("--csv", help="Write neo4j-admin import CSV files to this directory instead")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    nodes, edges = generate_ontology(shape_from_args(args))
+    logger.info(f"Generated {len(nodes)} nodes and {len(edges)} edges")
+    if args.cypher:
+        write_cypher(args.cypher, nodes, edges, args.batch_size)
+    if args.csv:
+        write_csv(args.csv, nodes, edges)
+    if args.cypher or args.csv:
+        return
+
+    conn = Neo4jConnection(NEO4J_URI_ONTOLOGY, NEO4J_USERNAME_ONTOLOGY, NEO4J_PASSWORD_ONTOLOGY)
+    try:
+        # Replace, rather than extend, the previous ontology
+        delete_all(conn, args.database)
+        load_into_neo4j(conn, args.database, nodes, edges, args.batch_size)
+    except Exception as e:
+        logger.error(f"Loading failed: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
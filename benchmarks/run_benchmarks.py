@@ -0,0 +1,309 @@
+"""Benchmark the reasoner and the CDC server on synthetic graphs, with machine-readable results.
+
+`inference` loads a generated ontology and movie graph of each requested
+size, runs inference to convergence in each requested mode and reports
+iterations, per-rule runs / server time / writes, wall time and write
+amplification (writes reported by the rules per fact that ended up in the
+graph). `cdc` runs the CDC server against a synthetic stream of writes and
+reports the latency from each write's commit to the end of the inference
+batch that covered it. `compare` flags regressions between two result files.
+
+The benchmark databases are wiped on every run; CDC must be enabled on the
+data database for `cdc`, and latencies assume the client and server clocks
+are in sync.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import statistics
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+from neo4j import Query
+
+# generate_ontology puts scripts/ and OWL2NEOOWL/ on the import path
+from generate_ontology import (NEOOWL_BENCH_ONTOLOGY_DB_NAME, add_shape_arguments, delete_all, generate_ontology,
+                               shape_from_args, vocabulary)
+from generate_data import (MOVIE, NEOOWL_BENCH_DB_NAME, PERSON, add_data_arguments, data_shape_from_args,
+                           load_into_neo4j as load_data)
+from owl2neoowl import load_into_neo4j as load_ontology
+import neoowl_server
+from neoowl_server import AsyncNeo4jConnection, CDCService, Neo4jConnection, NeoOWLReasoner
+from rule_metrics import COUNTERS, RuleMetrics
+
+logger = logging.getLogger(__name__)
+
+MODES = ["naive", "semi-naive", "stratified", "inmemory", "snapshot"]
+
+# Transaction metadata of the synthetic write stream, telling its changes
+# apart from the ones the server makes itself
+STREAM_METADATA = {"app": "neoowl-benchmark-stream"}
+
+GRAPH_STATS_QUERY = """CALL () {
+    MATCH (n)
+    RETURN count(n) AS nodes, sum(size(labels(n))) AS labels, sum(size(keys(n))) AS node_properties
+}
+CALL () {
+    MATCH ()-[r]->()
+    RETURN count(r) AS relationships, sum(size(keys(r))) AS relationship_properties
+}
+RETURN nodes, labels, node_properties, relationships, relationship_properties"""
+
+
+class LatencyProbe(CDCService):
+    """A CDC service recording the seconds from each stream transaction's commit to the end of its batch's inference."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commit_times = {}
+        self.latencies = []
+
+    def _make_batch(self, events):
+        batch = super()._make_batch(events)
+        commits = {event["txId"]: event["metadata"]["txCommitTime"] for event in events
+                   if (event["metadata"] or {}).get("txMetadata") == STREAM_METADATA}
+        self.commit_times[batch.last_id] = [commit.to_native() for commit in commits.values()]
+        return batch
+
+    async def _commit_cursor(self, cursor):
+        await super()._commit_cursor(cursor)
+        commits = self.commit_times.pop(cursor, [])
+        now = datetime.now(timezone.utc)
+        self.latencies.extend((now - commit).total_seconds() for commit in commits)
+
+
+def graph_stats(conn, database):
+    with conn.session(database) as session:
+        return session.run(GRAPH_STATS_QUERY).single().data()
+
+
+def facts(stats):
+    return stats["labels"] + stats["node_properties"] + stats["relationships"] + stats["relationship_properties"]
+
+
+def distribution(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {"count": len(ordered), "mean": statistics.fmean(ordered), "max": ordered[-1],
+            **{f"p{q}": ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] for q in (50, 95, 99)}}
+
+
+class Benchmark:
+    """Set up the benchmark databases and run the benchmarks against them."""
+    def __init__(self, args):
+        self.args = args
+        self.ontology_shape = shape_from_args(args)
+        self.words = vocabulary(self.ontology_shape)
+        self.main_conn = Neo4jConnection(neoowl_server.NEO4J_URI, neoowl_server.NEO4J_USERNAME,
+                                         neoowl_server.NEO4J_PASSWORD)
+        self.ontology_conn = Neo4jConnection(neoowl_server.NEO4J_URI_ONTOLOGY, neoowl_server.NEO4J_USERNAME_ONTOLOGY,
+                                             neoowl_server.NEO4J_PASSWORD_ONTOLOGY)
+
+    def close(self):
+        self.main_conn.close()
+        self.ontology_conn.close()
+
+    def load_ontology(self):
+        nodes, edges = generate_ontology(self.ontology_shape)
+        delete_all(self.ontology_conn, self.args.ontology_database)
+        load_ontology(self.ontology_conn, self.args.ontology_database, nodes, edges, self.args.batch_size)
+
+    def load_data(self, nodes):
+        delete_all(self.main_conn, self.args.database)
+        load_data(self.main_conn, self.args.database, data_shape_from_args(self.args, nodes), self.words,
+                  self.args.batch_size)
+
+    def reasoner(self):
+        return NeoOWLReasoner(self.main_conn, self.ontology_conn, workers=self.args.workers,
+                              metrics=RuleMetrics(profile=self.args.profile), index_timeout=300,
+                              database=self.args.database, ontology_database=self.args.ontology_database)
+
+    def config(self):
+        return {"ontology": asdict(self.ontology_shape),
+                "data": {key: value for key, value in asdict(data_shape_from_args(self.args, 0)).items()
+                         if key != "nodes"},
+                "workers": self.args.workers, "batch_size": self.args.batch_size}
+
+    def inference(self, nodes, mode):
+        """Run inference to convergence over a freshly loaded graph and return its measurements."""
+        self.load_data(nodes)
+        reasoner = self.reasoner()
+        before = graph_stats(self.main_conn, self.args.database)
+        started = time.perf_counter()
+        if mode == "inmemory":
+            from inmemory_engine import InMemoryEngine
+            InMemoryEngine(reasoner, self.args.database).infer_to_convergence()
+        elif mode == "snapshot":
+            from snapshot_engine import SnapshotEngine
+            SnapshotEngine(reasoner, self.args.database).infer_to_convergence()
+        else:
+            reasoner.infer_to_convergence(semi_naive=mode == "semi-naive", stratified=mode == "stratified")
+        wall_seconds = time.perf_counter() - started
+        after = graph_stats(self.main_conn, self.args.database)
+        run = reasoner.metrics.last_run
+        writes, inferred = sum(run[counter] for counter in COUNTERS), facts(after) - facts(before)
+        return {"benchmark": "inference", "mode": mode, "nodes": nodes, "wall_seconds": wall_seconds,
+                "iterations": run["iterations"], "rule_runs": run["runs"], "writes": writes, "facts": inferred,
+                "write_amplification": writes / inferred if inferred > 0 else None,
+                "graph": {"before": before, "after": after}, "rules": run["rules"]}
+
+    async def _write_stream(self, conn, nodes, stop_at):
+        """Add a person acting in a popular movie `rate` times per second until `stop_at`."""
+        shape = data_shape_from_args(self.args, nodes)
+        rng = random.Random(f"{shape.seed}:stream")
+        loop = asyncio.get_running_loop()
+        interval, next_write, written = 1 / self.args.rate, loop.time(), 0
+        while loop.time() < stop_at:
+            uid = shape.persons + written
+            movie = min(int(shape.movies * rng.random() ** shape.popularity_skew), shape.movies - 1)
+            async with conn.session(self.args.database) as session:
+                result = await session.run(Query(f"""CREATE (p:{PERSON}:{rng.choice(self.words.person_labels)}
+                        {{uid: $uid, name: $name, born: 1970}})
+                    WITH p
+                    MATCH (m:{MOVIE} {{uid: $movie}})
+                    CREATE (p)-[:{rng.choice(self.words.acting_types)}]->(m)""", metadata=STREAM_METADATA),
+                                           uid=uid, name=f"Person {uid}", movie=movie)
+                await result.consume()
+            written += 1
+            next_write += interval
+            await asyncio.sleep(max(next_write - loop.time(), 0))
+        return written
+
+    async def _cdc(self, nodes):
+        reasoner = self.reasoner()
+        reasoner.infer_to_convergence()
+        reasoner.metrics = RuleMetrics(profile=self.args.profile)
+        conn = AsyncNeo4jConnection(neoowl_server.NEO4J_URI, neoowl_server.NEO4J_USERNAME,
+                                    neoowl_server.NEO4J_PASSWORD)
+        try:
+            service = LatencyProbe(conn, reasoner, poll_interval=self.args.poll_interval,
+                                   incremental=not self.args.full, max_batch_wait=self.args.max_batch_wait,
+                                   max_batch_size=self.args.max_batch_size)
+            server = asyncio.create_task(service.run())
+            while service.cursor is None and not server.done():
+                await asyncio.sleep(0.1)
+            loop = asyncio.get_running_loop()
+            written = await self._write_stream(conn, nodes, loop.time() + self.args.duration)
+            drain_until = loop.time() + self.args.drain_timeout
+            while len(service.latencies) < written and loop.time() < drain_until:
+                await asyncio.sleep(0.1)
+            service.stop()
+            await server
+        finally:
+            await conn.close()
+        if len(service.latencies) < written:
+            logger.warning(f"{written - len(service.latencies)} writes were not reasoned over "
+                           f"within {self.args.drain_timeout} seconds")
+        return {"benchmark": "cdc", "mode": "full" if self.args.full else "incremental", "nodes": nodes,
+                "rate": self.args.rate, "duration": self.args.duration, "transactions": written,
+                "latency_seconds": distribution(service.latencies),
+                "batches": service.metrics["batches_processed"], "events": service.metrics["events_processed"],
+                "rules": reasoner.metrics.rules()}
+
+    def cdc(self, nodes):
+        """Stream writes into a converged graph through the CDC server and return their latencies."""
+        self.load_data(nodes)
+        return asyncio.run(self._cdc(nodes))
+
+
+def metric(run):
+    """The figure a regression is judged on: wall time for inference, p95 latency for CDC."""
+    if run["benchmark"] == "cdc":
+        return (run["latency_seconds"] or {}).get("p95")
+    return run["wall_seconds"]
+
+
+def compare(baseline, current, tolerance):
+    """Return a description of every run of `current` slower than the same run of `baseline` by over `tolerance`."""
+    def key(run):
+        return run["benchmark"], run["mode"], run["nodes"]
+
+    previous = {key(run): metric(run) for run in baseline["runs"]}
+    regressions = []
+    for run in current["runs"]:
+        before, after = previous.get(key(run)), metric(run)
+        if before and after is not None and after > before * (1 + tolerance):
+            regressions.append(f"{' / '.join(map(str, key(run)))}: {before:.3f}s -> {after:.3f}s "
+                               f"(+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark NeoOWL inference and CDC latency on synthetic graphs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000],
+                        help="Graph sizes to benchmark, in nodes")
+    add_data_arguments(common)
+    add_shape_arguments(common)
+    common.add_argument("--database", default=NEOOWL_BENCH_DB_NAME,
+                        help="Data database, wiped by the benchmark")
+    common.add_argument("--ontology-database", default=NEOOWL_BENCH_ONTOLOGY_DB_NAME,
+                        help="Ontology database, wiped by the benchmark")
+    common.add_argument("--workers", type=int, default=1, help="Sessions used to run rules concurrently")
+    common.add_argument("--batch-size", type=int, default=10000, help="Rows per UNWIND statement when loading")
+    common.add_argument("--profile", action="store_true", help="Run rules under PROFILE to record database hits")
+    common.add_argument("--output", help="Write the results to this JSON file instead of stdout")
+
+    inference = commands.add_parser("inference", parents=[common], help="Time inference to convergence")
+    inference.add_argument("--modes", nargs="+", choices=MODES, default=["naive"],
+                           help="Evaluation strategies to benchmark")
+
+    cdc = commands.add_parser("cdc", parents=[common], help="Measure CDC latency under a synthetic write stream")
+    cdc.add_argument("--rate", type=float, default=10, help="Write transactions per second")
+    cdc.add_argument("--duration", type=float, default=30, help="Seconds of writes")
+    cdc.add_argument("--drain-timeout", type=float, default=60,
+                     help="Seconds to wait for the server to catch up after the last write")
+    cdc.add_argument("--poll-interval", type=float, default=0.5, help="CDC poll interval in seconds")
+    cdc.add_argument("--max-batch-wait", type=float, default=1.0, help="Seconds to coalesce events into a batch")
+    cdc.add_argument("--max-batch-size", type=int, default=10000, help="Maximum events per batch")
+    cdc.add_argument("--full", action="store_true", help="Re-run every rule per batch instead of incrementally")
+
+    comparison = commands.add_parser("compare", help="Flag regressions between two result files")
+    comparison.add_argument("baseline", help="Earlier results")
+    comparison.add_argument("current", help="Results to check")
+    comparison.add_argument("--tolerance", type=float, default=0.2,
+                            help="Relative slowdown tolerated before a run counts as a regression")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "compare":
+        with open(args.baseline) as baseline, open(args.current) as current:
+            regressions = compare(json.load(baseline), json.load(current), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
+
+    benchmark = Benchmark(args)
+    results = {"started_at": datetime.now(timezone.utc).isoformat(), "config": benchmark.config(), "runs": []}
+    try:
+        benchmark.load_ontology()
+        for nodes in args.nodes:
+            if args.command == "inference":
+                for mode in args.modes:
+                    logger.info(f"Benchmarking {mode} inference on {nodes} nodes")
+                    results["runs"].append(benchmark.inference(nodes, mode))
+            else:
+                logger.info(f"Benchmarking CDC latency on {nodes} nodes at {args.rate} writes/s")
+                results["runs"].append(benchmark.cdc(nodes))
+    finally:
+        benchmark.close()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        logger.info(f"Wrote results to {args.output}")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Transaction batching for the generated CALL { } IN TRANSACTIONS rules."""
+import json
+import math
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchSettings:
+    """How one kind of rule batches its inner writes."""
+    batch_size: int = 100
+    concurrent: bool = False
+    concurrency: Optional[int] = None
+
+    def clause(self):
+        """The `IN ... TRANSACTIONS` clause; the batch size is bound per run as $neoowl_batch_size."""
+        if self.concurrent:
+            level = f"{self.concurrency} " if self.concurrency else ""
+            return f"IN {level}CONCURRENT TRANSACTIONS OF $neoowl_batch_size ROWS"
+        return "IN TRANSACTIONS OF $neoowl_batch_size ROWS"
+
+
+DEFAULT_BATCH_SETTINGS = {
+    "pattern_label": BatchSettings(),
+    "pattern_relationship": BatchSettings(),
+    "sco": BatchSettings(concurrent=True),
+    "implies": BatchSettings(),
+    "symmetric": BatchSettings(),
+    "pattern_property": BatchSettings(concurrent=True),
+}
+
+
+def load_batch_settings(path=None):
+    """Return per-kind batch settings, overridden by a JSON file of {kind: {field: value}}."""
+    settings = {kind: BatchSettings(**asdict(value)) for kind, value in DEFAULT_BATCH_SETTINGS.items()}
+    if path:
+        with open(path, "r") as file:
+            overrides = json.load(file)
+        for kind, values in overrides.items():
+            settings[kind] = BatchSettings(**{**asdict(settings.get(kind, BatchSettings())), **values})
+        logger.info(f"Loaded batch settings for {sorted(overrides)} from {path}")
+    return settings
+
+
+class BatchSizer:
+    """Choose the batch size of every rule run, optionally tuning it from earlier runs.
+
+    In adaptive mode each rule's batch size is rescaled after every run so that
+    one inner transaction takes about `target_seconds`, using the server-side
+    run time and the number of rows the rule drove. Changes are damped to at
+    most a factor of four per run and clamped to [min_size, max_size]. A
+    failed run shrinks the batch size by that factor of four.
+    """
+    def __init__(self, settings, adaptive=False, target_seconds=0.5, min_size=10, max_size=100000):
+        self.settings = settings
+        self.adaptive = adaptive
+        self.target_seconds = target_seconds
+        self.min_size = min_size
+        self.max_size = max_size
+        self.sizes = {}
+
+    def batch_size(self, rule):
+        return self.sizes.get(id(rule), self.settings[rule.kind].batch_size)
+
+    def record(self, rule, rows, summary):
+        """Feed back the outcome of one run of `rule`."""
+        if not self.adaptive or not rows:
+            return
+        size = self.batch_size(rule)
+        elapsed = ((summary.result_available_after or 0) + (summary.result_consumed_after or 0)) / 1000
+        commits = math.ceil(rows / size)
+        per_commit = elapsed / commits
+        if commits == 1 and per_commit < self.target_seconds:
+            return  # a single short transaction says nothing about larger batches
+        ratio = 4.0 if per_commit <= 0 else math.sqrt(self.target_seconds / per_commit)
+        new_size = int(min(max(size * min(max(ratio, 0.25), 4.0), self.min_size), self.max_size))
+        if new_size != size:
+            logger.debug(f"Batch size for {rule.kind} rule: {size} -> {new_size} "
+                         f"({commits} commits, {per_commit:.3f}s each)")
+        self.sizes[id(rule)] = new_size
+
+    def record_failure(self, rule):
+        """Feed back a failed run of `rule`, which may have failed for holding too much in one transaction."""
+        if not self.adaptive:
+            return
+        size = self.batch_size(rule)
+        self.sizes[id(rule)] = int(min(max(size * 0.25, self.min_size), self.max_size))
+        logger.debug(f"Batch size for {rule.kind} rule after a failed run: {size} -> {self.sizes[id(rule)]}")
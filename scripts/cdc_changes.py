@@ -0,0 +1,90 @@
+"""Change sets extracted from Neo4j CDC events."""
+from dataclasses import dataclass, field
+from typing import Set
+
+from rule_dependencies import label, node_property, relationship_type
+
+# Transaction metadata of the writes a snapshot run applies (see snapshot_engine),
+# which already hold every consequence of what they write
+SNAPSHOT_METADATA = {"app": "neoowl-snapshot"}
+
+
+def is_snapshot_write(record):
+    """Whether a db.cdc.query record was written by a snapshot run."""
+    return ((record["metadata"] or {}).get("txMetadata") or {}) == SNAPSHOT_METADATA
+
+
+@dataclass
+class ChangeSet:
+    """Element ids touched by a batch of changes, and the tokens (labels, types, properties) they changed.
+
+    `full_tokens` are tokens known to have changed without knowing where,
+    e.g. the output of a rule that had to run over the whole graph.
+    `removed_tokens` are labels and relationship types removed from the
+    `node_ids`; deletions never enable new inferences, but they can lengthen
+    path distances (see path_distances). `removed_facts` are the removed
+    labels, relationships and overwritten properties as (token, element ids)
+    pairs, whose consequences are retracted (see retraction).
+    """
+    node_ids: Set[str] = field(default_factory=set)
+    relationship_ids: Set[str] = field(default_factory=set)
+    tokens: Set[tuple] = field(default_factory=set)
+    full_tokens: Set[tuple] = field(default_factory=set)
+    removed_tokens: Set[tuple] = field(default_factory=set)
+    removed_facts: Set[tuple] = field(default_factory=set)
+
+    def __bool__(self):
+        return bool(self.tokens or self.full_tokens or self.removed_tokens)
+
+    def update(self, other):
+        self.node_ids |= other.node_ids
+        self.relationship_ids |= other.relationship_ids
+        self.tokens |= other.tokens
+        self.full_tokens |= other.full_tokens
+        self.removed_tokens |= other.removed_tokens
+        self.removed_facts |= other.removed_facts
+
+    def _remove(self, token, element_ids):
+        self.removed_tokens.add(token)
+        self.removed_facts.add((token, element_ids))
+
+    def add_event(self, event):
+        """Record one CDC event (the `event` map of a db.cdc.query record)."""
+        before = (event.get("state") or {}).get("before") or {}
+        after = (event.get("state") or {}).get("after") or {}
+        if event.get("eventType") == "n":
+            element_ids = (event["elementId"],)
+        else:
+            element_ids = (event["start"]["elementId"], event["end"]["elementId"])
+        self.node_ids.update(element_ids)
+        if event.get("operation") == "d":
+            if event.get("eventType") == "n":
+                for name in before.get("labels") or event.get("labels") or []:
+                    self._remove(label(name), element_ids)
+            else:
+                self._remove(relationship_type(event["type"]), element_ids)
+            return
+        before_properties = before.get("properties") or {}
+        after_properties = after.get("properties") or {}
+        changed_keys = {key for key in set(before_properties) | set(after_properties)
+                        if before_properties.get(key) != after_properties.get(key)}
+        self.tokens.update(node_property(key) for key in changed_keys)
+        for key in changed_keys:
+            if before_properties.get(key) is not None:
+                self._remove(node_property(key), element_ids)
+        if event.get("eventType") == "n":
+            labels = set(after.get("labels") or event.get("labels") or [])
+            self.tokens.update(label(name) for name in labels - set(before.get("labels") or []))
+            for name in set(before.get("labels") or []) - labels:
+                self._remove(label(name), element_ids)
+        elif event.get("eventType") == "r":
+            self.relationship_ids.add(event["elementId"])
+            if event.get("operation") == "c":
+                self.tokens.add(relationship_type(event["type"]))
+
+    @classmethod
+    def from_cdc_records(cls, records):
+        changes = cls()
+        for record in records:
+            changes.add_event(record["event"])
+        return changes
@@ -0,0 +1,61 @@
+"""Persistent CDC cursor checkpoints, so the server can resume where it stopped."""
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Services of several databases can share one checkpoint file
+_file_lock = threading.Lock()
+
+
+class FileCheckpoint:
+    """Store the last processed change id of each database in a local JSON file."""
+    def __init__(self, path, database):
+        self.path = path
+        self.database = database
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def load(self):
+        return self._read().get(self.database)
+
+    def save(self, cursor):
+        with _file_lock:
+            checkpoints = self._read()
+            checkpoints[self.database] = cursor
+            # Write then rename, so a crash never leaves a truncated checkpoint behind
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w") as file:
+                json.dump(checkpoints, file)
+            os.replace(temporary, self.path)
+
+
+class DatabaseCheckpoint:
+    """Store the last processed change id of a database on a node.
+
+    The node lives in another database than the monitored one (the ontology
+    database by default), otherwise every checkpoint would itself show up as
+    a CDC change.
+    """
+    def __init__(self, conn, checkpoint_database, database):
+        self.conn = conn
+        self.checkpoint_database = checkpoint_database
+        self.database = database
+
+    def load(self):
+        with self.conn.session(self.checkpoint_database) as session:
+            record = session.run("MATCH (c:NeoOWLCheckpoint {database: $database}) RETURN c.cursor AS cursor",
+                                 database=self.database).single()
+        return record["cursor"] if record else None
+
+    def save(self, cursor):
+        with self.conn.session(self.checkpoint_database) as session:
+            session.run("MERGE (c:NeoOWLCheckpoint {database: $database}) SET c.cursor = $cursor",
+                        database=self.database, cursor=cursor).consume()
@@ -0,0 +1,71 @@
+"""Shared Neo4j connections: pooled drivers tuned from the environment and transient-error retries."""
+import os
+import time
+import logging
+from neo4j import AsyncGraphDatabase, GraphDatabase
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Driver tuning, shared by every database a process reasons over
+NEO4J_MAX_CONNECTION_POOL_SIZE = int(os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE", "100"))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "60"))
+NEO4J_FETCH_SIZE = int(os.getenv("NEO4J_FETCH_SIZE", "1000"))
+NEO4J_MAX_RETRIES = int(os.getenv("NEO4J_MAX_RETRIES", "3"))
+NEO4J_RETRY_DELAY = float(os.getenv("NEO4J_RETRY_DELAY", "0.5"))
+
+# Failures a later attempt of the same statement can get past
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+
+def driver_settings():
+    return dict(max_connection_pool_size=NEO4J_MAX_CONNECTION_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_CONNECTION_ACQUISITION_TIMEOUT)
+
+
+def retry(work, max_retries=NEO4J_MAX_RETRIES, retry_delay=NEO4J_RETRY_DELAY, description="statement"):
+    """Return `work()`, retrying it with exponential backoff when it fails transiently.
+
+    Managed transactions (execute_read / execute_write) are retried by the
+    driver; this is for auto-commit statements such as the rules, whose
+    `CALL { } IN TRANSACTIONS` cannot run in a managed transaction. A rule
+    only writes missing facts, so running it again after a partial commit
+    just finishes the job.
+    """
+    attempt = 0
+    while True:
+        try:
+            return work()
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            logger.warning(f"Transient error running {description} (attempt {attempt}): {e}")
+            time.sleep(retry_delay * 2 ** (attempt - 1))
+
+
+class Neo4jConnection:
+    """Manage Neo4j connections: one pooled driver, shared by every session and database."""
+    def __init__(self, uri, username, password):
+        self.driver = GraphDatabase.driver(uri, auth=(username, password), **driver_settings())
+
+    def close(self):
+        self.driver.close()
+
+    def session(self, database):
+        return self.driver.session(database=database, fetch_size=NEO4J_FETCH_SIZE)
+
+
+class AsyncNeo4jConnection:
+    """Manage async Neo4j connections: one pooled driver, shared by every session and database."""
+    def __init__(self, uri, username, password):
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(username, password), **driver_settings())
+
+    async def close(self):
+        await self.driver.close()
+
+    def session(self, database):
+        return self.driver.session(database=database, fetch_size=NEO4J_FETCH_SIZE)
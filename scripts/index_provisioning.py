@@ -0,0 +1,111 @@
+"""Create the indexes compiled rules can seek on, so that they do not fall back to full scans."""
+import re
+import logging
+from collections import defaultdict
+
+from rule_dependencies import property_filters
+
+logger = logging.getLogger(__name__)
+
+# Token lookup indexes backing every label and relationship type scan
+LOOKUP_INDEXES = {
+    "node": "CREATE LOOKUP INDEX neoowl_node_labels IF NOT EXISTS FOR (n) ON EACH labels(n)",
+    "relationship": "CREATE LOOKUP INDEX neoowl_relationship_types IF NOT EXISTS FOR ()-[r]-() ON EACH type(r)",
+}
+SHOW_INDEXES_QUERY = """SHOW INDEXES YIELD name, type, entityType, labelsOrTypes, properties, state
+RETURN name, type, entityType, labelsOrTypes, properties, state"""
+
+
+def _describe(rule):
+    return f"{rule.kind} rule from {rule.source}"
+
+
+def _quote(name):
+    return f"`{name.replace('`', '``')}`"
+
+
+def index_requirements(rules, ignored_properties=()):
+    """Work out the property indexes `rules` can seek on.
+
+    Returns the (entity, label or type, property) indexes mapped to the
+    positions of the rules using them, and the position of every rule with
+    filters no index can serve (elements without a label or type) mapped to
+    those filters.
+    """
+    required, unindexable = defaultdict(set), defaultdict(set)
+    for i, rule in enumerate(rules):
+        queries = {rule.query, rule.seminaive_query, rule.delta_query, rule.anchored_query} - {None}
+        for entity, tokens, key in {f for query in queries for f in property_filters(query)}:
+            if key in ignored_properties:
+                continue
+            if not tokens:
+                unindexable[i].add(f"{entity} property {key} without label or type")
+            for token in tokens:
+                required[(entity, token, key)].add(i)
+    return required, unindexable
+
+
+def existing_indexes(session):
+    """Map (entity, label or type, property) and ("lookup", entity) keys to the state of the index serving them."""
+    indexes = {}
+    for record in session.run(SHOW_INDEXES_QUERY):
+        entity = record["entityType"].lower()
+        if record["type"] == "LOOKUP":
+            indexes[("lookup", entity)] = record["state"]
+        elif record["type"] == "RANGE" and record["labelsOrTypes"] and record["properties"]:
+            # A composite index also serves seeks on its first property
+            for token in record["labelsOrTypes"]:
+                key = (entity, token, record["properties"][0])
+                if indexes.get(key) != "ONLINE":
+                    indexes[key] = record["state"]
+    return indexes
+
+
+def index_statement(entity, token, key):
+    name = re.sub(r"[^A-Za-z0-9_]", "_", f"neoowl_{token}_{key}")
+    pattern = f"(n:{_quote(token)})" if entity == "node" else f"()-[n:{_quote(token)}]-()"
+    return f"CREATE INDEX {name} IF NOT EXISTS FOR {pattern} ON (n.{_quote(key)})"
+
+
+def provision_indexes(conn, database, rules, timeout=300, ignored_properties=()):
+    """Create the missing lookup and property indexes of `rules` and wait for them to come online.
+
+    Rules that will still scan (an index that could not be created or did not
+    come online in `timeout` seconds, or a filter on an element without label
+    or type) are logged, and returned as {rule description: reasons}.
+    """
+    required, unindexable = index_requirements(rules, ignored_properties)
+    with conn.session(database) as session:
+        indexes = existing_indexes(session)
+        missing = [(("lookup", entity), statement) for entity, statement in LOOKUP_INDEXES.items()
+                   if ("lookup", entity) not in indexes]
+        missing += [(key, index_statement(*key)) for key in required if key not in indexes]
+        for key, statement in missing:
+            try:
+                session.run(statement).consume()
+                logger.info(f"Created index: {statement}")
+            except Exception as e:
+                logger.warning(f"Could not create index for {key}: {e}")
+        if missing:
+            try:
+                session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+            except Exception as e:
+                logger.warning(f"Indexes still populating after {timeout}s: {e}")
+            indexes = existing_indexes(session)
+
+    scans = defaultdict(set, unindexable)
+    for entity, token_kind in (("node", "label"), ("relationship", "type")):
+        if indexes.get(("lookup", entity)) != "ONLINE":
+            for i, rule in enumerate(rules):
+                if any(kind == token_kind for kind, _ in rule.reads):
+                    scans[i].add(f"no online {entity} lookup index")
+    for (entity, token, key), users in required.items():
+        if indexes.get((entity, token, key)) != "ONLINE":
+            for i in users:
+                scans[i].add(f"no online index on {token}.{key}")
+    report = {_describe(rules[i]): sorted(reasons) for i, reasons in sorted(scans.items())}
+    for rule, reasons in report.items():
+        logger.warning(f"{rule} will fall back to full scans: {', '.join(reasons)}")
+    logger.info(f"{len(required)} property indexes needed by {len(rules)} rules, {len(missing)} created, "
+                f"{len(report)} rules still scanning")
+    return report
@@ -1,7 +1,25 @@
 import os
 import logging
-from neo4j import GraphDatabase
+import argparse
+from dataclasses import asdict, dataclass, field
+from typing import FrozenSet, Optional
+from neo4j import RoutingControl
 from dotenv import load_dotenv
+from connections import Neo4jConnection
+from ontology_closure import hierarchy_closure, split_hierarchy
+from batching import BatchSizer, load_batch_settings
+from rule_cache import RuleCache, fingerprint
+from query_rewriter import VIRTUAL_KINDS, QueryRewriter
+from index_provisioning import provision_indexes
+from path_distances import PathDistances, ReachabilityRule, reachability_rule
+from retraction import (INFERRED_LABELS_PROPERTY, INFERRED_PROPERTY, justification, label_dependents_query,
+                        label_support_query, mark_labels, pattern_reach, relationship_dependents_query,
+                        relationship_support_query)
+from rule_planner import RulePlanner
+from rule_optimizer import group_records, partition_domain, partitioned_query, probe_query
+from rule_executor import ParallelRuleExecutor, run_rule
+from rule_metrics import RuleMetrics, log_to_file
+from rule_dependencies import anchor_variables, label, node_property, pattern_tokens, relationship_type, stratify
 
 # Configure logging
 logging.basicConfig(
@@ -24,161 +42,621 @@ NEO4J_USERNAME_ONTOLOGY = os.getenv("NEO4J_USERNAME_ONTOLOGY", NEO4J_USERNAME)
 NEO4J_PASSWORD_ONTOLOGY = os.getenv("NEO4J_PASSWORD_ONTOLOGY", NEO4J_PASSWORD)
 NEO4J_ONTOLOGY_DB_NAME = os.getenv("NEO4J_ONTOLOGY_DB_NAME", "movie_ontology")
 
-class Neo4jConnection:
-    """Manage Neo4j connections."""
-    def __init__(self, uri, username, password):
-        self.driver = GraphDatabase.driver(uri, auth=(username, password))
+# Semi-naive evaluation markers. Nodes touched in the previous iteration carry
+# DELTA_LABEL, nodes touched in the current one carry NEXT_DELTA_LABEL, and
+# inferred relationships record the iteration that created them.
+DELTA_LABEL = "_NeoOWLDelta"
+NEXT_DELTA_LABEL = "_NeoOWLDeltaNext"
+DELTA_PROPERTY = "_neoowl_iteration"
 
-    def close(self):
-        self.driver.close()
+# The whole ontology in one round trip, one list of records per section
+ONTOLOGY_QUERY = """CALL () {
+    MATCH (mdl:PatternDefinedLabel)
+    RETURN collect({name: mdl.name, pattern: mdl.pattern, classElementVariable: mdl.classElementVariable}) AS pattern_labels
+}
+CALL () {
+    MATCH (mdr:PatternDefinedRelationship)
+    RETURN collect({name: mdr.name, pattern: mdr.pattern, sourceElementVariable: mdr.sourceElementVariable, targetElementVariable: mdr.targetElementVariable}) AS pattern_relationships
+}
+CALL () {
+    MATCH (a)-[e:SCO|IMPLIES|EQUIVALENT]->(b)
+    RETURN collect({edge: type(e), is_relationship: a:Relationship, a: a.name, b: b.name}) AS hierarchy
+}
+CALL () {
+    MATCH (r:Relationship:Symmetric)
+    RETURN collect({sim_rel: r.name}) AS symmetric
+}
+CALL () {
+    MATCH (n:Label)-[:HAS_PROPERTY]->(qdp:PatternDefinedNodeProperty)
+    RETURN collect({label: n.name, property_name: qdp.name, pattern: qdp.pattern, variable: qdp.propertyOwnerVariable, val_variable: qdp.valueVariable}) AS pattern_properties
+}
+RETURN pattern_labels, pattern_relationships, hierarchy, symmetric, pattern_properties"""
 
-    def session(self, database):
-        return self.driver.session(database=database)
+# Ontology sections, in rule order, and the kinds of rule compiled from each
+RULE_SECTIONS = {
+    "pattern_labels": ("pattern_label",),
+    "pattern_relationships": ("pattern_relationship",),
+    "hierarchy": ("sco", "implies"),
+    "symmetric": ("symmetric",),
+    "pattern_properties": ("pattern_property",),
+}
+
+@dataclass
+class Rule:
+    """A compiled inference rule in its naive, semi-naive (full), delta-driven and id-anchored forms.
+
+    The anchored form only looks at the elements whose ids are passed as
+    $neoowl_node_ids / $neoowl_relationship_ids, writes in a single transaction,
+    and returns one (relationship, nodes) row per fact it created. `source`
+    names the ontology node the rule was compiled from. A path-distance
+    property rule carries its `reachability` (the ReachabilityRule fields) and
+    is run as a multi-source BFS (see path_distances) instead of its query.
+    Label and relationship rules record the provenance of what they infer and
+    carry the `dependents_query` and `support_query` of their retraction (see
+    retraction). A rule with a `partition_pattern` can be split by the
+    `partition_variable` elements that pattern enumerates, each partition
+    running on its own session.
+    """
+    kind: str
+    query: str
+    seminaive_query: str
+    delta_query: Optional[str] = None
+    anchored_query: Optional[str] = None
+    reads: FrozenSet[tuple] = field(default_factory=frozenset)
+    writes: FrozenSet[tuple] = field(default_factory=frozenset)
+    source: Optional[str] = None
+    reachability: Optional[dict] = None
+    dependents_query: Optional[str] = None
+    support_query: Optional[str] = None
+    partition_variable: Optional[str] = None
+    partition_pattern: Optional[str] = None
+
+def _mark_created(rel_var, start_var):
+    return f"{rel_var}.{DELTA_PROPERTY} = $neoowl_iteration, {start_var}:{NEXT_DELTA_LABEL}"
+
+def _delta_rel_filter(rel_var):
+    return f" WHERE {rel_var}.{DELTA_PROPERTY} = $neoowl_previous"
+
+def _missing_relationships(start_var, end_var, rel_types):
+    """A predicate holding when any of the `rel_types` relationships from start to end is missing."""
+    return f"NOT ({' AND '.join(f'({start_var})-[:{rel_type}]->({end_var})' for rel_type in rel_types)})"
+
+def _merges(start_var, end_var, rel_types, justified_by, mark=False):
+    """MERGE clauses for one relationship of each type, recording `justified_by` and marked as delta if `mark`."""
+    return "\n                        ".join(
+        f"MERGE ({start_var})-[inferred{i}:{rel_type}]->({end_var})"
+        f"\n                        ON CREATE SET inferred{i}.{INFERRED_PROPERTY} = {justified_by}"
+        + (f", {_mark_created(f'inferred{i}', start_var)}" if mark else "")
+        for i, rel_type in enumerate(rel_types))
+
+def _union_all(queries):
+    """Chain anchored queries with UNION ALL, or None if any of them is missing."""
+    queries = list(queries)
+    if not all(queries):
+        return None
+    return "\n                    UNION ALL\n                    ".join(queries)
+
+def _anchored_match(pattern, returns):
+    """A subquery returning `returns` for every match of `pattern` that binds a changed node."""
+    anchored_pattern, variables = anchor_variables(pattern)
+    if not variables:
+        return None
+    branches = "\n                      UNION\n".join(
+        f"""                        MATCH ({variable}) WHERE elementId({variable}) IN $neoowl_node_ids
+                        MATCH {anchored_pattern}
+                        RETURN {returns}""" for variable in variables)
+    return f"""CALL () {{
+{branches}
+                    }}"""
 
 class NeoOWLReasoner:
-    """Forward-chaining reasoner for NeoOWL."""
-    def __init__(self, main_conn, ontology_conn):
+    """Forward-chaining reasoner for NeoOWL.
+
+    Rules are compiled per ontology section. With a `rule_cache` directory,
+    each section's rules are cached on disk under a fingerprint of the section
+    and the batch settings it was compiled with, so a restart on an unchanged
+    ontology only costs the ontology query. Every rule run is recorded in
+    `metrics`.
+
+    Rule kinds listed in `virtual` (see query_rewriter.VIRTUAL_KINDS) are not
+    materialized: queries are expected to go through a QueryRewriter instead,
+    and the pattern-defined rules are rewritten the same way so that they
+    still see those facts.
+
+    With an `index_timeout` (seconds), the lookup and property indexes new
+    rules can seek on are created as they are compiled, and waited for.
+    With `probe_rules`, every full rule run is preceded by a read-only probe
+    and skipped when there is nothing left for it to write. With several
+    workers and a `partition_size`, a rule whose driving match spans more
+    elements than that is split into element id partitions of that size,
+    run concurrently.
+
+    With `plan_rules`, new rules are EXPLAINed and every pass runs the rules
+    in dependency order, cheapest first (see rule_planner); rule timings are
+    kept next to the rule cache across restarts.
+
+    Rules run on `database` and the ontology is read from `ontology_database`
+    (NEO4J_DB_NAME and NEO4J_ONTOLOGY_DB_NAME by default), so reasoners for
+    several databases can share the same connections.
+    """
+    def __init__(self, main_conn, ontology_conn, workers=1, batch_settings=None, adaptive_batching=False,
+                 rule_cache=None, metrics=None, virtual=(), index_timeout=None, probe_rules=True,
+                 partition_size=None, plan_rules=False, database=None, ontology_database=None):
         self.main_conn = main_conn
         self.ontology_conn = ontology_conn
-        self.rules = self._generate_all_rules()
-
-    def _generate_pattern_defined_label_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (mdl:PatternDefinedLabel)
-            RETURN mdl.name AS name, mdl.pattern AS pattern, mdl.classElementVariable AS classElementVariable""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH {record['pattern']}
-                    CALL ({record['classElementVariable']}) {{
-                        SET {record['classElementVariable']}:{record['name']}
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_pattern_defined_relationship_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (mdr:PatternDefinedRelationship)
-            RETURN mdr.name AS name, mdr.pattern AS pattern, mdr.sourceElementVariable AS sourceElementVariable, mdr.targetElementVariable AS targetElementVariable""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH {record['pattern']}
-                    CALL ({record['sourceElementVariable']}, {record['targetElementVariable']}) {{
-                        MERGE ({record['sourceElementVariable']})-[:{record['name']}]->({record['targetElementVariable']})
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_sco_label_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (narrower:Label)-[:SCO]->(broader:Label)
-            RETURN narrower.name AS narrower, broader.name AS broader""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n:{record['narrower']})
-                    CALL (n) {{
-                        SET n:{record['broader']}
-                    }} IN CONCURRENT TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_implies_relationship_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (narrower:Relationship)-[:IMPLIES]->(broader:Relationship)
-            RETURN narrower.name AS narrower, broader.name AS broader""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n)-[:{record['narrower']}]->(m)
-                    CALL (n, m) {{
-                        MERGE (n)-[:{record['broader']}]->(m)
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_equivalent_label_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (l1:Label)-[:EQUIVALENT]->(l2:Label)
-            RETURN l1.name AS l1, l2.name AS l2""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n:{record['l1']}|{record['l2']})
+        self.database = database or NEO4J_DB_NAME
+        self.ontology_database = ontology_database or NEO4J_ONTOLOGY_DB_NAME
+        self.executor = ParallelRuleExecutor(main_conn, self.database, max_workers=workers) if workers > 1 else None
+        self.batch_settings = batch_settings or load_batch_settings()
+        self.batch_sizer = BatchSizer(self.batch_settings, adaptive=adaptive_batching)
+        self.rule_cache = RuleCache(rule_cache, Rule) if rule_cache else None
+        self.metrics = metrics or RuleMetrics()
+        self.virtual = frozenset(virtual)
+        self.index_timeout = index_timeout
+        self.probe_rules = probe_rules
+        self.partition_size = partition_size if self.executor else None
+        self.planner = RulePlanner(os.path.join(rule_cache, f"rule_timings-{self.database}.json")
+                                   if rule_cache else None) if plan_rules else None
+        self.path_distances = {}
+        self.sections = {}
+        self.rules = []
+        self.update_rules()
+
+    def load_ontology(self):
+        """Fetch every ontology section, each sorted so that its fingerprint is stable."""
+        records, _, _ = self.ontology_conn.driver.execute_query(ONTOLOGY_QUERY, database_=self.ontology_database,
+                                                                routing_=RoutingControl.READ)
+        ontology = records[0].data()
+        return {section: sorted(ontology[section], key=lambda item: sorted(item.items(), key=str))
+                for section in RULE_SECTIONS}
+
+    def _generate_pattern_defined_label_rules(self, records):
+        """One rule per pattern, setting every label defined by it on the matches that miss one."""
+        transactions = self.batch_settings["pattern_label"].clause()
+        rules = []
+        for group in group_records(records, 'pattern', 'classElementVariable'):
+            pattern, variable = group[0]['pattern'], group[0]['classElementVariable']
+            names = [record['name'] for record in group]
+            labels = "".join(f":{name}" for name in names)
+            missing = f"NOT ({' AND '.join(f'{variable}:{name}' for name in names)})"
+            template = """MATCH {pattern}
+                    WITH DISTINCT {variable}
+                    WHERE {missing}
+                    CALL ({variable}) {{
+                        {mark}
+                        SET {variable}{labels}
+                    }} {transactions}
+                    RETURN count(*) AS rows"""
+            fields = dict(pattern=pattern, variable=variable, missing=missing, transactions=transactions,
+                          mark=mark_labels(variable, names))
+            rules.append(Rule(
+                kind="pattern_label",
+                query=template.format(labels=labels, **fields),
+                seminaive_query=template.format(labels=f"{labels}:{NEXT_DELTA_LABEL}", **fields),
+                anchored_query=self._anchored_pattern_label_rule(pattern, variable, names, missing),
+                reads=frozenset(pattern_tokens(pattern)),
+                writes=frozenset(label(name) for name in names),
+                source=",".join(names),
+                dependents_query=label_dependents_query(names, *pattern_reach(pattern)),
+                support_query=label_support_query(variable, f"EXISTS {{ MATCH {pattern} }}"),
+                partition_variable=variable,
+                partition_pattern=partition_domain(pattern, variable)))
+        return rules
+
+    def _anchored_pattern_label_rule(self, pattern, variable, names, missing):
+        match = _anchored_match(pattern, variable)
+        return match and f"""{match}
+                    WITH DISTINCT {variable} WHERE {missing}
+                    {mark_labels(variable, names)}
+                    SET {variable}{"".join(f":{name}" for name in names)}
+                    RETURN null AS relationship, [elementId({variable})] AS nodes"""
+
+    def _generate_pattern_defined_relationship_rules(self, records):
+        """One rule per pattern, merging every relationship defined by it between the matches that miss one."""
+        transactions = self.batch_settings["pattern_relationship"].clause()
+        rules = []
+        for group in group_records(records, 'pattern', 'sourceElementVariable', 'targetElementVariable'):
+            pattern = group[0]['pattern']
+            source, target = group[0]['sourceElementVariable'], group[0]['targetElementVariable']
+            names = [record['name'] for record in group]
+            template = """MATCH {pattern}
+                    WITH DISTINCT {source}, {target}
+                    WHERE {missing}
+                    CALL ({source}, {target}) {{
+                        {merges}
+                    }} {transactions}
+                    RETURN count(*) AS rows"""
+            fields = dict(pattern=pattern, source=source, target=target, transactions=transactions,
+                          missing=_missing_relationships(source, target, names))
+            justified_by = justification("pattern_relationship", ",".join(names))
+            rules.append(Rule(
+                kind="pattern_relationship",
+                query=template.format(merges=_merges(source, target, names, justified_by), **fields),
+                seminaive_query=template.format(merges=_merges(source, target, names, justified_by, mark=True),
+                                                **fields),
+                anchored_query=_union_all(self._anchored_pattern_relationship_rule(pattern, source, target, name,
+                                                                                   justified_by)
+                                          for name in names),
+                reads=frozenset(pattern_tokens(pattern)),
+                writes=frozenset(relationship_type(name) for name in names),
+                source=",".join(names),
+                dependents_query=relationship_dependents_query(names, *pattern_reach(pattern)),
+                support_query=relationship_support_query(source, target, f"EXISTS {{ MATCH {pattern} }}"),
+                partition_variable=source,
+                partition_pattern=partition_domain(pattern, source)))
+        return rules
+
+    def _anchored_pattern_relationship_rule(self, pattern, source, target, name, justified_by):
+        match = _anchored_match(pattern, f"{source}, {target}")
+        return match and f"""{match}
+                    WITH DISTINCT {source}, {target} WHERE NOT ({source})-[:{name}]->({target})
+                    CREATE ({source})-[inferred:{name}]->({target})
+                    SET inferred.{INFERRED_PROPERTY} = {justified_by}
+                    RETURN elementId(inferred) AS relationship, [elementId({source}), elementId({target})] AS nodes"""
+
+    def _generate_hierarchy_rules(self, records):
+        """Split the SCO, IMPLIES and EQUIVALENT edges by kind and close both hierarchies."""
+        hierarchy = split_hierarchy(records)
+        return self._generate_label_closure_rules(hierarchy) + self._generate_relationship_closure_rules(hierarchy)
+
+    def _generate_label_closure_rules(self, hierarchy):
+        """One rule per label setting all of its SCO ancestors and EQUIVALENT labels at once."""
+        closure = hierarchy_closure(hierarchy["label_edges"], hierarchy["label_equivalences"])
+        transactions = self.batch_settings["sco"].clause()
+        template = """MATCH (n{scope}:{narrower})
+                    WHERE NOT ({all_broader})
                     CALL (n) {{
-                        SET n:{record['l1']}:{record['l2']}
-                    }} IN CONCURRENT TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_equivalent_relationship_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (r1:Relationship)-[:EQUIVALENT]->(r2:Relationship)
-            RETURN r1.name AS r1, r2.name AS r2""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n)-[:{record['r1']}|{record['r2']}]->(m)
+                        {mark}
+                        SET n{broader}
+                    }} {transactions}
+                    RETURN count(*) AS rows"""
+        rules = []
+        for narrower, broader in sorted(closure.items()):
+            if not broader:
+                continue
+            labels = "".join(f":{label}" for label in sorted(broader))
+            fields = dict(narrower=narrower, transactions=transactions, mark=mark_labels('n', sorted(broader)),
+                          all_broader=" AND ".join(f"n:{label}" for label in sorted(broader)))
+            rules.append(Rule(
+                kind="sco",
+                query=template.format(scope="", broader=labels, **fields),
+                seminaive_query=template.format(scope="", broader=f"{labels}:{NEXT_DELTA_LABEL}", **fields),
+                delta_query=template.format(scope=f":{DELTA_LABEL}", broader=f"{labels}:{NEXT_DELTA_LABEL}",
+                                            **fields),
+                anchored_query=f"""MATCH (n:{narrower})
+                    WHERE elementId(n) IN $neoowl_node_ids AND NOT ({fields['all_broader']})
+                    {fields['mark']}
+                    SET n{labels}
+                    RETURN null AS relationship, [elementId(n)] AS nodes""",
+                reads=frozenset({label(narrower)}),
+                writes=frozenset(label(name) for name in broader),
+                source=narrower,
+                dependents_query=label_dependents_query(sorted(broader)),
+                support_query=label_support_query('n', f"n:{narrower}"),
+                partition_variable='n',
+                partition_pattern=f"(n:{narrower})"))
+        return rules
+
+    def _generate_relationship_closure_rules(self, hierarchy):
+        """One rule per relationship type merging all of its IMPLIES ancestors and EQUIVALENT types at once."""
+        closure = hierarchy_closure(hierarchy["relationship_edges"], hierarchy["relationship_equivalences"])
+        transactions = self.batch_settings["implies"].clause()
+        template = """MATCH (n{scope})-[r:{narrower}]->(m){delta_filter}
+                    WITH DISTINCT n, m
+                    WHERE {missing}
                     CALL (n, m) {{
-                        MERGE (n)-[:{record['r1']}]->(m)
-                        MERGE (n)-[:{record['r2']}]->(m)
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_symmetric_relationship_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (r:Relationship:Symmetric)
-            RETURN r.name AS sim_rel""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n)-[:{record['sim_rel']}]->(m)
+                        {merges}
+                    }} {transactions}
+                    RETURN count(*) AS rows"""
+        rules = []
+        for narrower, broader in sorted(closure.items()):
+            if not broader:
+                continue
+            fields = dict(narrower=narrower, transactions=transactions,
+                          missing=_missing_relationships('n', 'm', sorted(broader)))
+            justified_by = justification("implies", narrower)
+            rules.append(Rule(
+                kind="implies",
+                query=template.format(scope="", delta_filter="",
+                                      merges=_merges('n', 'm', sorted(broader), justified_by), **fields),
+                seminaive_query=template.format(scope="", delta_filter="",
+                                                merges=_merges('n', 'm', sorted(broader), justified_by, mark=True),
+                                                **fields),
+                delta_query=template.format(scope=f":{DELTA_LABEL}", delta_filter=_delta_rel_filter('r'),
+                                            merges=_merges('n', 'm', sorted(broader), justified_by, mark=True),
+                                            **fields),
+                anchored_query=_union_all(
+                    f"""MATCH (n)-[r:{narrower}]->(m)
+                    WHERE elementId(r) IN $neoowl_relationship_ids
+                    WITH DISTINCT n, m WHERE NOT (n)-[:{rel_type}]->(m)
+                    CREATE (n)-[inferred:{rel_type}]->(m)
+                    SET inferred.{INFERRED_PROPERTY} = {justified_by}
+                    RETURN elementId(inferred) AS relationship, [elementId(n), elementId(m)] AS nodes"""
+                    for rel_type in sorted(broader)),
+                reads=frozenset({relationship_type(narrower)}),
+                writes=frozenset(relationship_type(name) for name in broader),
+                source=narrower,
+                dependents_query=relationship_dependents_query(sorted(broader)),
+                support_query=relationship_support_query('n', 'm', f"(n)-[:{narrower}]->(m)"),
+                partition_variable='n',
+                partition_pattern=f"(n)-[:{narrower}]->()"))
+        return rules
+
+    def _generate_symmetric_relationship_rules(self, records):
+        transactions = self.batch_settings["symmetric"].clause()
+        template = """MATCH (n{scope})-[r:{sim_rel}]->(m){delta_filter}
+                    WITH DISTINCT n, m
+                    WHERE NOT (m)-[:{sim_rel}]->(n)
                     CALL (n, m) {{
-                        MERGE (m)-[:{record['sim_rel']}]->(n)
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_pattern_defined_property_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (n:Label)-[:HAS_PROPERTY]->(qdp:PatternDefinedNodeProperty)
-            RETURN n.name AS label, qdp.name AS property_name, qdp.pattern AS pattern, qdp.propertyOwnerVariable AS variable, qdp.valueVariable AS val_variable""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH ({record['variable']}:{record['label']})
-                    CALL ({record['variable']}) {{
+                        {merges}
+                    }} {transactions}
+                    RETURN count(*) AS rows"""
+        rules = []
+        for record in records:
+            sim_rel = record['sim_rel']
+            justified_by = justification("symmetric", sim_rel)
+            rules.append(Rule(
+                kind="symmetric",
+                query=template.format(scope="", delta_filter="", transactions=transactions,
+                                      merges=_merges('m', 'n', [sim_rel], justified_by), **record),
+                seminaive_query=template.format(scope="", delta_filter="", transactions=transactions,
+                                                merges=_merges('m', 'n', [sim_rel], justified_by, mark=True),
+                                                **record),
+                delta_query=template.format(scope=f":{DELTA_LABEL}", delta_filter=_delta_rel_filter('r'),
+                                            transactions=transactions,
+                                            merges=_merges('m', 'n', [sim_rel], justified_by, mark=True), **record),
+                anchored_query=f"""MATCH (n)-[r:{sim_rel}]->(m)
+                    WHERE elementId(r) IN $neoowl_relationship_ids
+                    WITH DISTINCT n, m WHERE NOT (m)-[:{sim_rel}]->(n)
+                    CREATE (m)-[inferred:{sim_rel}]->(n)
+                    SET inferred.{INFERRED_PROPERTY} = {justified_by}
+                    RETURN elementId(inferred) AS relationship, [elementId(m), elementId(n)] AS nodes""",
+                reads=frozenset({relationship_type(sim_rel)}),
+                writes=frozenset({relationship_type(sim_rel)}),
+                source=sim_rel,
+                dependents_query=relationship_dependents_query([sim_rel], reverse=True),
+                support_query=relationship_support_query('m', 'n', f"(n)-[:{sim_rel}]->(m)"),
+                partition_variable='n',
+                partition_pattern=f"(n)-[:{sim_rel}]->()"))
+        return rules
+
+    def _generate_pattern_defined_property_rules(self, records):
+        """One rule per property; path-distance properties are flagged to run as a multi-source BFS."""
+        transactions = self.batch_settings["pattern_property"].clause()
+        rules = []
+        for record in records:
+            label_expression = record.get('label_expression', record['label'])
+            variable, value = record['variable'], record['val_variable']
+            current = f"{variable}.{record['property_name']}"
+            query = f"""MATCH ({variable}:{label_expression})
+                    CALL ({variable}) {{
                         MATCH {record['pattern']}
-                        WITH {record['variable']}, {record['val_variable']}
-                        WHERE {record['variable']}.{record['property_name']} IS NULL OR {record['variable']}.{record['property_name']} <> {record['val_variable']}
-                        SET {record['variable']}.{record['property_name']} = {record['val_variable']}
-                    }} IN CONCURRENT TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_all_rules(self):
-        """Generate all inference rules."""
+                        WITH {variable}, {value}
+                        WHERE {current} IS NULL OR {current} <> {value}
+                        RETURN {value} AS neoowl_value
+                    }}
+                    CALL ({variable}, neoowl_value) {{
+                        SET {current} = neoowl_value
+                    }} {transactions}
+                    RETURN count(*) AS rows"""
+            # Widened owners (virtual mode) keep the per-owner query
+            reachability = reachability_rule(record) if label_expression == record['label'] else None
+            rules.append(Rule(kind="pattern_property", query=query, seminaive_query=query,
+                              reads=frozenset(pattern_tokens(f"(:{label_expression})") | pattern_tokens(record['pattern'])),
+                              writes=frozenset({node_property(record['property_name'])}),
+                              source=f"{record['label']}.{record['property_name']}",
+                              reachability=reachability and asdict(reachability),
+                              partition_variable=variable,
+                              partition_pattern=f"({variable}:{label_expression})"))
+        return rules
+
+    def _virtualize(self, ontology):
+        """Rewrite the pattern sections so that their rules match the virtual facts too."""
+        rewriter = QueryRewriter(ontology, self.virtual)
+
+        def rewrite(records):
+            return [{**record, 'pattern': rewriter.rewrite(record['pattern'])} for record in records]
+
+        return {**ontology,
+                "pattern_labels": rewrite(ontology["pattern_labels"]),
+                "pattern_relationships": rewrite(ontology["pattern_relationships"]),
+                "pattern_properties": [{**record, 'label_expression': rewriter.label_expression(record['label'])}
+                                       for record in rewrite(ontology["pattern_properties"])]}
+
+    def update_rules(self, ontology=None):
+        """Compile the rules of `ontology` (fetched if not given) and return the rules that are new.
+
+        Only sections whose fingerprint changed are recompiled (or loaded from
+        the rule cache); rules identical to a current one keep the existing
+        object, and with it their tuned batch size.
+        """
         try:
-            rule_generators = [
-                self._generate_pattern_defined_label_rules,
-                self._generate_pattern_defined_relationship_rules,
-                self._generate_sco_label_rules,
-                self._generate_implies_relationship_rules,
-                self._generate_equivalent_label_rules,
-                self._generate_equivalent_relationship_rules,
-                self._generate_symmetric_relationship_rules,
-                self._generate_pattern_defined_property_rules
-            ]
-            all_rules = []
-            for gen in rule_generators:
-                all_rules.extend(gen())
-            logger.info(f"Generated {len(all_rules)} inference rules")
-            for i, rule in enumerate(all_rules):   
-                logger.info(f"Rule {i+1}:\n\n {rule} \n\n")
-            return all_rules
+            ontology = ontology or self.load_ontology()
+            if self.virtual:
+                ontology = self._virtualize(ontology)
+            compilers = {
+                "pattern_labels": self._generate_pattern_defined_label_rules,
+                "pattern_relationships": self._generate_pattern_defined_relationship_rules,
+                "hierarchy": self._generate_hierarchy_rules,
+                "symmetric": self._generate_symmetric_relationship_rules,
+                "pattern_properties": self._generate_pattern_defined_property_rules,
+            }
+            current = {(rule.kind, rule.query): rule for rule in self.rules}
+            sections, compiled, cached, changed = {}, [], 0, not self.sections
+            for section, kinds in RULE_SECTIONS.items():
+                key = fingerprint(section, ontology[section],
+                                  [self.batch_settings[kind].clause() for kind in kinds])
+                if section in self.sections and self.sections[section][0] == key:
+                    sections[section] = self.sections[section]
+                    continue
+                changed = True
+                rules = self.rule_cache.load(key) if self.rule_cache else None
+                if rules is None:
+                    rules = compilers[section](ontology[section])
+                    compiled.extend(rules)
+                    if self.rule_cache:
+                        self.rule_cache.save(key, rules)
+                else:
+                    cached += len(rules)
+                sections[section] = (key, [current.get((rule.kind, rule.query), rule) for rule in rules
+                                           if rule.kind not in self.virtual])
+            self.sections = sections
+            self.rules = [rule for _, rules in sections.values() for rule in rules]
+            new_rules = [rule for rule in self.rules if (rule.kind, rule.query) not in current]
+            if new_rules and self.index_timeout is not None:
+                self.provision_indexes(new_rules)
+            if new_rules and self.planner:
+                with self.main_conn.session(self.database) as session:
+                    self.planner.explain(session, new_rules,
+                                         lambda rule: {"neoowl_batch_size": self.batch_sizer.batch_size(rule)})
+            if not changed:
+                return new_rules
+            logger.info(f"Generated {len(self.rules)} inference rules "
+                        f"({len(compiled)} compiled, {cached} from cache, {len(new_rules)} new)")
+            compiled_queries = {(rule.kind, rule.query) for rule in compiled}
+            for i, rule in enumerate(self.rules):
+                if (rule.kind, rule.query) in compiled_queries:
+                    logger.info(f"Rule {i+1}:\n\n {rule.query} \n\n")
+            return new_rules
         except Exception as e:
             logger.error(f"Failed to generate rules: {e}")
             raise
 
-    def infer_to_convergence(self, params=None):
+    def provision_indexes(self, rules=None):
+        """Create the indexes `rules` (all of them by default) can seek on; return the rules still scanning."""
+        return provision_indexes(self.main_conn, self.database, self.rules if rules is None else rules,
+                                 timeout=self.index_timeout or 300,
+                                 ignored_properties=(DELTA_PROPERTY, INFERRED_PROPERTY, INFERRED_LABELS_PROPERTY))
+
+    def order_rules(self, rules):
+        """`rules` in the order a pass should run them: planned by cost, or as given."""
+        return self.planner.order(rules) if self.planner else list(rules)
+
+    def end_run(self):
+        """Close the current metrics run and hand the rule timings to the planner."""
+        self.metrics.end_run()
+        if self.planner:
+            self.planner.record(self.metrics.rules())
+
+    def run_rules(self, session, rules, params, query_for=lambda rule: rule.query):
+        """Run `rules` once, in rule order, and return their result summaries.
+
+        With a single worker the rules run one after another on `session`;
+        otherwise consecutive non-conflicting rules run concurrently on the
+        executor's sessions, and a rule large enough to partition runs its
+        partitions concurrently, in its place in the order. The size of each
+        partition domain is counted once per call. Each run binds the rule's
+        current batch size, feeds its timing or failure back to the batch sizer
+        and is recorded in the metrics.
+        """
+        def params_for(rule):
+            return {**params, "neoowl_batch_size": self.batch_sizer.batch_size(rule)}
+
+        def record(rule, rows, summary):
+            self.batch_sizer.record(rule, rows, summary)
+            self.metrics.record(rule.kind, rule.source, summary, rows, queries[id(rule)])
+            summaries[id(rule)] = summary
+
+        def run_one(rule, run):
+            try:
+                return run()
+            except Exception:
+                self.batch_sizer.record_failure(rule)
+                raise
+
+        def run_whole(segment):
+            if not segment:
+                return
+            if self.executor:
+                results = self.executor.run(segment, params_for, lambda rule: queries[id(rule)],
+                                            lambda rule: probes[id(rule)], self.batch_sizer.record_failure)
+            else:
+                results = [run_one(rule, lambda: run_rule(session, queries[id(rule)], params_for(rule),
+                                                          probes[id(rule)]))
+                           for rule in segment]
+            for rule, (rows, summary) in zip(segment, results):
+                record(rule, rows, summary)
+
+        cypher_rules = [rule for rule in rules if not rule.reachability]
+        domain_sizes = {}
+        partitioned = {id(rule) for rule in cypher_rules if self._partitionable(session, rule, domain_sizes)}
+        queries = {id(rule): self.metrics.query(rule, partitioned_query(query_for(rule), rule.partition_variable)
+                                                if id(rule) in partitioned else query_for(rule))
+                   for rule in cypher_rules}
+        probes = {id(rule): probe_query(query_for(rule)) if self.probe_rules else None for rule in cypher_rules}
+        summaries, segment = {}, []
+        for rule in rules:
+            if not (rule.reachability or id(rule) in partitioned):
+                segment.append(rule)
+                continue
+            run_whole(segment)
+            segment = []
+            if rule.reachability:
+                _, summaries[id(rule)] = self.run_distance_rule(session, rule)
+            else:
+                record(rule, *run_one(rule, lambda: self.executor.run_partitioned(
+                    queries[id(rule)], params_for(rule), lambda: self._partitions(session, rule), probes[id(rule)])))
+        run_whole(segment)
+        return [summaries[id(rule)] for rule in rules]
+
+    def _partitionable(self, session, rule, domain_sizes):
+        """Whether `rule` is to run in partitions: its driving match spans more than `partition_size` elements.
+
+        Domain sizes already counted are looked up in `domain_sizes`.
+        """
+        if not (self.partition_size and rule.partition_pattern):
+            return False
+        if rule.partition_pattern not in domain_sizes:
+            record = session.run(f"MATCH {rule.partition_pattern} "
+                                 f"RETURN count({rule.partition_variable}) AS count").single()
+            domain_sizes[rule.partition_pattern] = record["count"]
+        return domain_sizes[rule.partition_pattern] > self.partition_size
+
+    def _partitions(self, session, rule):
+        """The element ids the driving match of `rule` binds, in lists of `partition_size`."""
+        ids = [record["id"] for record in session.run(f"""MATCH {rule.partition_pattern}
+                    RETURN DISTINCT elementId({rule.partition_variable}) AS id""")]
+        logger.info(f"Splitting the {rule.kind} rule from {rule.source} over {len(ids)} elements")
+        return [ids[i:i + self.partition_size] for i in range(0, len(ids), self.partition_size)]
+
+    def run_distance_rule(self, session, rule, node_ids=None):
+        """Run a path-distance rule: a full BFS, or a repair around the changed `node_ids`.
+
+        Returns the element ids of the owners written and a summary telling
+        whether anything was; every statement run is recorded in the metrics.
+        """
+        key = tuple(sorted(rule.reachability.items()))
+        if key not in self.path_distances:
+            self.path_distances[key] = PathDistances(ReachabilityRule(**rule.reachability))
+        distances, batch_size = self.path_distances[key], self.batch_sizer.batch_size(rule)
+        if node_ids is None:
+            written, summaries = distances.compute(session, batch_size)
+        else:
+            written, summaries = distances.repair(session, node_ids, batch_size)
+        for summary in summaries:
+            self.metrics.record(rule.kind, rule.source, summary)
+        updates = [summary for summary in summaries if summary.counters.contains_updates]
+        return written, (updates or summaries or [None])[-1]
+
+    def infer_to_convergence(self, params=None, semi_naive=False, stratified=False):
         """Run inference rules until convergence."""
+        if semi_naive and stratified:
+            raise ValueError("semi_naive and stratified evaluation cannot be combined")
+        if semi_naive:
+            return self._infer_to_convergence_semi_naive(params)
+        if stratified:
+            return self._infer_to_convergence_stratified(params)
         params = params or {}
         iteration = 0
+        rules = self.order_rules(self.rules)
+        self.metrics.start_run("naive")
         try:
             while True:
                 iteration += 1
-                any_update = False
-                with self.main_conn.session(NEO4J_DB_NAME) as session:
-                    for rule in self.rules:
-                        result = session.run(rule, params)
-                        any_new_update = result.consume().counters.contains_updates
-                        any_update = any_update or any_new_update
+                with self.main_conn.session(self.database) as session:
+                    summaries = self.run_rules(session, rules, params)
+                any_update = any(summary.counters.contains_updates for summary in summaries)
+                self.metrics.end_iteration()
                 logger.info(f"Iteration {iteration}: {'Updates applied' if any_update else 'No updates'}")
                 if not any_update:
                     break
@@ -186,9 +664,158 @@ class NeoOWLReasoner:
         except Exception as e:
             logger.error(f"Error during inference: {e}")
             raise
+        finally:
+            self.end_run()
+
+    def _infer_to_convergence_semi_naive(self, params=None):
+        """Run inference rules until convergence, evaluating only the last iteration's delta.
+
+        The first iteration is a full pass. Every later iteration drives the
+        structural rules (SCO, IMPLIES, EQUIVALENT, Symmetric) from the nodes
+        and relationships marked as new by the previous iteration; pattern-defined
+        rules have no statically known anchor and are re-evaluated in full.
+        """
+        params = params or {}
+        iteration = 0
+        rules = self.order_rules(self.rules)
+        self.metrics.start_run("semi-naive")
+        try:
+            with self.main_conn.session(self.database) as session:
+                self._clear_delta_markers(session)
+                while True:
+                    iteration += 1
+                    rule_params = {**params, "neoowl_iteration": iteration, "neoowl_previous": iteration - 1}
+                    summaries = self.run_rules(
+                        session, rules, rule_params,
+                        lambda rule: rule.delta_query if iteration > 1 and rule.delta_query else rule.seminaive_query)
+                    any_update = any(summary.counters.contains_updates for summary in summaries)
+                    self._advance_delta(session, iteration)
+                    self.metrics.end_iteration()
+                    logger.info(f"Iteration {iteration}: {'Updates applied' if any_update else 'No updates'}")
+                    if not any_update:
+                        break
+            logger.info("Inference converged")
+        except Exception as e:
+            logger.error(f"Error during inference: {e}")
+            raise
+        finally:
+            self.end_run()
+
+    def _infer_to_convergence_stratified(self, params=None):
+        """Run inference stratum by stratum, iterating only recursive strata to a fixpoint.
+
+        Strata follow the topological order of the rule dependency graph, so
+        every rule sees the final state of everything it reads from earlier
+        strata. Inside a recursive stratum, a rule is only retried when a label,
+        relationship type or property it reads was changed in the previous round.
+        """
+        params = params or {}
+        strata = stratify(self.rules)
+        recursive_count = sum(1 for _, recursive in strata if recursive)
+        logger.info(f"Scheduled {len(self.rules)} rules in {len(strata)} strata ({recursive_count} recursive)")
+        self.metrics.start_run("stratified")
+        try:
+            with self.main_conn.session(self.database) as session:
+                for number, (rules, recursive) in enumerate(strata, start=1):
+                    rules = self.order_rules(rules)
+                    pending = rules
+                    rounds = 0
+                    runs = 0
+                    while pending:
+                        rounds += 1
+                        changed = set()
+                        for rule, summary in zip(pending, self.run_rules(session, pending, params)):
+                            runs += 1
+                            if summary.counters.contains_updates:
+                                changed |= rule.writes
+                        self.metrics.end_iteration(stratum=number, round=rounds)
+                        if not recursive:
+                            break
+                        pending = [rule for rule in rules if rule.reads & changed]
+                    logger.info(f"Stratum {number}: {len(rules)} rules, {rounds} rounds, {runs} rule runs")
+            logger.info("Inference converged")
+        except Exception as e:
+            logger.error(f"Error during inference: {e}")
+            raise
+        finally:
+            self.end_run()
+
+    def _advance_delta(self, session, iteration):
+        """Retire the consumed delta and promote this iteration's changes to be the next delta."""
+        session.run(f"""MATCH (d:{DELTA_LABEL})
+                    CALL (d) {{
+                        OPTIONAL MATCH (d)-[r]->()
+                        WHERE r.{DELTA_PROPERTY} = $neoowl_previous
+                        REMOVE r.{DELTA_PROPERTY}
+                        WITH DISTINCT d
+                        REMOVE d:{DELTA_LABEL}
+                    }} IN TRANSACTIONS OF 1000 ROWS""",
+                    neoowl_previous=iteration - 1).consume()
+        session.run(f"""MATCH (d:{NEXT_DELTA_LABEL})
+                    CALL (d) {{
+                        REMOVE d:{NEXT_DELTA_LABEL}
+                        SET d:{DELTA_LABEL}
+                    }} IN TRANSACTIONS OF 1000 ROWS""").consume()
+
+    def _clear_delta_markers(self, session):
+        """Remove delta labels left behind by an interrupted semi-naive run."""
+        session.run(f"""MATCH (d:{DELTA_LABEL}|{NEXT_DELTA_LABEL})
+                    CALL (d) {{
+                        REMOVE d:{DELTA_LABEL}:{NEXT_DELTA_LABEL}
+                    }} IN TRANSACTIONS OF 1000 ROWS""").consume()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run NeoOWL inference until convergence.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--semi-naive", action="store_true",
+                      help="Only re-evaluate rules against the previous iteration's changes after the first pass")
+    mode.add_argument("--stratified", action="store_true",
+                      help="Run rules in dependency order, looping only recursive strata to a fixpoint")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of sessions used to run non-conflicting rules concurrently")
+    parser.add_argument("--batch-config",
+                        help="JSON file of per-rule-kind batch settings, e.g. {\"sco\": {\"batch_size\": 10000}}")
+    parser.add_argument("--adaptive-batching", action="store_true",
+                        help="Tune each rule's batch size from the timings of its earlier runs")
+    parser.add_argument("--rule-cache",
+                        help="Directory caching compiled rules by ontology fingerprint")
+    parser.add_argument("--engine", choices=["cypher", "inmemory", "snapshot"], default="cypher",
+                        help="Run every rule in Cypher, materialize hierarchies, symmetry and reachability "
+                             "properties in memory, or also evaluate the pattern rules read-only and apply only "
+                             "the net changes in bulk (the last two require numpy)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run every rule under PROFILE to record its database hits")
+    parser.add_argument("--slow-rule-threshold", type=float,
+                        help="Save the PROFILE plan of rules running longer than this many seconds")
+    parser.add_argument("--slow-rule-dir", default="slow_rules", help="Directory the slow rule plans are saved to")
+    parser.add_argument("--metrics-log", help="Write per-iteration and per-run rule metrics as JSON lines to this file")
+    parser.add_argument("--virtual", nargs="+", choices=VIRTUAL_KINDS, default=[],
+                        help="Rule kinds left to query-time rewriting (query_rewriter.py) instead of materialized")
+    parser.add_argument("--index-timeout", type=float, default=300,
+                        help="Seconds to wait for the indexes created for the rules to come online")
+    parser.add_argument("--no-index-provisioning", action="store_true",
+                        help="Do not create the lookup and property indexes the rules can seek on")
+    parser.add_argument("--no-probes", action="store_true",
+                        help="Run every rule statement instead of probing first whether it has anything to write")
+    parser.add_argument("--no-rule-planning", action="store_true",
+                        help="Run rules in compilation order instead of EXPLAINing them and ordering them by cost")
+    parser.add_argument("--partition-size", type=int,
+                        help="Split rules whose driving match spans more elements than this into element id "
+                             "partitions of this size, run concurrently on the --workers sessions")
+    args = parser.parse_args()
+    if args.partition_size and args.workers < 2:
+        parser.error("--partition-size requires --workers 2 or more")
+    if args.engine != "cypher" and (args.semi_naive or args.stratified):
+        parser.error("--semi-naive and --stratified only apply to the cypher engine")
+    if args.engine != "cypher" and args.virtual:
+        parser.error("--virtual only applies to the cypher engine")
+    return args
 
 def main():
     """Perform inference until convergence."""
+    args = parse_args()
+    if args.metrics_log:
+        log_to_file(args.metrics_log)
     try:
         # Initialize connections
         main_conn = Neo4jConnection(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
@@ -196,8 +823,24 @@ def main():
         logger.info("Connected to Neo4j databases")
 
         # Run inference to convergence
-        reasoner = NeoOWLReasoner(main_conn, ontology_conn)
-        reasoner.infer_to_convergence()
+        reasoner = NeoOWLReasoner(main_conn, ontology_conn, workers=args.workers,
+                                  batch_settings=load_batch_settings(args.batch_config),
+                                  adaptive_batching=args.adaptive_batching, rule_cache=args.rule_cache,
+                                  metrics=RuleMetrics(profile=args.profile,
+                                                      slow_rule_threshold=args.slow_rule_threshold,
+                                                      slow_rule_dir=args.slow_rule_dir),
+                                  virtual=args.virtual,
+                                  index_timeout=None if args.no_index_provisioning else args.index_timeout,
+                                  probe_rules=not args.no_probes, partition_size=args.partition_size,
+                                  plan_rules=not args.no_rule_planning)
+        if args.engine == "inmemory":
+            from inmemory_engine import InMemoryEngine
+            InMemoryEngine(reasoner, reasoner.database).infer_to_convergence()
+        elif args.engine == "snapshot":
+            from snapshot_engine import SnapshotEngine
+            SnapshotEngine(reasoner, reasoner.database).infer_to_convergence()
+        else:
+            reasoner.infer_to_convergence(semi_naive=args.semi_naive, stratified=args.stratified)
     except Exception as e:
         logger.error(f"Inference failed: {e}")
     finally:
@@ -206,4 +849,4 @@ def main():
         logger.info("Connections closed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
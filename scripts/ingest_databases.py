@@ -1,6 +1,9 @@
 import os
-from neo4j import GraphDatabase
+import re
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from connections import Neo4jConnection
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,28 +24,151 @@ NEO4J_ONTOLOGY_DB_NAME = os.getenv("NEO4J_ONTOLOGY_DB_NAME", "movie_ontology")
 DATA_CYPHER_FILE = "../data/movie_graph.cypher"
 ONTOLOGY_CYPHER_FILE = "../ontologies/movie_graph/human_readable_movie_graph_ontology.cypher"
 
-def delete_all(driver, database):
-    """Delete all nodes and relationships in the specified database."""
+# Next token to look for in each scanner state: outside any literal (None),
+# inside a string or quoted identifier, or inside a comment
+_NEXT_TOKEN = {
+    None: re.compile(r"[;'\"`]|//|/\*"),
+    "'": re.compile(r"\\.|'", re.S),
+    '"': re.compile(r'\\.|"', re.S),
+    "`": re.compile(r"`"),
+    "//": re.compile(r"\n"),
+    "/*": re.compile(r"\*/"),
+}
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`")
+_SCHEMA_COMMAND = re.compile(r"^\s*(?:CREATE|DROP|SHOW)\b(?:\s+\w+)?\s+(?:CONSTRAINT|INDEX)\b", re.I)
+_IN_TRANSACTIONS = re.compile(r"\bIN\s+(?:\d+\s+)?(?:CONCURRENT\s+)?TRANSACTIONS\b", re.I)
+# Statement kinds that can run concurrently with statements of the same kind
+PARALLEL_KINDS = {"create"}
+
+def _strip_client_commands(statement):
+    """Drop leading cypher-shell commands (:begin, :commit, :param ...), which end at the line break."""
+    statement = statement.strip()
+    while statement.startswith(":"):
+        statement = statement.partition("\n")[2].strip()
+    return statement
+
+def read_statements(file, chunk_size=1 << 20):
+    """Yield the statements of a Cypher script one at a time, reading it in chunks.
+
+    Statements are split on semicolons outside string literals, quoted
+    identifiers and comments; comments and cypher-shell commands are dropped.
+    """
+    buffer, start, pos, state, pieces, eof = "", 0, 0, None, [], False
+    while True:
+        match = _NEXT_TOKEN[state].search(buffer, pos)
+        if match is None:
+            if eof:
+                break
+            # A token may straddle the chunk boundary, so rescan the unconsumed tail
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer, pos, start = buffer[start:] + chunk, pos - start, 0
+            continue
+        token = match.group()
+        if state is None:
+            if token == ";":
+                pieces.append(buffer[start:match.start()])
+                statement = _strip_client_commands("".join(pieces))
+                if statement:
+                    yield statement
+                pieces, start = [], match.end()
+            elif token in ("//", "/*"):
+                pieces.append(buffer[start:match.start()])
+                state = token
+            else:
+                state = token
+        elif state == "//":
+            state, start = None, match.start()  # keep the line break
+        elif state == "/*":
+            pieces.append(" ")
+            state, start = None, match.end()
+        elif token == state:
+            state = None
+        pos = match.end()
+    if state not in ("//", "/*"):
+        pieces.append(buffer[start:])
+    statement = _strip_client_commands("".join(pieces))
+    if statement:
+        yield statement
+
+def statement_kind(statement):
+    """Classify a statement by what it may safely run concurrently or in a transaction with.
+
+    "create" statements only create new elements, so they are independent of
+    each other. A statement that MATCHes may read what an earlier one created,
+    so it is "serial", as is any statement merging, deleting or calling
+    procedures. "schema" commands and "autocommit" statements
+    (CALL { } IN TRANSACTIONS) each need a transaction of their own.
+    """
+    if _IN_TRANSACTIONS.search(statement):
+        return "autocommit"
+    if _SCHEMA_COMMAND.search(statement):
+        return "schema"
+    words = set(re.findall(r"[A-Z_]+", _STRING_LITERAL.sub("''", statement).upper()))
+    if words & {"MATCH", "MERGE", "DELETE", "DETACH", "REMOVE", "CALL", "LOAD", "FOREACH"}:
+        return "serial"
+    return "create"
+
+def group_statements(statements, transaction_size):
+    """Group consecutive statements of the same kind into (kind, statements) transactions."""
+    kind, group = None, []
+    for statement in statements:
+        statement_type = statement_kind(statement)
+        if group and (statement_type != kind or len(group) >= transaction_size or kind in ("schema", "autocommit")):
+            yield kind, group
+            group = []
+        kind = statement_type
+        group.append(statement)
+    if group:
+        yield kind, group
+
+def _run_group(conn, database, kind, statements):
+    with conn.session(database) as session:
+        if kind == "autocommit":
+            for statement in statements:
+                session.run(statement).consume()
+        else:
+            session.execute_write(lambda tx: [tx.run(statement).consume() for statement in statements])
+    return len(statements)
+
+def delete_all(conn, database, batch_size=10000):
+    """Delete all nodes and relationships in the specified database, in batches."""
     try:
-        with driver.session(database=database) as session:
-            session.run("MATCH (n) DETACH DELETE n")
+        with conn.session(database) as session:
+            session.run("""MATCH (n)
+                CALL (n) {
+                    DETACH DELETE n
+                } IN TRANSACTIONS OF $batch_size ROWS""", batch_size=batch_size).consume()
         print(f"Cleared all data from database: {database}")
     except Exception as e:
         print(f"Error clearing database {database}: {e}")
         raise
 
-def ingest_cypher_file(driver, database, cypher_file):
-    """Read and execute Cypher commands from a file in the specified database."""
+def ingest_cypher_file(conn, database, cypher_file, transaction_size=100, workers=1):
+    """Stream Cypher statements from a file into the specified database.
+
+    Statements run in explicit transactions of up to `transaction_size`
+    statements. With several `workers`, consecutive transactions of
+    independent statements (see statement_kind) run concurrently; any other
+    statement waits for everything before it.
+    """
     try:
-        with open(cypher_file, "r") as file:
-            cypher_content = file.read()
-            # Split into individual statements (assuming semicolon-separated)
-            statements = [stmt.strip() for stmt in cypher_content.split(";") if stmt.strip()]
-        
-        with driver.session(database=database) as session:
-            for statement in statements:
-                session.run(statement)
-        print(f"Successfully ingested {cypher_file} into database: {database}")
+        ingested = 0
+        with open(cypher_file, "r") as file, ThreadPoolExecutor(max_workers=workers) as pool:
+            running = []
+            for kind, statements in group_statements(read_statements(file), transaction_size):
+                if running and (kind != running[0][0] or kind not in PARALLEL_KINDS):
+                    ingested += sum(future.result() for _, future in running)
+                    running = []
+                if workers > 1 and kind in PARALLEL_KINDS:
+                    if len(running) >= 2 * workers:
+                        # Bound the statements held in memory
+                        ingested += running.pop(0)[1].result()
+                    running.append((kind, pool.submit(_run_group, conn, database, kind, statements)))
+                else:
+                    ingested += _run_group(conn, database, kind, statements)
+            ingested += sum(future.result() for _, future in running)
+        print(f"Successfully ingested {ingested} statements from {cypher_file} into database: {database}")
     except FileNotFoundError:
         print(f"Error: File {cypher_file} not found")
         raise
@@ -50,41 +176,47 @@ def ingest_cypher_file(driver, database, cypher_file):
         print(f"Error ingesting {cypher_file} into {database}: {e}")
         raise
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Clear the databases and ingest the movie graph.")
+    parser.add_argument("--transaction-size", type=int, default=100,
+                        help="Number of statements grouped into one transaction")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of sessions ingesting independent statements concurrently")
+    parser.add_argument("--delete-batch-size", type=int, default=10000,
+                        help="Number of nodes deleted per transaction when clearing a database")
+    return parser.parse_args()
+
 def main():
-    # Initialize drivers for both databases
+    args = parse_args()
+    # Initialize connections for both databases
     try:
-        driver_main = GraphDatabase.driver(
-            NEO4J_URI,
-            auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
-        )
-        #driver_ontology = GraphDatabase.driver(
-        #    NEO4J_URI_ONTOLOGY,
-        #    auth=(NEO4J_USERNAME_ONTOLOGY, NEO4J_PASSWORD_ONTOLOGY)
-        #)
+        conn_main = Neo4jConnection(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+        #conn_ontology = Neo4jConnection(NEO4J_URI_ONTOLOGY, NEO4J_USERNAME_ONTOLOGY, NEO4J_PASSWORD_ONTOLOGY)
     except Exception as e:
         print(f"Error connecting to Neo4j: {e}")
         return
 
     # Delete all data from both databases
     try:
-        delete_all(driver_main, NEO4J_DB_NAME)
-        #delete_all(driver_ontology, NEO4J_ONTOLOGY_DB_NAME)
+        delete_all(conn_main, NEO4J_DB_NAME, batch_size=args.delete_batch_size)
+        #delete_all(conn_ontology, NEO4J_ONTOLOGY_DB_NAME)
     except Exception as e:
         print("Failed to clear databases. Exiting.")
-        driver_main.close()
-        #driver_ontology.close()
+        conn_main.close()
+        #conn_ontology.close()
         return
 
     # Ingest data into respective databases
     try:
-        ingest_cypher_file(driver_main, NEO4J_DB_NAME, DATA_CYPHER_FILE)
-        #ingest_cypher_file(driver_ontology, NEO4J_ONTOLOGY_DB_NAME, ONTOLOGY_CYPHER_FILE)
+        ingest_cypher_file(conn_main, NEO4J_DB_NAME, DATA_CYPHER_FILE,
+                           transaction_size=args.transaction_size, workers=args.workers)
+        #ingest_cypher_file(conn_ontology, NEO4J_ONTOLOGY_DB_NAME, ONTOLOGY_CYPHER_FILE)
     except Exception as e:
         print("Failed to ingest data. Exiting.")
     finally:
         # Close connections
-        driver_main.close()
-        #driver_ontology.close()
+        conn_main.close()
+        #conn_ontology.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,306 @@
+"""In-memory materialization of the NeoOWL hierarchy, symmetry and reachability rules.
+
+The labels and relationship types these rules touch are projected once into
+NumPy structures: one boolean bitset per label and one CSR adjacency per
+relationship type. The closures are computed with vectorized set operations
+and only the inferred delta is written back. Pattern-defined labels and
+relationships, and property patterns that are not plain reachability, stay
+Cypher rules and run between projections until nothing changes.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Dict
+
+import numpy as np
+from neo4j import unit_of_work
+
+from ontology_closure import hierarchy_closure, split_hierarchy
+from path_distances import reachability_rule
+from retraction import INFERRED_PROPERTY, justification, mark_labels
+from rule_dependencies import label, node_property
+
+logger = logging.getLogger(__name__)
+
+
+def _csr(keys, size):
+    """CSR (indptr, indices) of the edges encoded as sorted `source * size + target` keys."""
+    sources, targets = np.divmod(keys, size)
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+    return indptr, targets
+
+
+def _neighbours(indptr, indices, frontier):
+    """All CSR neighbours of the `frontier` node indexes, vectorized."""
+    starts, ends = indptr[frontier], indptr[frontier + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return indices[positions]
+
+
+class GraphProjection:
+    """Nodes, label bitsets, per-type CSR adjacency and selected property values of a graph."""
+    def __init__(self, node_ids, labels, relationships, properties=None):
+        self.node_ids = list(node_ids)
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.labels = labels
+        self.adjacency = {rel_type: _csr(keys, self.size) for rel_type, keys in relationships.items()}
+        self.properties = properties or {}
+
+    @property
+    def size(self):
+        return len(self.node_ids)
+
+    @classmethod
+    def from_records(cls, nodes, relationships, properties=None):
+        """Build a projection from (id, labels) node pairs, {type: [(start id, end id)]} and {property: {id: value}}."""
+        node_ids, node_labels = [], []
+        for node_id, labels in nodes:
+            node_ids.append(node_id)
+            node_labels.append(labels)
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        for pairs in relationships.values():
+            for pair in pairs:
+                for node_id in pair:
+                    if node_id not in index:
+                        index[node_id] = len(node_ids)
+                        node_ids.append(node_id)
+        size = len(node_ids)
+        bitsets = {}
+        for i, labels in enumerate(node_labels):
+            for name in labels:
+                bitsets.setdefault(name, np.zeros(size, dtype=bool))[i] = True
+        keys = {}
+        for rel_type, pairs in relationships.items():
+            encoded = [index[start] * size + index[end] for start, end in pairs]
+            keys[rel_type] = np.unique(np.array(encoded, dtype=np.int64))
+        values = {name: {index[node_id]: value for node_id, value in by_id.items() if node_id in index}
+                  for name, by_id in (properties or {}).items()}
+        return cls(node_ids, bitsets, keys, values)
+
+    @classmethod
+    def from_database(cls, session, labels, relationship_types, properties=()):
+        """Project the nodes carrying any of `labels` and every relationship of `relationship_types`."""
+        nodes, values = [], {name: {} for name in properties}
+        result = session.run(
+            """MATCH (n) WHERE any(l IN labels(n) WHERE l IN $labels)
+            RETURN elementId(n) AS id, [l IN labels(n) WHERE l IN $labels] AS labels,
+                   [p IN $properties WHERE n[p] IS NOT NULL | [p, n[p]]] AS properties""",
+            labels=sorted(labels), properties=sorted(properties))
+        for record in result:
+            nodes.append((record['id'], record['labels']))
+            for name, value in record['properties']:
+                values[name][record['id']] = value
+        relationships = {}
+        for rel_type in sorted(relationship_types):
+            result = session.run(f"MATCH (a)-[:{rel_type}]->(b) RETURN elementId(a) AS a, elementId(b) AS b")
+            relationships[rel_type] = [(record['a'], record['b']) for record in result]
+        return cls.from_records(nodes, relationships, values)
+
+    def label_bitset(self, name):
+        return self.labels.get(name, np.zeros(self.size, dtype=bool))
+
+    def edge_keys(self, rel_type):
+        """Edges of `rel_type` as sorted, unique `source * size + target` keys."""
+        if rel_type not in self.adjacency:
+            return np.empty(0, dtype=np.int64)
+        indptr, indices = self.adjacency[rel_type]
+        sources = np.repeat(np.arange(self.size, dtype=np.int64), np.diff(indptr))
+        return sources * self.size + indices
+
+
+@dataclass
+class Delta:
+    """Facts inferred in memory that are not in the projection yet."""
+    labels: Dict[str, np.ndarray] = field(default_factory=dict)
+    relationships: Dict[str, np.ndarray] = field(default_factory=dict)
+    properties: Dict[str, tuple] = field(default_factory=dict)
+
+    def __bool__(self):
+        return any(len(nodes) for nodes in self.labels.values()) \
+            or any(len(keys) for keys in self.relationships.values()) \
+            or any(len(nodes) for nodes, _ in self.properties.values())
+
+
+def materialize(projection, label_closure, relationship_closure, symmetric_types, reachability_rules=()):
+    """Compute the closure of `projection` and return what it adds to it.
+
+    `label_closure` and `relationship_closure` map each name to the names it
+    implies (see hierarchy_closure); `symmetric_types` are relationship types
+    whose reverse holds too. A reachability property is set to the hop
+    distance of every owner reaching a target, and removed from the others.
+    """
+    size = projection.size
+    labels = {}
+    for narrower, broader in label_closure.items():
+        members = projection.label_bitset(narrower)
+        for name in broader:
+            labels[name] = labels.get(name, projection.label_bitset(name)) | members
+
+    types = set(relationship_closure) | set(symmetric_types) \
+        | {name for broader in relationship_closure.values() for name in broader}
+    edges = {rel_type: projection.edge_keys(rel_type) for rel_type in types}
+    changed = True
+    while changed:
+        changed = False
+        for narrower, broader in relationship_closure.items():
+            for name in broader:
+                merged = np.union1d(edges[name], edges[narrower])
+                changed |= len(merged) != len(edges[name])
+                edges[name] = merged
+        for rel_type in symmetric_types:
+            sources, targets = np.divmod(edges[rel_type], size)
+            merged = np.union1d(edges[rel_type], targets * size + sources)
+            changed |= len(merged) != len(edges[rel_type])
+            edges[rel_type] = merged
+
+    delta = Delta()
+    for name, members in labels.items():
+        added = np.flatnonzero(members & ~projection.label_bitset(name))
+        if len(added):
+            delta.labels[name] = added
+    for rel_type, keys in edges.items():
+        added = np.setdiff1d(keys, projection.edge_keys(rel_type), assume_unique=True)
+        if len(added):
+            delta.relationships[rel_type] = added
+
+    def final_labels(name):
+        return labels.get(name, projection.label_bitset(name))
+
+    for rule in reachability_rules:
+        keys = edges.get(rule.relationship_type, projection.edge_keys(rule.relationship_type))
+        sources, targets = np.divmod(keys, size)
+        # Walk from the targets back to the owners
+        if rule.direction == "outgoing":
+            sources, targets = targets, sources
+        elif rule.direction == "both":
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+        indptr, indices = _csr(np.unique(sources * size + targets), size)
+        distance = np.full(size, -1, dtype=np.int64)
+        frontier = np.flatnonzero(final_labels(rule.target_label))
+        distance[frontier] = 0
+        hops = 0
+        while len(frontier):
+            hops += 1
+            reached = np.unique(_neighbours(indptr, indices, frontier))
+            frontier = reached[distance[reached] < 0]
+            distance[frontier] = hops
+        current = projection.properties.get(rule.property_name, {})
+        # Owners the search no longer reaches lose the property (None), as with path_distances
+        reached = {i: int(distance[i]) if distance[i] >= 0 else None
+                   for i in np.flatnonzero(final_labels(rule.owner_label)).tolist()}
+        nodes = [i for i, value in reached.items() if current.get(i) != value]
+        if nodes:
+            values = np.empty(len(nodes), dtype=object)
+            values[:] = [reached[i] for i in nodes]
+            delta.properties[rule.property_name] = (np.array(nodes, dtype=np.int64), values)
+    return delta
+
+
+def write_delta(session, projection, delta, batch_size=10000, kind="inmemory", metadata=None):
+    """Write `delta` back with batched UNWIND statements and return their result summaries.
+
+    Relationships are justified as inferred by `kind`; every transaction
+    carries the transaction `metadata`, if given.
+    """
+    node_ids, size = projection.node_ids, projection.size
+    summaries = []
+
+    @unit_of_work(metadata=metadata)
+    def work(tx, query, rows):
+        return tx.run(query, rows=rows).consume()
+
+    def run_batches(query, rows):
+        for i in range(0, len(rows), batch_size):
+            summaries.append(session.execute_write(work, query, rows[i:i + batch_size]))
+
+    for name, nodes in delta.labels.items():
+        run_batches(f"""UNWIND $rows AS id
+            MATCH (n) WHERE elementId(n) = id
+            {mark_labels('n', [name])}
+            SET n:{name}""", [node_ids[i] for i in nodes.tolist()])
+    for rel_type, keys in delta.relationships.items():
+        sources, targets = np.divmod(keys, size)
+        run_batches(f"""UNWIND $rows AS pair
+            MATCH (a) WHERE elementId(a) = pair[0]
+            MATCH (b) WHERE elementId(b) = pair[1]
+            CREATE (a)-[inferred:{rel_type}]->(b)
+            SET inferred.{INFERRED_PROPERTY} = {justification(kind, rel_type)}""",
+                    [[node_ids[a], node_ids[b]] for a, b in zip(sources.tolist(), targets.tolist())])
+    for name, (nodes, values) in delta.properties.items():
+        run_batches(f"""UNWIND $rows AS row
+            MATCH (n) WHERE elementId(n) = row[0]
+            SET n.{name} = row[1]""", [[node_ids[i], value] for i, value in zip(nodes.tolist(), values.tolist())])
+    return summaries
+
+
+class InMemoryEngine:
+    """Run a NeoOWLReasoner's ontology to convergence with the in-memory closures.
+
+    Each iteration runs the Cypher-only rules once, projects the graph,
+    materializes the closures in memory and writes back the delta, until
+    neither step changes anything.
+    """
+    def __init__(self, reasoner, database, batch_size=10000):
+        self.reasoner = reasoner
+        self.database = database
+        self.batch_size = batch_size
+        self.ontology = ontology = reasoner.load_ontology()
+        hierarchy = split_hierarchy(ontology['hierarchy'])
+        self.label_closure = hierarchy_closure(hierarchy["label_edges"], hierarchy["label_equivalences"])
+        self.relationship_closure = hierarchy_closure(hierarchy["relationship_edges"],
+                                                      hierarchy["relationship_equivalences"])
+        self.symmetric_types = sorted(record['sim_rel'] for record in ontology['symmetric'])
+        self.reachability_rules = [rule for rule in map(reachability_rule, ontology['pattern_properties']) if rule]
+        in_memory = {(rule.owner_label, rule.property_name) for rule in self.reachability_rules}
+        self.cypher_rules = [rule for rule in reasoner.order_rules(reasoner.rules) if rule.kind in ("pattern_label", "pattern_relationship")
+                             or (rule.kind == "pattern_property"
+                                 and not any(label(owner) in rule.reads and node_property(name) in rule.writes
+                                             for owner, name in in_memory))]
+
+    def _projected(self):
+        labels = set(self.label_closure) | {name for names in self.label_closure.values() for name in names}
+        labels |= {rule.owner_label for rule in self.reachability_rules}
+        labels |= {rule.target_label for rule in self.reachability_rules}
+        types = set(self.relationship_closure) | set(self.symmetric_types)
+        types |= {name for names in self.relationship_closure.values() for name in names}
+        types |= {rule.relationship_type for rule in self.reachability_rules}
+        return labels, types, {rule.property_name for rule in self.reachability_rules}
+
+    def _write_delta(self, session, projection, delta):
+        summaries = write_delta(session, projection, delta, self.batch_size)
+        for summary in summaries:
+            self.reasoner.metrics.record("inmemory", "delta", summary)
+        return summaries
+
+    def infer_to_convergence(self, params=None, max_iterations=100):
+        params = params or {}
+        labels, types, properties = self._projected()
+        logger.info(f"In-memory engine: {len(self.cypher_rules)} Cypher rules, {len(labels)} labels, "
+                    f"{len(types)} relationship types, {len(self.reachability_rules)} reachability properties")
+        self.reasoner.metrics.start_run("inmemory")
+        try:
+            for iteration in range(1, max_iterations + 1):
+                with self.reasoner.main_conn.session(self.database) as session:
+                    summaries = self.reasoner.run_rules(session, self.cypher_rules, params)
+                    changed = any(summary.counters.contains_updates for summary in summaries)
+                    projection = GraphProjection.from_database(session, labels, types, properties)
+                    delta = materialize(projection, self.label_closure, self.relationship_closure,
+                                        self.symmetric_types, self.reachability_rules)
+                    if delta:
+                        self._write_delta(session, projection, delta)
+                        changed = True
+                self.reasoner.metrics.end_iteration(projected_nodes=projection.size)
+                logger.info(f"Iteration {iteration}: projected {projection.size} nodes, inferred "
+                            f"{sum(len(nodes) for nodes in delta.labels.values())} labels, "
+                            f"{sum(len(keys) for keys in delta.relationships.values())} relationships, "
+                            f"{sum(len(nodes) for nodes, _ in delta.properties.values())} property values")
+                if not changed:
+                    logger.info(f"Convergence reached after {iteration} iterations")
+                    return
+        finally:
+            self.reasoner.end_run()
+        logger.warning(f"Stopped after {max_iterations} iterations without reaching convergence")
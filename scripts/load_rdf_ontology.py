@@ -1,8 +1,13 @@
 import os
+import re
+import argparse
+from datetime import date, datetime, time
+from decimal import Decimal
 from dotenv import load_dotenv
-from neo4j import GraphDatabase
 import rdflib
+from rdflib.util import guess_format
 import logging
+from connections import Neo4jConnection
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,59 +25,237 @@ NEO4J_DB_NAME = os.getenv('NEO4J_RDF_ONTOLOGY_NAME', 'neo4j')
 # TTL file path
 TTL_FILE = '../ontologies/movie_graph/movie_graph.ttl'
 
-class Neo4jConnection:
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+# Turtle chunks are parsed independently, so labelled blank nodes are rewritten
+# to IRIs under this prefix, and back, to keep their identity across chunks
+_BNODE_IRI = "urn:neoowl:bnode:"
+_BNODE_LABEL = re.compile(r"_:([A-Za-z0-9_](?:[\w.-]*[\w-])?)")
+_DIRECTIVE = re.compile(r"\s*(?:@prefix|@base|prefix|base)\b", re.I)
+# Literal values Neo4j can store natively; anything else is kept as its lexical form
+_NATIVE_TYPES = (bool, int, float, str, date, datetime, time)
+_MAX_INT = 2 ** 63 - 1
 
-    def close(self):
-        self.driver.close()
-
-    def session(self, database):
-        return self.driver.session(database=database)
-
-def delete_all(driver, database):
-    """Delete all nodes and relationships in the specified database."""
+def delete_all(driver, database, batch_size=10000):
+    """Delete all nodes and relationships in the specified database, in batches."""
     try:
         with driver.session(database=database) as session:
-            session.run("MATCH (n) DETACH DELETE n")
+            session.run("""MATCH (n)
+                CALL (n) {
+                    DETACH DELETE n
+                } IN TRANSACTIONS OF $batch_size ROWS""", batch_size=batch_size).consume()
         print(f"Cleared all data from database: {database}")
     except Exception as e:
         print(f"Error clearing database {database}: {e}")
         raise
 
-def ingest_ttl_to_neo4j(ttl_file, conn, database):
-    """Parse TTL and ingest as (:Triple)-[:SUBJECT|PREDICATE|OBJECT]->(:Resource)"""
-    g = rdflib.Graph()
-    try:
-        g.parse(ttl_file, format='turtle')
-        logger.info(f"Parsed {len(g)} triples from {ttl_file}")
-    except Exception as e:
-        logger.error(f"Failed to parse TTL: {e}")
-        return
+class _TurtleScanner:
+    """Track string literals and brackets across Turtle lines to find statement ends."""
+    def __init__(self):
+        self.long_quote = None
+        self.depth = 0
+
+    def scan(self, line):
+        """Return `line` with blank node labels rewritten, and whether it ends a statement."""
+        out, i, ended = [], 0, False
+        while i < len(line):
+            if self.long_quote:
+                j = i
+                while j < len(line) and not line.startswith(self.long_quote, j):
+                    j += 2 if line[j] == "\\" else 1
+                if j >= len(line):
+                    out.append(line[i:])
+                    return "".join(out), False
+                out.append(line[i:j + 3])
+                i, self.long_quote = j + 3, None
+                continue
+            char = line[i]
+            if char == "#":
+                break
+            if char == "<":
+                j = line.find(">", i)
+                j = len(line) - 1 if j < 0 else j
+                out.append(line[i:j + 1])
+                i, ended = j + 1, False
+                continue
+            if char in "\"'":
+                if line.startswith(char * 3, i):
+                    self.long_quote = char * 3
+                    out.append(self.long_quote)
+                    i, ended = i + 3, False
+                    continue
+                j = i + 1
+                while j < len(line) and line[j] != char:
+                    j += 2 if line[j] == "\\" else 1
+                out.append(line[i:j + 1])
+                i, ended = j + 1, False
+                continue
+            match = _BNODE_LABEL.match(line, i) if (i == 0 or line[i - 1] in " \t([,;") else None
+            if match:
+                out.append(f"<{_BNODE_IRI}{match.group(1)}>")
+                i, ended = match.end(), False
+                continue
+            if char in "[(":
+                self.depth += 1
+            elif char in "])":
+                self.depth -= 1
+            if char == "." and self.depth == 0 and (i + 1 == len(line) or line[i + 1].isspace()):
+                ended = True
+            elif not char.isspace():
+                ended = False
+            out.append(char)
+            i += 1
+        return "".join(out), ended
+
+def _restore_bnode(term):
+    if isinstance(term, rdflib.URIRef) and term.startswith(_BNODE_IRI):
+        return rdflib.BNode(term[len(_BNODE_IRI):])
+    return term
+
+def _turtle_chunks(file, chunk_size):
+    """Yield Turtle documents of about `chunk_size` statements, each starting with the earlier directives.
+
+    Directives also stay in place, so that a prefix redefined within a chunk
+    only applies to the statements after it.
+    """
+    scanner, header, body, statements, in_statement = _TurtleScanner(), [], [], 0, False
+    for line in file:
+        if not in_statement and not scanner.long_quote and _DIRECTIVE.match(line):
+            directive = line if line.endswith("\n") else line + "\n"
+            body.append(directive)
+            header.append(directive)
+            continue
+        line, ended = scanner.scan(line.rstrip("\n"))
+        body.append(line + "\n")
+        if ended and not scanner.long_quote:
+            statements, in_statement = statements + 1, False
+            if statements >= chunk_size:
+                yield "".join(body)
+                body, statements = list(header), 0
+        elif line.strip():
+            in_statement = True
+    if statements or in_statement:
+        yield "".join(body)
+
+def read_triples(path, rdf_format=None, chunk_size=100000):
+    """Yield the triples of an RDF file as lists of at most about `chunk_size` triples.
+
+    N-Triples and Turtle are parsed chunk by chunk, so no whole-file graph is
+    built; the N-Triples blank node labels are still remembered across chunks.
+    Other formats are parsed in one go.
+    """
+    rdf_format = rdf_format or guess_format(path) or "turtle"
+    if rdf_format == "nt":
+        bnode_context = {}
+        with open(path, "r", encoding="utf-8") as file:
+            lines = []
+            for line in file:
+                lines.append(line)
+                if len(lines) >= chunk_size:
+                    yield list(rdflib.Graph().parse(data="".join(lines), format="nt", bnode_context=bnode_context))
+                    lines = []
+            if lines:
+                yield list(rdflib.Graph().parse(data="".join(lines), format="nt", bnode_context=bnode_context))
+    elif rdf_format == "turtle":
+        with open(path, "r", encoding="utf-8") as file:
+            for document in _turtle_chunks(file, chunk_size):
+                graph = rdflib.Graph().parse(data=document, format="turtle")
+                yield [tuple(_restore_bnode(term) for term in triple) for triple in graph]
+    else:
+        triples = list(rdflib.Graph().parse(path, format=rdf_format))
+        for i in range(0, len(triples), chunk_size):
+            yield triples[i:i + chunk_size]
+
+def _literal_properties(literal):
+    """Node properties of a literal: its typed value, lexical form, datatype and language."""
+    value = literal.toPython()
+    if isinstance(value, Decimal):
+        value = float(value)
+    if not isinstance(value, _NATIVE_TYPES) or isinstance(value, rdflib.Literal) \
+            or (isinstance(value, int) and not isinstance(value, bool) and abs(value) > _MAX_INT):
+        value = str(literal)
+    return {"value": value, "lexical": str(literal),
+            "datatype": str(literal.datatype) if literal.datatype else None,
+            "language": literal.language}
+
+def create_schema(conn, database):
+    """Make resources unique by IRI, which also backs the resource MERGE with an index."""
+    with conn.session(database) as session:
+        session.run("CREATE CONSTRAINT resource_uri IF NOT EXISTS FOR (r:Resource) REQUIRE r.uri IS UNIQUE").consume()
+
+def ingest_ttl_to_neo4j(ttl_file, conn, database, batch_size=10000, chunk_size=100000, rdf_format=None):
+    """Load an RDF file as (:Triple)-[:SUBJECT|PREDICATE|OBJECT]->(:Resource|Literal)
+
+    Each chunk of triples is loaded in two phases: the terms not seen before
+    are deduplicated in Python and created with UNWIND (IRIs and blank nodes
+    as :Resource nodes, literals as typed :Literal nodes), then the triples
+    are created by matching their terms by element id. Only the parsing is
+    streamed: the element id of every distinct term and every distinct triple
+    loaded are kept until the end of the file, to deduplicate across chunks.
+    """
+    create_schema(conn, database)
+    element_ids, seen_triples = {}, set()
+    loaded = 0
+    with conn.session(database) as session:
+        for chunk in read_triples(ttl_file, rdf_format, chunk_size):
+            resources, literals = {}, {}
+            for triple in chunk:
+                for term in triple:
+                    if term in element_ids:
+                        continue
+                    if isinstance(term, rdflib.Literal):
+                        literals[term] = None
+                    else:
+                        resources[term] = None
+            resources, literals = list(resources), list(literals)
+            for i in range(0, len(resources), batch_size):
+                batch = resources[i:i + batch_size]
+                ids = session.execute_write(lambda tx: [record["id"] for record in tx.run(
+                    """UNWIND $uris AS uri
+                    MERGE (r:Resource {uri: uri})
+                    RETURN elementId(r) AS id""",
+                    uris=[term.n3() if isinstance(term, rdflib.BNode) else str(term) for term in batch])])
+                element_ids.update(zip(batch, ids))
+            for i in range(0, len(literals), batch_size):
+                batch = literals[i:i + batch_size]
+                ids = session.execute_write(lambda tx: [record["id"] for record in tx.run(
+                    """UNWIND $literals AS literal
+                    CREATE (l:Literal)
+                    SET l = literal
+                    RETURN elementId(l) AS id""",
+                    literals=[_literal_properties(term) for term in batch])])
+                element_ids.update(zip(batch, ids))
+
+            triples = []
+            for triple in chunk:
+                ids = tuple(element_ids[term] for term in triple)
+                if ids not in seen_triples:
+                    seen_triples.add(ids)
+                    triples.append(ids)
+            for i in range(0, len(triples), batch_size):
+                session.execute_write(lambda tx: tx.run(
+                    """UNWIND $triples AS triple
+                    MATCH (subj) WHERE elementId(subj) = triple[0]
+                    MATCH (pred) WHERE elementId(pred) = triple[1]
+                    MATCH (obj) WHERE elementId(obj) = triple[2]
+                    CREATE (t:Triple)
+                    CREATE (t)-[:SUBJECT]->(subj)
+                    CREATE (t)-[:PREDICATE]->(pred)
+                    CREATE (t)-[:OBJECT]->(obj)""",
+                    triples=triples[i:i + batch_size]).consume())
+            loaded += len(triples)
+            logger.info(f"Ingested {loaded} triples ({len(element_ids)} distinct terms) from {ttl_file}")
+    return loaded
 
-    triples = []
-    for s, p, o in g:
-        triples.append((str(s), str(p), str(o) if isinstance(o, rdflib.URIRef) else o.value))
-
-    # Batch size for UNWIND
-    batch_size = 1000
-    for i in range(0, len(triples), batch_size):
-        batch = triples[i:i + batch_size]
-        cypher = """
-        UNWIND $triples AS triple
-        MERGE (subj:Resource {uri: triple[0]}) # should be uri or litteral
-        MERGE (pred:Resource {uri: triple[1]})
-        MERGE (obj:Resource {uri: triple[2]})
-        CREATE (t:Triple)
-        CREATE (t)-[:SUBJECT]->(subj)
-        CREATE (t)-[:PREDICATE]->(pred)
-        CREATE (t)-[:OBJECT]->(obj)
-        """
-        with conn.session(database) as session:
-            session.run(cypher, triples=batch)
-        logger.info(f"Ingested batch {i//batch_size + 1} of {len(triples)//batch_size + 1}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load an RDF ontology as triples.")
+    parser.add_argument("file", nargs="?", default=TTL_FILE, help="RDF file to load (Turtle, N-Triples, ...)")
+    parser.add_argument("--format", help="rdflib format of the file, guessed from its extension by default")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per UNWIND transaction")
+    parser.add_argument("--chunk-size", type=int, default=100000,
+                        help="Statements parsed at a time from N-Triples and Turtle files")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     conn = Neo4jConnection(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
 
     try:
@@ -83,7 +266,8 @@ def main():
 
 
     try:
-        ingest_ttl_to_neo4j(TTL_FILE, conn, NEO4J_DB_NAME)
+        ingest_ttl_to_neo4j(args.file, conn, NEO4J_DB_NAME, batch_size=args.batch_size,
+                            chunk_size=args.chunk_size, rdf_format=args.format)
     except Exception as e:
         logger.error(f"Ingestion failed: {e}")
     finally:
@@ -1,9 +1,20 @@
 import os
-import time
+import signal
+import asyncio
 import logging
-from threading import Thread
-from neo4j import GraphDatabase
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, List
+from neo4j.exceptions import ClientError
 from dotenv import load_dotenv
+from connections import AsyncNeo4jConnection, Neo4jConnection
+from infer_to_convergence import NeoOWLReasoner as ConvergenceReasoner
+from batching import load_batch_settings
+from cdc_changes import ChangeSet, is_snapshot_write
+from cdc_checkpoint import DatabaseCheckpoint, FileCheckpoint
+from rule_dependencies import stratify
+from rule_metrics import RuleMetrics, log_to_file, merge_prometheus, prometheus_labels
+from retraction import Retraction
 
 # Configure logging
 logging.basicConfig(
@@ -25,222 +36,604 @@ NEO4J_URI_ONTOLOGY = os.getenv("NEO4J_URI_ONTOLOGY", NEO4J_URI)
 NEO4J_USERNAME_ONTOLOGY = os.getenv("NEO4J_USERNAME_ONTOLOGY", NEO4J_USERNAME)
 NEO4J_PASSWORD_ONTOLOGY = os.getenv("NEO4J_PASSWORD_ONTOLOGY", NEO4J_PASSWORD)
 NEO4J_ONTOLOGY_DB_NAME = os.getenv("NEO4J_ONTOLOGY_DB_NAME", "movie_ontology")
+NEOOWL_WORKERS = int(os.getenv("NEOOWL_WORKERS", "1"))
+NEOOWL_BATCH_CONFIG = os.getenv("NEOOWL_BATCH_CONFIG")
+NEOOWL_ADAPTIVE_BATCHING = os.getenv("NEOOWL_ADAPTIVE_BATCHING", "false").lower() == "true"
+NEOOWL_INCREMENTAL = os.getenv("NEOOWL_INCREMENTAL", "true").lower() == "true"
+NEOOWL_MAX_BATCH_WAIT = float(os.getenv("NEOOWL_MAX_BATCH_WAIT", "1.0"))
+NEOOWL_MAX_BATCH_SIZE = int(os.getenv("NEOOWL_MAX_BATCH_SIZE", "10000"))
+NEOOWL_QUEUE_SIZE = int(os.getenv("NEOOWL_QUEUE_SIZE", "100"))
+NEOOWL_MAX_BATCH_ATTEMPTS = int(os.getenv("NEOOWL_MAX_BATCH_ATTEMPTS", "5"))
+NEOOWL_CHECKPOINT_STORE = os.getenv("NEOOWL_CHECKPOINT_STORE", "file").lower()
+NEOOWL_CHECKPOINT_FILE = os.getenv("NEOOWL_CHECKPOINT_FILE", "neoowl_cdc_checkpoint.json")
+NEOOWL_CATCH_UP_BATCH_SIZE = int(os.getenv("NEOOWL_CATCH_UP_BATCH_SIZE", "100000"))
+NEOOWL_RULE_CACHE = os.getenv("NEOOWL_RULE_CACHE", ".neoowl_rule_cache")
+NEOOWL_ONTOLOGY_POLL_INTERVAL = float(os.getenv("NEOOWL_ONTOLOGY_POLL_INTERVAL", "30"))
+NEOOWL_METRICS_PORT = int(os.getenv("NEOOWL_METRICS_PORT", "9464"))
+NEOOWL_METRICS_LOG = os.getenv("NEOOWL_METRICS_LOG")
+NEOOWL_PROFILE = os.getenv("NEOOWL_PROFILE", "false").lower() == "true"
+NEOOWL_SLOW_RULE_THRESHOLD = os.getenv("NEOOWL_SLOW_RULE_THRESHOLD")
+NEOOWL_SLOW_RULE_DIR = os.getenv("NEOOWL_SLOW_RULE_DIR", "slow_rules")
+NEOOWL_VIRTUAL = [kind.strip() for kind in os.getenv("NEOOWL_VIRTUAL", "").split(",") if kind.strip()]
+NEOOWL_PROVISION_INDEXES = os.getenv("NEOOWL_PROVISION_INDEXES", "true").lower() == "true"
+NEOOWL_INDEX_TIMEOUT = float(os.getenv("NEOOWL_INDEX_TIMEOUT", "300"))
+NEOOWL_PROBE_RULES = os.getenv("NEOOWL_PROBE_RULES", "true").lower() == "true"
+NEOOWL_PARTITION_SIZE = int(os.getenv("NEOOWL_PARTITION_SIZE", "0")) or None
+NEOOWL_PLAN_RULES = os.getenv("NEOOWL_PLAN_RULES", "true").lower() == "true"
+# Comma-separated data_database:ontology_database pairs served by this process
+NEOOWL_TENANTS = os.getenv("NEOOWL_TENANTS", "")
 
-class Neo4jConnection:
-    """Manage Neo4j connections."""
-    def __init__(self, uri, username, password):
-        self.driver = GraphDatabase.driver(uri, auth=(username, password))
-
-    def close(self):
-        self.driver.close()
-
-    def session(self, database):
-        return self.driver.session(database=database)
-
-class NeoOWLReasoner:
-    """Forward-chaining reasoner for NeoOWL."""
-    def __init__(self, main_conn, ontology_conn):
-        self.main_conn = main_conn
-        self.ontology_conn = ontology_conn
-        self.rules = self._generate_all_rules()
-
-    def _generate_pattern_defined_label_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (mdl:PatternDefinedLabel)
-            RETURN mdl.name AS name, mdl.pattern AS pattern, mdl.classElementVariable AS classElementVariable""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH {record['pattern']}
-                    CALL ({record['classElementVariable']}) {{
-                        SET {record['classElementVariable']}:{record['name']}
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_pattern_defined_relationship_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (mdr:PatternDefinedRelationship)
-            RETURN mdr.name AS name, mdr.pattern AS pattern, mdr.sourceElementVariable AS sourceElementVariable, mdr.targetElementVariable AS targetElementVariable""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH {record['pattern']}
-                    CALL ({record['sourceElementVariable']}, {record['targetElementVariable']}) {{
-                        MERGE ({record['sourceElementVariable']})-[:{record['name']}]->({record['targetElementVariable']})
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_sco_label_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (narrower:Label)-[:SCO]->(broader:Label)
-            RETURN narrower.name AS narrower, broader.name AS broader""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n:{record['narrower']})
-                    CALL (n) {{
-                        SET n:{record['broader']}
-                    }} IN CONCURRENT TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_implies_relationship_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (narrower:Relationship)-[:IMPLIES]->(broader:Relationship)
-            RETURN narrower.name AS narrower, broader.name AS broader""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n)-[:{record['narrower']}]->(m)
-                    CALL (n, m) {{
-                        MERGE (n)-[:{record['broader']}]->(m)
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_equivalent_label_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (l1:Label)-[:EQUIVALENT]->(l2:Label)
-            RETURN l1.name AS l1, l2.name AS l2""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n:{record['l1']}|{record['l2']})
-                    CALL (n) {{
-                        SET n:{record['l1']}:{record['l2']}
-                    }} IN CONCURRENT TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_equivalent_relationship_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (r1:Relationship)-[:EQUIVALENT]->(r2:Relationship)
-            RETURN r1.name AS r1, r2.name AS r2""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n)-[:{record['r1']}|{record['r2']}]->(m)
-                    CALL (n, m) {{
-                        MERGE (n)-[:{record['r1']}]->(m)
-                        MERGE (n)-[:{record['r2']}]->(m)
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_symmetric_relationship_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (r:Relationship:Symmetric)
-            RETURN r.name AS sim_rel""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH (n)-[:{record['sim_rel']}]->(m)
-                    CALL (n, m) {{
-                        MERGE (m)-[:{record['sim_rel']}]->(n)
-                    }} IN TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_pattern_defined_property_rules(self):
-        records, _, _ = self.ontology_conn.driver.execute_query(
-            """MATCH (n:Label)-[:HAS_PROPERTY]->(qdp:PatternDefinedNodeProperty)
-            RETURN n.name AS label, qdp.name AS property_name, qdp.pattern AS pattern, qdp.propertyOwnerVariable AS variable, qdp.valueVariable AS val_variable""",
-            database_=NEO4J_ONTOLOGY_DB_NAME
-        )
-        return [f"""MATCH ({record['variable']}:{record['label']})
-                    CALL ({record['variable']}) {{
-                        MATCH {record['pattern']}
-                        WITH {record['variable']}, {record['val_variable']}
-                        WHERE {record['variable']}.{record['property_name']} IS NULL OR {record['variable']}.{record['property_name']} <> {record['val_variable']}
-                        SET {record['variable']}.{record['property_name']} = {record['val_variable']}
-                    }} IN CONCURRENT TRANSACTIONS OF 100 ROWS"""
-                for record in records]
-
-    def _generate_all_rules(self):
-        """Generate all inference rules."""
-        try:
-            rule_generators = [
-                self._generate_pattern_defined_label_rules,
-                self._generate_pattern_defined_relationship_rules,
-                self._generate_sco_label_rules,
-                self._generate_implies_relationship_rules,
-                self._generate_equivalent_label_rules,
-                self._generate_equivalent_relationship_rules,
-                self._generate_symmetric_relationship_rules,
-                self._generate_pattern_defined_property_rules
-            ]
-            all_rules = []
-            for gen in rule_generators:
-                all_rules.extend(gen())
-            logger.info(f"Generated {len(all_rules)} inference rules")
-            return all_rules
-        except Exception as e:
-            logger.error(f"Failed to generate rules: {e}")
-            raise
+class NeoOWLReasoner(ConvergenceReasoner):
+    """Forward-chaining reasoner for NeoOWL, sharing its rule compiler with infer_to_convergence."""
+    def update_rules(self, ontology=None):
+        new_rules = super().update_rules(ontology)
+        self.strata = stratify(self.rules)
+        self.ordered_rules = self.planner.order(self.rules) if self.planner else \
+            [rule for rules, _ in self.strata for rule in rules]
+        return new_rules
 
     def infer_once(self, params=None):
         """Apply all rules once."""
         params = params or {}
+        self.metrics.start_run("once")
         try:
-            with self.main_conn.session(NEO4J_DB_NAME) as session:
-                for rule in self.rules:
-                    session.run(rule, params)
+            with self.main_conn.session(self.database) as session:
+                self.run_rules(session, self.ordered_rules, params)
+            self.metrics.end_iteration()
             logger.info("Completed single-pass inference")
         except Exception as e:
             logger.error(f"Error during infer_once: {e}")
             raise
+        finally:
+            self.end_run()
+
+    def infer_incremental(self, changes, params=None, max_rounds=100):
+        """Apply only the rules affected by `changes`, cascading until a local fixpoint.
+
+        Rules whose inputs appear in the change set run anchored on the changed
+        element ids and report the facts they created, which become the change
+        set for downstream rules. Rules without an anchored form, or whose inputs
+        were changed by such a rule, fall back to a full run. Path-distance
+        rules repair their distances around the changed nodes, deletions
+        included.
+
+        Removed facts are handled first: the inferred facts they no longer
+        support are retracted, and count as removed facts too; facts the rules
+        still derive are restored, and count as additions. Pattern-defined
+        property rules reading a removed token run in full, which rewrites the
+        values the removal changed.
+        """
+        params = params or {}
+        pending = ChangeSet()
+        pending.update(changes)
+        rounds = runs = 0
+        self.metrics.start_run("incremental")
+        try:
+            with self.main_conn.session(self.database) as session:
+                read = {token for rule in self.rules for token in rule.reads}
+                removed = {fact for fact in changes.removed_facts if fact[0] in read}
+                if removed:
+                    pending.update(self._retract(session, removed))
+                while pending and rounds < max_rounds:
+                    rounds += 1
+                    current, pending = pending, ChangeSet()
+                    for position, rule in enumerate(self.ordered_rules):
+                        if rule.reads & current.full_tokens or (rule.reads & current.tokens
+                                                                and not (rule.anchored_query or rule.reachability)) \
+                                or (rule.kind == "pattern_property" and not rule.reachability
+                                    and rule.reads & current.removed_tokens):
+                            produced = self._run_full(session, rule, params)
+                        elif rule.reachability and rule.reads & (current.tokens | current.removed_tokens):
+                            produced = self._repair_distances(session, rule, current)
+                        elif rule.reads & current.tokens:
+                            produced = self._run_anchored(session, rule, current, params)
+                        else:
+                            continue
+                        runs += 1
+                        # Later rules see the new facts in this round; only rules
+                        # already passed (recursive strata) need another round.
+                        current.update(produced)
+                        written = produced.tokens | produced.full_tokens
+                        if any(earlier.reads & written for earlier in self.ordered_rules[:position + 1]):
+                            pending.update(produced)
+                    self.metrics.end_iteration(round=rounds)
+            if pending:
+                logger.warning(f"Incremental inference stopped after {max_rounds} rounds without reaching a fixpoint")
+            logger.info(f"Completed incremental inference: {runs} rule runs in {rounds} rounds")
+        except Exception as e:
+            logger.error(f"Error during infer_incremental: {e}")
+            raise
+        finally:
+            self.end_run()
+
+    def apply_rules(self, rules, params=None):
+        """Run newly added `rules` over the whole graph, then cascade what they inferred incrementally."""
+        params = params or {}
+        added = {id(rule) for rule in rules}
+        produced = ChangeSet()
+        self.metrics.start_run("apply_rules")
+        try:
+            with self.main_conn.session(self.database) as session:
+                for rule in self.ordered_rules:
+                    if id(rule) in added:
+                        produced.update(self._run_full(session, rule, params))
+            self.metrics.end_iteration()
+        finally:
+            self.end_run()
+        logger.info(f"Applied {len(rules)} new rules")
+        if produced:
+            self.infer_incremental(produced, params)
+
+    def _run_anchored(self, session, rule, changes, params):
+        anchored_params = {**params,
+                           "neoowl_node_ids": list(changes.node_ids),
+                           "neoowl_relationship_ids": list(changes.relationship_ids)}
+        query = self.metrics.query(rule, rule.anchored_query)
+
+        def run(tx):
+            result = tx.run(query, anchored_params)
+            return list(result), result.consume()
+
+        records, summary = session.execute_write(run)
+        self.metrics.record(rule.kind, rule.source, summary, len(records), query)
+        produced = ChangeSet()
+        for record in records:
+            produced.node_ids.update(record["nodes"])
+            if record["relationship"] is not None:
+                produced.relationship_ids.add(record["relationship"])
+        if records:
+            produced.tokens.update(rule.writes)
+        return produced
+
+    def _retract(self, session, removed_facts):
+        """Delete and rederive the consequences of `removed_facts`.
+
+        Returns a ChangeSet of the retracted facts, and of the restored ones as
+        additions to cascade.
+        """
+        retraction = Retraction(self.strata)
+        retracted, restored, relationship_ids = session.execute_write(retraction.run, removed_facts)
+        for kind, source, summary in retraction.summaries:
+            self.metrics.record(kind, source, summary)
+        produced = ChangeSet()
+        for token, element_ids in retracted:
+            produced.node_ids.update(element_ids)
+            produced.removed_tokens.add(token)
+            produced.removed_facts.add((token, element_ids))
+        for token, element_ids in restored:
+            produced.node_ids.update(element_ids)
+            produced.tokens.add(token)
+        produced.relationship_ids.update(relationship_ids)
+        return produced
+
+    def _repair_distances(self, session, rule, changes):
+        written, _ = self.run_distance_rule(session, rule, changes.node_ids)
+        return ChangeSet(node_ids=written, tokens=set(rule.writes)) if written else ChangeSet()
+
+    def _run_full(self, session, rule, params):
+        summary, = self.run_rules(session, [rule], params)
+        return ChangeSet(full_tokens=set(rule.writes)) if summary.counters.contains_updates else ChangeSet()
+
+@dataclass
+class ChangeBatch:
+    """A coalesced batch of CDC events, ready for one inference run."""
+    events: List[Any]
+    changes: ChangeSet
+    last_id: str
+    oldest_commit_time: Any = None
 
 class CDCService:
-    """Monitor CDC changes and trigger inference."""
-    def __init__(self, conn, reasoner, selectors=None, poll_interval=0.5):
+    """Monitor CDC changes and trigger inference.
+
+    Polling, batch planning and inference run as separate asyncio tasks joined
+    by bounded queues, so change capture keeps going while a batch is being
+    reasoned over, and a full queue slows polling down. The planner coalesces
+    events into batches of at most `max_batch_size` events or `max_batch_wait`
+    seconds. `cursor` only moves past a batch once its inference succeeded,
+    or failed `max_attempts` times with exponential backoff, in which case the
+    batch is logged as dead-lettered and skipped; it is then saved to
+    `checkpoint` (if any).
+
+    When resuming from a checkpoint the service starts in catch-up mode: the
+    backlog is read in pages of `catch_up_batch_size` events, each reasoned
+    over as one bulk batch, until a page comes back short. A checkpoint CDC
+    no longer accepts (e.g. older than the change log retention) triggers a
+    full inference run instead.
+
+    Every `ontology_poll_interval` seconds the ontology is re-read; when its
+    fingerprint changed the reasoner's rules are swapped between batches and
+    the new rules are applied to the existing graph.
+    """
+    def __init__(self, conn, reasoner, selectors=None, poll_interval=0.5, incremental=True,
+                 max_batch_wait=1.0, max_batch_size=10000, queue_size=100, retry_delay=1.0,
+                 max_attempts=5, checkpoint=None, catch_up_batch_size=100000, ontology_poll_interval=None):
         self.conn = conn
         self.reasoner = reasoner
         self.selectors = selectors or []
         self.poll_interval = poll_interval
-        self.cursor = self._get_current_change_id()
-
-    def _get_current_change_id(self):
-        with self.conn.session(NEO4J_DB_NAME) as session:
-            result = session.run("CALL db.cdc.current")
-            return result.single()["id"]
-
-    def _query_changes(self, tx):
-        current = self._get_current_change_id()
-        result = tx.run("CALL db.cdc.query($cursor, $selectors)",
-                        cursor=self.cursor, selectors=self.selectors)
-        changes = list(result)
-        if changes:
-            logger.info(f"Detected {len(changes)} changes")
-            self.reasoner.infer_once()
-            self.cursor = changes[-1]["id"]
+        self.incremental = incremental
+        self.max_batch_wait = max_batch_wait
+        self.max_batch_size = max_batch_size
+        self.queue_size = queue_size
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.checkpoint = checkpoint
+        self.catch_up_batch_size = catch_up_batch_size
+        self.catching_up = False
+        self.ontology_poll_interval = ontology_poll_interval
+        self.cursor = None
+        self.read_cursor = None
+        self.unprocessed_events = 0
+        self.metrics = {
+            "queue_depth": 0,
+            "last_batch_events": 0,
+            "last_batch_entities": 0,
+            "lag_seconds": 0.0,
+            "batches_processed": 0,
+            "events_processed": 0,
+            "batches_dead_lettered": 0,
+        }
+
+    async def _get_current_change_id(self):
+        async with self.conn.session(self.reasoner.database) as session:
+            result = await session.run("CALL db.cdc.current")
+            return (await result.single())["id"]
+
+    async def _query_changes(self, tx, limit=None):
+        current = await (await tx.run("CALL db.cdc.current")).single()
+        if limit is None:
+            result = await tx.run("CALL db.cdc.query($cursor, $selectors)",
+                                  cursor=self.read_cursor, selectors=self.selectors)
         else:
-            logger.debug("No new changes detected")
-            self.cursor = current
+            result = await tx.run("CALL db.cdc.query($cursor, $selectors) "
+                                  "YIELD id, txId, seq, metadata, event "
+                                  "RETURN id, txId, seq, metadata, event LIMIT $limit",
+                                  cursor=self.read_cursor, selectors=self.selectors, limit=limit)
+        return current["id"], [record async for record in result]
 
-    def run(self):
-        """Monitor CDC in a loop."""
-        logger.info("Starting CDC monitoring")
-        while True:
+    async def _cursor_is_valid(self, cursor):
+        try:
+            async with self.conn.session(self.reasoner.database) as session:
+                result = await session.run("CALL db.cdc.query($cursor) YIELD id RETURN id LIMIT 1", cursor=cursor)
+                await result.consume()
+            return True
+        except ClientError as e:
+            logger.warning(f"Checkpointed CDC cursor can no longer be used: {e}")
+            return False
+
+    async def _commit_cursor(self, cursor):
+        """Record that every change up to `cursor` has been reasoned over."""
+        if cursor == self.cursor:
+            return
+        self.cursor = cursor
+        if self.checkpoint:
             try:
-                with self.conn.session(NEO4J_DB_NAME) as session:
-                    session.execute_read(self._query_changes)
+                await asyncio.get_running_loop().run_in_executor(None, self.checkpoint.save, cursor)
+            except Exception as e:
+                logger.error(f"Failed to save CDC checkpoint: {e}")
+
+    async def _sleep(self, seconds):
+        """Sleep, waking up early on shutdown."""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _poll_loop(self):
+        logger.info(f"Starting CDC monitoring of {self.reasoner.database}")
+        while not self.stopping.is_set():
+            changes, full_page = [], False
+            try:
+                limit = self.catch_up_batch_size if self.catching_up else None
+                async with self.conn.session(self.reasoner.database) as session:
+                    current, changes = await session.execute_read(self._query_changes, limit)
+                full_page = limit is not None and len(changes) >= limit
+                if self.catching_up and not full_page:
+                    logger.info("Caught up with the CDC backlog, switching to low-latency polling")
+                    self.catching_up = False
+                # Only an empty page may skip ahead to the current change id: past
+                # a LIMITed page there can be more changes to read
+                self.read_cursor = changes[-1]["id"] if changes else current
+                changes = [change for change in changes if not is_snapshot_write(change)]
+                if changes:
+                    logger.debug(f"Detected {len(changes)} changes")
+                    self.unprocessed_events += len(changes)
+                    await self.events.put((changes, limit is not None))
+                else:
+                    logger.debug("No new changes detected")
+                    if not self.unprocessed_events:
+                        await self._commit_cursor(self.read_cursor)
             except Exception as e:
                 logger.error(f"CDC query error: {e}")
-            time.sleep(self.poll_interval)
+            self._update_queue_depth()
+            if not changes and not full_page:
+                await self._sleep(self.poll_interval)
+        await self.events.put(None)
 
-def main():
-    """Launch the NeoOWL CDC server."""
+    async def _plan_loop(self):
+        loop = asyncio.get_running_loop()
+        buffer, deadline, done = [], None, False
+        while not done:
+            timeout = None if not buffer else max(deadline - loop.time(), 0)
+            try:
+                item = await asyncio.wait_for(self.events.get(), timeout)
+            except asyncio.TimeoutError:
+                item = ([], False)
+            if item is None:
+                done = True
+            elif item[1]:
+                # A catch-up page is reasoned over as one bulk batch
+                await self.batches.put(self._make_batch(item[0]))
+            elif item[0]:
+                if not buffer:
+                    deadline = loop.time() + self.max_batch_wait
+                buffer.extend(item[0])
+            while buffer and (done or len(buffer) >= self.max_batch_size or loop.time() >= deadline):
+                events, buffer = buffer[:self.max_batch_size], buffer[self.max_batch_size:]
+                await self.batches.put(self._make_batch(events))
+                deadline = loop.time() + self.max_batch_wait
+            self._update_queue_depth()
+        await self.batches.put(None)
+
+    def _make_batch(self, events):
+        commit_time = (events[0]["metadata"] or {}).get("txCommitTime")
+        return ChangeBatch(events=events, changes=ChangeSet.from_cdc_records(events),
+                           last_id=events[-1]["id"],
+                           oldest_commit_time=commit_time.to_native() if commit_time is not None else None)
+
+    async def _inference_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.batches.get()
+            if batch is None:
+                break
+            if batch.oldest_commit_time is not None:
+                lag = datetime.now(timezone.utc) - batch.oldest_commit_time
+                self.metrics["lag_seconds"] = max(lag.total_seconds(), 0.0)
+            entities = len(batch.changes.node_ids) + len(batch.changes.relationship_ids)
+            logger.info(f"Processing batch of {len(batch.events)} changes in {self.reasoner.database} "
+                        f"touching {entities} entities "
+                        f"({self.unprocessed_events - len(batch.events)} still queued)")
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    async with self.inference_lock:
+                        await loop.run_in_executor(None, self._infer, batch.changes)
+                    break
+                except Exception as e:
+                    if self.stopping.is_set():
+                        logger.error(f"Inference failed during shutdown, cursor left at {self.cursor}: {e}")
+                        await self._discard_batches()
+                        return
+                    if attempt >= self.max_attempts:
+                        logger.error(f"Inference failed {attempt} times, dead-lettering the batch of "
+                                     f"{len(batch.events)} changes {batch.events[0]['id']} to {batch.last_id} "
+                                     f"in {self.reasoner.database}: {e}")
+                        self.metrics["batches_dead_lettered"] += 1
+                        break
+                    logger.error(f"Inference failed (attempt {attempt} of {self.max_attempts}), retrying batch: {e}")
+                    await self._sleep(self.retry_delay * 2 ** (attempt - 1))
+            await self._commit_cursor(batch.last_id)
+            self.unprocessed_events -= len(batch.events)
+            self.metrics.update(last_batch_events=len(batch.events), last_batch_entities=entities)
+            self.metrics["batches_processed"] += 1
+            self.metrics["events_processed"] += len(batch.events)
+            if not self.unprocessed_events:
+                self.metrics["lag_seconds"] = 0.0
+            self._update_queue_depth()
+            logger.debug(f"CDC metrics: {self.metrics}")
+
+    async def _discard_batches(self):
+        """Drop the planned batches until the planner is done, so that it never blocks on a full queue."""
+        while await self.batches.get() is not None:
+            pass
+
+    def _infer(self, changes):
+        if self.incremental:
+            self.reasoner.infer_incremental(changes)
+        else:
+            self.reasoner.infer_once()
+
+    async def _ontology_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._sleep(self.ontology_poll_interval)
+            if self.stopping.is_set():
+                break
+            try:
+                ontology = await loop.run_in_executor(None, self.reasoner.load_ontology)
+                async with self.inference_lock:
+                    new_rules = await loop.run_in_executor(None, self.reasoner.update_rules, ontology)
+                    if new_rules:
+                        logger.info(f"Ontology changed, applying {len(new_rules)} new rules")
+                        await loop.run_in_executor(None, self._apply_rules, new_rules)
+            except Exception as e:
+                logger.error(f"Ontology refresh failed: {e}")
+
+    def _apply_rules(self, rules):
+        if self.incremental:
+            self.reasoner.apply_rules(rules)
+        else:
+            self.reasoner.infer_once()
+
+    def _update_queue_depth(self):
+        self.metrics["queue_depth"] = self.unprocessed_events
+
+    def prometheus(self):
+        """The service metrics, followed by the reasoner's rule metrics, in the Prometheus text format.
+
+        Every sample is labelled with the database, so several services can
+        be served together (see rule_metrics.merge_prometheus).
+        """
+        labels = {"database": self.reasoner.database}
+        gauges = {"queue_depth", "last_batch_events", "last_batch_entities", "lag_seconds"}
+        lines = []
+        for name, value in self.metrics.items():
+            metric, kind = (name, "gauge") if name in gauges else (f"{name}_total", "counter")
+            lines.extend([f"# TYPE neoowl_cdc_{metric} {kind}",
+                          f"neoowl_cdc_{metric}{{{prometheus_labels(labels).rstrip(',')}}} {value}"])
+        return "\n".join(lines) + "\n" + self.reasoner.metrics.prometheus(labels)
+
+    async def _resume(self):
+        """Start from the checkpoint, or from the current change id if there is none."""
+        loop = asyncio.get_running_loop()
+        saved = await loop.run_in_executor(None, self.checkpoint.load) if self.checkpoint else None
+        if saved and await self._cursor_is_valid(saved):
+            logger.info(f"Resuming from checkpointed CDC cursor {saved}, catching up")
+            self.cursor = saved
+            self.catching_up = True
+            return
+        current = await self._get_current_change_id()
+        if saved:
+            # Changes since the checkpoint are lost: reason over the whole graph once
+            logger.info("Running full inference to make up for the lost CDC backlog")
+            await loop.run_in_executor(None, self.reasoner.infer_to_convergence)
+        await self._commit_cursor(current)
+
+    def stop(self):
+        """Stop polling; already captured changes are still reasoned over before run() returns."""
+        logger.info(f"Stopping CDC monitoring of {self.reasoner.database}")
+        self.stopping.set()
+
+    async def run(self):
+        """Run the polling, planning and inference tasks until stop() is called."""
+        self.stopping = asyncio.Event()
+        self.events = asyncio.Queue(maxsize=self.queue_size)
+        self.batches = asyncio.Queue(maxsize=self.queue_size)
+        self.inference_lock = asyncio.Lock()
+        if self.cursor is None:
+            await self._resume()
+        self.read_cursor = self.cursor
+        loops = [self._poll_loop(), self._plan_loop(), self._inference_loop()]
+        if self.ontology_poll_interval:
+            loops.append(self._ontology_loop())
+        tasks = [asyncio.ensure_future(loop) for loop in loops]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # A failing task takes the others down, so that none outlives run()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+async def serve_metrics(port, render):
+    """Serve the text returned by `render()` at http://<host>:`port`/metrics for Prometheus to scrape."""
+    async def handle(reader, writer):
+        try:
+            request = (await reader.readline()).split()
+            while (await reader.readline()).strip():
+                pass  # headers
+            if len(request) > 1 and request[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, port=port)
+    logger.info(f"Serving Prometheus metrics on port {port}")
+    return server
+
+def tenants():
+    """The (data database, ontology database) pairs to serve: NEOOWL_TENANTS, or the single configured pair."""
+    pairs = [tuple(name.strip() for name in pair.split(":")) for pair in NEOOWL_TENANTS.split(",") if pair.strip()]
+    for pair in pairs:
+        if len(pair) != 2 or not all(pair):
+            raise ValueError(f"NEOOWL_TENANTS entries must be data_database:ontology_database, got {':'.join(pair)}")
+    return pairs or [(NEO4J_DB_NAME, NEO4J_ONTOLOGY_DB_NAME)]
+
+def create_service(main_conn, ontology_conn, cdc_conn, database, ontology_database):
+    """A reasoner and CDC service for one (data database, ontology database) pair, on shared connections."""
+    if NEOOWL_CHECKPOINT_STORE == "database" and (NEO4J_URI_ONTOLOGY, ontology_database) == (NEO4J_URI, database):
+        # Every checkpoint write would come back as a CDC change, and trigger another one
+        raise ValueError(f"NEOOWL_CHECKPOINT_STORE=database needs an ontology database other than the "
+                         f"monitored {database} on {NEO4J_URI}; use the file store instead")
+    reasoner = NeoOWLReasoner(main_conn, ontology_conn, workers=NEOOWL_WORKERS,
+                              batch_settings=load_batch_settings(NEOOWL_BATCH_CONFIG),
+                              adaptive_batching=NEOOWL_ADAPTIVE_BATCHING, rule_cache=NEOOWL_RULE_CACHE or None,
+                              metrics=RuleMetrics(profile=NEOOWL_PROFILE,
+                                                  slow_rule_threshold=float(NEOOWL_SLOW_RULE_THRESHOLD)
+                                                  if NEOOWL_SLOW_RULE_THRESHOLD else None,
+                                                  slow_rule_dir=NEOOWL_SLOW_RULE_DIR),
+                              virtual=NEOOWL_VIRTUAL,
+                              index_timeout=NEOOWL_INDEX_TIMEOUT if NEOOWL_PROVISION_INDEXES else None,
+                              probe_rules=NEOOWL_PROBE_RULES, partition_size=NEOOWL_PARTITION_SIZE,
+                              plan_rules=NEOOWL_PLAN_RULES, database=database, ontology_database=ontology_database)
+    if NEOOWL_CHECKPOINT_STORE == "database":
+        checkpoint = DatabaseCheckpoint(ontology_conn, ontology_database, database)
+    elif NEOOWL_CHECKPOINT_STORE == "file":
+        checkpoint = FileCheckpoint(NEOOWL_CHECKPOINT_FILE, database)
+    else:
+        checkpoint = None
+    return CDCService(cdc_conn, reasoner, incremental=NEOOWL_INCREMENTAL,
+                      max_batch_wait=NEOOWL_MAX_BATCH_WAIT, max_batch_size=NEOOWL_MAX_BATCH_SIZE,
+                      queue_size=NEOOWL_QUEUE_SIZE, max_attempts=NEOOWL_MAX_BATCH_ATTEMPTS, checkpoint=checkpoint,
+                      catch_up_batch_size=NEOOWL_CATCH_UP_BATCH_SIZE,
+                      ontology_poll_interval=NEOOWL_ONTOLOGY_POLL_INTERVAL)
+
+async def run_service(service):
+    """Run one tenant's CDC service, logging its failure instead of taking the other tenants down."""
+    try:
+        await service.run()
+    except Exception as e:
+        logger.error(f"CDC service for {service.reasoner.database} failed: {e}")
+
+async def serve():
+    """Launch the NeoOWL CDC server and run it until interrupted.
+
+    One CDC service runs per tenant (see tenants()), all of them sharing the
+    connection pools.
+    """
+    main_conn = ontology_conn = cdc_conn = metrics_server = None
+    if NEOOWL_METRICS_LOG:
+        log_to_file(NEOOWL_METRICS_LOG)
     try:
         # Initialize connections
         main_conn = Neo4jConnection(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
-        ontology_conn = Neo4jConnection(NEO4J_URI_ONTOLOGY, NEO4J_USERNAME_ONTOLOGY, NEO4J_PASSWORD_ONTOLOGY)
+        ontology_conn = main_conn if (NEO4J_URI_ONTOLOGY, NEO4J_USERNAME_ONTOLOGY) == (NEO4J_URI, NEO4J_USERNAME) \
+            else Neo4jConnection(NEO4J_URI_ONTOLOGY, NEO4J_USERNAME_ONTOLOGY, NEO4J_PASSWORD_ONTOLOGY)
+        cdc_conn = AsyncNeo4jConnection(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
         logger.info("Connected to Neo4j databases")
 
-        # Setup reasoner and CDC service
-        reasoner = NeoOWLReasoner(main_conn, ontology_conn)
-        cdc_service = CDCService(main_conn, reasoner)
-
-        # Run CDC monitoring in a separate thread
-        cdc_thread = Thread(target=cdc_service.run, daemon=True)
-        cdc_thread.start()
-        logger.info("NeoOWL server running")
+        # Setup a reasoner and CDC service per tenant
+        services = [create_service(main_conn, ontology_conn, cdc_conn, database, ontology_database)
+                    for database, ontology_database in tenants()]
 
-        # Keep main thread alive
-        cdc_thread.join()
+        # Shut down gracefully on Ctrl-C / SIGTERM
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, lambda: [service.stop() for service in services])
+            except NotImplementedError:
+                pass
+        if NEOOWL_METRICS_PORT:
+            metrics_server = await serve_metrics(NEOOWL_METRICS_PORT,
+                                                 lambda: merge_prometheus(service.prometheus() for service in services))
+        logger.info(f"NeoOWL server running for {', '.join(service.reasoner.database for service in services)}")
+        await asyncio.gather(*(run_service(service) for service in services))
     except Exception as e:
         logger.error(f"Server startup failed: {e}")
     finally:
-        main_conn.close()
-        ontology_conn.close()
+        if metrics_server:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        if cdc_conn:
+            await cdc_conn.close()
+        if main_conn:
+            main_conn.close()
+        if ontology_conn and ontology_conn is not main_conn:
+            ontology_conn.close()
         logger.info("Server shut down")
 
+def main():
+    """Launch the NeoOWL CDC server."""
+    asyncio.run(serve())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
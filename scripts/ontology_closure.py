@@ -0,0 +1,131 @@
+"""In-memory closure of the NeoOWL SCO / IMPLIES / EQUIVALENT hierarchies."""
+from collections import defaultdict
+
+
+class UnionFind:
+    """Disjoint sets of names, used to group EQUIVALENT labels and types."""
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def groups(self):
+        groups = defaultdict(set)
+        for item in list(self.parent):
+            groups[self.find(item)].add(item)
+        return groups
+
+
+def strongly_connected_components(graph):
+    """Return the SCCs of `graph` (node -> iterable of successors), sinks first.
+
+    Iterative Tarjan, so the order of the result is a reverse topological order
+    of the condensed graph: every component comes after all components it reaches.
+    """
+    nodes = set(graph)
+    for successors in graph.values():
+        nodes.update(successors)
+    index, lowlink, on_stack = {}, {}, set()
+    stack, components = [], []
+    counter = 0
+    for root in sorted(nodes):
+        if root in index:
+            continue
+        work = [(root, iter(sorted(graph.get(root, ()))))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, successors = work[-1]
+            advanced = False
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = lowlink[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(sorted(graph.get(succ, ())))))
+                    advanced = True
+                    break
+                if succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(sorted(component))
+    return components
+
+
+def hierarchy_closure(edges, equivalences=()):
+    """Map every name to the set of names it implies, itself excluded.
+
+    `edges` are (narrower, broader) pairs (SCO or IMPLIES) and `equivalences`
+    are (a, b) pairs (EQUIVALENT). Equivalent names, and names on an edge
+    cycle, are collapsed with union-find; the condensed DAG is then walked in
+    topological order so each class inherits the ancestors of its parents.
+    """
+    classes = UnionFind()
+    for a, b in list(edges) + list(equivalences):
+        classes.find(a)
+        classes.find(b)
+    for a, b in equivalences:
+        classes.union(a, b)
+
+    graph = defaultdict(set)
+    for narrower, broader in edges:
+        graph[classes.find(narrower)].add(classes.find(broader))
+    for component in strongly_connected_components(graph):
+        for member in component[1:]:
+            classes.union(component[0], member)
+
+    members = classes.groups()
+    dag = {root: set() for root in members}
+    for narrower, broader in edges:
+        source, target = classes.find(narrower), classes.find(broader)
+        if source != target:
+            dag[source].add(target)
+
+    implied = {}
+    for component in strongly_connected_components(dag):
+        root = component[0]
+        reached = set(members[root])
+        for parent in dag[root]:
+            reached |= implied[parent]
+        implied[root] = reached
+
+    return {name: implied[classes.find(name)] - {name}
+            for name in classes.parent}
+
+
+def split_hierarchy(records):
+    """Group (edge, is_relationship, a, b) hierarchy records into label / relationship edges and equivalences."""
+    hierarchy = {"label_edges": [], "label_equivalences": [],
+                 "relationship_edges": [], "relationship_equivalences": []}
+    for record in records:
+        kind = "relationship" if record['is_relationship'] else "label"
+        group = "equivalences" if record['edge'] == "EQUIVALENT" else "edges"
+        hierarchy[f"{kind}_{group}"].append((record['a'], record['b']))
+    return hierarchy
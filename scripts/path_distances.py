@@ -0,0 +1,195 @@
+"""Path-distance properties: detection, multi-source BFS and incremental distance repair.
+
+A pattern-defined property like `SHORTEST 1 (x)-[v:COACTOR]-*(y:_KevinBacon)
+WITH size(v) AS value` holds the hop distance from its owner to the nearest
+target node. Rather than one shortest-path search per owner, all distances are
+computed by one breadth-first search walking from the target set, and kept in
+memory so that later changes to the relationships or to the target set only
+repair the distances they affect.
+"""
+import re
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# SHORTEST 1 (x)-[v:TYPE]-*(y:Label) [WITH v LIMIT 1] WITH size(v) AS value
+_REACHABILITY = re.compile(
+    r"^\s*SHORTEST\s+1\s+\((\w+)\)\s*(<?)-\[(\w+):(\w+)\]-(>?)\s*\*\s*\((\w+):(\w+)\)"
+    r"\s+(?:WITH\s+\3\s+LIMIT\s+1\s+)?WITH\s+size\(\3\)\s+AS\s+(\w+)\s*$", re.I)
+
+_UNREACHED = float("inf")
+
+
+@dataclass
+class ReachabilityRule:
+    """A pattern-defined property holding the hop distance from its owner to the nearest `target_label` node."""
+    owner_label: str
+    property_name: str
+    relationship_type: str
+    direction: str
+    target_label: str
+
+
+def reachability_rule(record):
+    """Recognize a pattern_properties ontology record as a ReachabilityRule, or return None."""
+    match = _REACHABILITY.match(record['pattern'] or "")
+    if not match or match.group(1) != record['variable'] or match.group(8) != record['val_variable']:
+        return None
+    incoming, outgoing = match.group(2), match.group(5)
+    if incoming and outgoing:
+        return None
+    direction = "outgoing" if outgoing else "incoming" if incoming else "both"
+    return ReachabilityRule(record['label'], record['property_name'], match.group(4), direction, match.group(7))
+
+
+def _batches(items, batch_size):
+    items = list(items)
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
+class PathDistances:
+    """The distances of one ReachabilityRule, computed by multi-source BFS and repaired incrementally.
+
+    `distances` maps the element id of every node reaching a target, owner or
+    not, to its hop count; it is None until the first `compute`. Owners the
+    search no longer reaches lose the property.
+    """
+    def __init__(self, rule):
+        self.rule = rule
+        self.distances = None
+        # One hop away from the targets, and one hop towards them
+        forward, backward = f"-[:{rule.relationship_type}]->", f"<-[:{rule.relationship_type}]-"
+        if rule.direction == "outgoing":
+            outward, inward = backward, forward
+        elif rule.direction == "incoming":
+            outward, inward = forward, backward
+        else:
+            outward = inward = f"-[:{rule.relationship_type}]-"
+        self.outward_query = self._step_query(outward)
+        self.inward_query = self._step_query(inward)
+        self.targets_query = f"MATCH (y:{rule.target_label}) RETURN elementId(y) AS id"
+        self.owners_query = f"""MATCH (x:{rule.owner_label}) WHERE x.{rule.property_name} IS NOT NULL
+            RETURN elementId(x) AS id"""
+        self.write_query = f"""UNWIND $rows AS row
+            MATCH (x:{rule.owner_label}) WHERE elementId(x) = row[0]
+            WITH x, row
+            WHERE x.{rule.property_name} <> row[1] OR (x.{rule.property_name} IS NULL) <> (row[1] IS NULL)
+            SET x.{rule.property_name} = row[1]
+            RETURN elementId(x) AS id"""
+
+    def _step_query(self, step):
+        return f"""UNWIND $ids AS id
+            MATCH (a) WHERE elementId(a) = id
+            OPTIONAL MATCH (a){step}(b)
+            RETURN id, a:{self.rule.target_label} AS target, collect(DISTINCT elementId(b)) AS neighbours"""
+
+    @staticmethod
+    def _run(session, query, summaries, write=False, **params):
+        def work(tx):
+            result = tx.run(query, params)
+            return list(result), result.consume()
+
+        records, summary = (session.execute_write if write else session.execute_read)(work)
+        summaries.append(summary)
+        return records
+
+    def _expand(self, session, query, ids, batch_size, summaries):
+        """{id: (is a target, neighbour ids)} of the existing nodes among `ids`."""
+        expanded = {}
+        for batch in _batches(ids, batch_size):
+            for record in self._run(session, query, summaries, ids=batch):
+                expanded[record["id"]] = (record["target"], record["neighbours"])
+        return expanded
+
+    def _write(self, session, rows, batch_size, summaries):
+        written = set()
+        for batch in _batches(rows, batch_size):
+            written.update(record["id"] for record in self._run(session, self.write_query, summaries,
+                                                                  write=True, rows=batch))
+        return written
+
+    def compute(self, session, batch_size=10000):
+        """Recompute every distance with one BFS from the targets and write the owners that changed.
+
+        Returns the element ids of the owners written and the summaries of
+        every statement run.
+        """
+        summaries = []
+        frontier = [record["id"] for record in self._run(session, self.targets_query, summaries)]
+        distances = dict.fromkeys(frontier, 0)
+        hops = 0
+        while frontier:
+            hops += 1
+            reached = {node for _, neighbours in self._expand(session, self.outward_query, frontier,
+                                                               batch_size, summaries).values()
+                       for node in neighbours}
+            frontier = [node for node in reached if node not in distances]
+            distances.update(dict.fromkeys(frontier, hops))
+        stale = [record["id"] for record in self._run(session, self.owners_query, summaries)
+                 if record["id"] not in distances]
+        self.distances = distances
+        rows = [[node, hops] for node, hops in distances.items()] + [[node, None] for node in stale]
+        written = self._write(session, rows, batch_size, summaries)
+        logger.info(f"Computed {self.rule.owner_label}.{self.rule.property_name}: {len(distances)} nodes "
+                    f"reach {self.rule.target_label} in at most {max(hops - 1, 0)} hops, "
+                    f"{len(written)} owners updated")
+        return written, summaries
+
+    def repair(self, session, node_ids, batch_size=10000):
+        """Repair the distances after the nodes `node_ids` (or their relationships or labels) changed.
+
+        Nodes left without a neighbour one hop closer to a target lose their
+        distance, in increasing distance order so that the loss cascades away
+        from the targets. The lost nodes and the changed ones then get a
+        tentative distance from their remaining neighbours, which spreads
+        level by level as long as it shortens a distance. Falls back to
+        `compute` before the first full run. Returns like `compute`.
+        """
+        if self.distances is None:
+            return self.compute(session, batch_size)
+        distances, summaries = self.distances, []
+
+        lost, levels = set(), defaultdict(set)
+        for node in node_ids:
+            if node in distances:
+                levels[distances[node]].add(node)
+        while levels:
+            hops = min(levels)
+            nodes = levels.pop(hops)
+            inward = self._expand(session, self.inward_query, nodes, batch_size, summaries)
+            unsupported = []
+            for node in nodes:
+                target, parents = inward.get(node, (False, []))
+                if not (hops == 0 and target) and not any(distances.get(parent) == hops - 1 for parent in parents):
+                    unsupported.append(node)
+                    lost.add(node)
+                    del distances[node]
+            for _, children in self._expand(session, self.outward_query, unsupported, batch_size, summaries).values():
+                levels[hops + 1].update(child for child in children if distances.get(child) == hops + 1)
+
+        queue = defaultdict(set)
+        for node, (target, parents) in self._expand(session, self.inward_query, lost | set(node_ids),
+                                                     batch_size, summaries).items():
+            hops = 0 if target else min((distances[parent] + 1 for parent in parents if parent in distances),
+                                        default=_UNREACHED)
+            if hops < distances.get(node, _UNREACHED):
+                queue[hops].add(node)
+        changed = set(lost)
+        while queue:
+            hops = min(queue)
+            nodes = [node for node in queue.pop(hops) if hops < distances.get(node, _UNREACHED)]
+            for node in nodes:
+                distances[node] = hops
+            changed.update(nodes)
+            for _, children in self._expand(session, self.outward_query, nodes, batch_size, summaries).values():
+                queue[hops + 1].update(child for child in children if hops + 1 < distances.get(child, _UNREACHED))
+
+        # The changed nodes may have just become owners of an unchanged distance
+        rows = [[node, distances.get(node)] for node in changed | set(node_ids)]
+        written = self._write(session, rows, batch_size, summaries)
+        logger.info(f"Repaired {self.rule.owner_label}.{self.rule.property_name}: {len(lost)} distances lost, "
+                    f"{len(changed)} changed, {len(written)} owners updated")
+        return written, summaries
@@ -0,0 +1,270 @@
+"""Query-time answering of NeoOWL hierarchy inferences by rewriting Cypher queries.
+
+Instead of materializing superclass labels, implied relationships and the
+reverse of symmetric relationships, a query can be rewritten to look for
+what implies them:
+
+    MATCH (p:Person)-[:INVOLVED_IN]->(m)   becomes
+    MATCH (p:(Person|Actor|Director))-[:INVOLVED_IN|ACTED_IN|DIRECTED]->(m)
+
+Only reading clauses (MATCH, WHERE, WITH, RETURN, subqueries, ...) are
+rewritten; patterns written by CREATE, MERGE, SET and REMOVE are left alone.
+"""
+import re
+import sys
+import logging
+import argparse
+from collections import defaultdict
+
+from ontology_closure import hierarchy_closure, split_hierarchy
+
+logger = logging.getLogger(__name__)
+
+# Rule kinds whose inferences a rewriter can answer at query time
+VIRTUAL_KINDS = ("sco", "implies", "symmetric")
+
+_TOKEN = re.compile(r"""(?P<space>\s+)
+    |(?P<comment>//[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<name>`[^`]*`|[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<punct>::|\.\.|.)""", re.S | re.X)
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_READ_CLAUSES = {"MATCH", "OPTIONAL", "WHERE", "WITH", "RETURN", "UNWIND", "YIELD", "UNION", "ORDER"}
+_WRITE_CLAUSES = {"CREATE", "MERGE", "SET", "REMOVE", "DELETE", "DETACH", "FOREACH"}
+_SUBQUERY_KEYWORDS = {"EXISTS", "COUNT", "COLLECT", "CALL"}
+_SKIPPED = {"space", "comment"}
+
+
+def _quote(name):
+    return name if _IDENTIFIER.match(name) else f"`{name}`"
+
+
+def _unquote(name):
+    return name[1:-1] if name.startswith("`") else name
+
+
+def _below(closure):
+    """Invert a hierarchy closure: map each name to the names that imply it."""
+    below = defaultdict(set)
+    for narrower, broader in closure.items():
+        for name in broader:
+            below[name].add(narrower)
+    return below
+
+
+class QueryRewriter:
+    """Rewrite Cypher so it sees the SCO / EQUIVALENT, IMPLIES and Symmetric facts that are not materialized.
+
+    `ontology` holds the sections returned by NeoOWLReasoner.load_ontology().
+    For the kinds listed in `virtual`, every label is widened to itself, its
+    subclasses and its equivalent labels; every relationship type to itself
+    and the types implying it; and a relationship pattern whose types are all
+    symmetric loses its direction.
+    """
+    def __init__(self, ontology, virtual=VIRTUAL_KINDS):
+        self.virtual = set(virtual)
+        hierarchy = split_hierarchy(ontology['hierarchy'])
+        self.labels_below = _below(hierarchy_closure(hierarchy["label_edges"], hierarchy["label_equivalences"])) \
+            if "sco" in self.virtual else {}
+        self.types_below = _below(hierarchy_closure(hierarchy["relationship_edges"],
+                                                    hierarchy["relationship_equivalences"])) \
+            if "implies" in self.virtual else {}
+        self.symmetric = {record['sim_rel'] for record in ontology['symmetric']} \
+            if "symmetric" in self.virtual else set()
+
+    def label_expression(self, name):
+        """The label expression matching every node that has label `name`, materialized or not."""
+        return self._widen(name, self.labels_below, parenthesize=True)
+
+    def _widen(self, name, below, parenthesize):
+        names = [name] + sorted(below.get(name, ()))
+        if len(names) == 1:
+            return _quote(name)
+        union = "|".join(map(_quote, names))
+        return f"({union})" if parenthesize else union
+
+    def rewrite(self, query):
+        """Return `query` rewritten to also match the virtual facts."""
+        tokens = [(match.lastgroup, match.group()) for match in _TOKEN.finditer(query)]
+        _Rewrite(self, tokens).run()
+        return "".join(text for _, text in tokens)
+
+
+class _Rewrite:
+    """One pass over the tokens of a query, rewriting them in place."""
+    def __init__(self, rewriter, tokens):
+        self.rewriter = rewriter
+        self.tokens = tokens
+        self.relationship_variables = set()
+        # One frame per open brace: the clause mode, and whether the brace is a map literal
+        self.frames = [{"mode": "read", "map": False}]
+
+    def _next(self, i):
+        """Index of the first significant token at or after `i`."""
+        while i < len(self.tokens) and self.tokens[i][0] in _SKIPPED:
+            i += 1
+        return i
+
+    def _previous(self, i):
+        """Index of the last significant token before `i`, or -1."""
+        i -= 1
+        while i >= 0 and self.tokens[i][0] in _SKIPPED:
+            i -= 1
+        return i
+
+    def _text(self, i):
+        return self.tokens[i][1] if 0 <= i < len(self.tokens) else ""
+
+    def run(self):
+        i = 0
+        while i < len(self.tokens):
+            kind, text = self.tokens[i]
+            frame = self.frames[-1]
+            if kind == "name" and not text.startswith("`") and self._text(self._previous(i)) != ".":
+                if text.upper() in _READ_CLAUSES:
+                    frame["mode"] = "read"
+                elif text.upper() in _WRITE_CLAUSES:
+                    frame["mode"] = "write"
+            elif text == "{":
+                previous = self._text(self._previous(i))
+                subquery = previous == ")" or previous.upper() in _SUBQUERY_KEYWORDS
+                self.frames.append({"mode": frame["mode"], "map": not subquery})
+            elif text == "}" and len(self.frames) > 1:
+                self.frames.pop()
+            elif text == "[" and self._text(self._previous(i)) == "-" and frame["mode"] == "read":
+                i = self._relationship(i)
+                continue
+            elif text == ":" and frame["mode"] == "read" and not self._is_map_key(i):
+                i = self._label_predicate(i)
+                continue
+            i += 1
+
+    def _is_map_key(self, i):
+        if not self.frames[-1]["map"]:
+            return False
+        before = self._previous(i)
+        return self.tokens[before][0] == "name" and self._text(self._previous(before)) in ("{", ",")
+
+    def _label_predicate(self, i):
+        """Widen the label expression following the `:` at `i` (a node pattern or a label predicate)."""
+        owner = self._previous(i)
+        if self._text(owner) != "(" and self.tokens[owner][0] != "name":
+            return i + 1
+        if _unquote(self._text(owner)) in self.relationship_variables:
+            below, relationship = self.rewriter.types_below, True
+        else:
+            below, relationship = self.rewriter.labels_below, False
+        end, atoms, operators = self._expression(i + 1)
+        if any(_unquote(self._text(atom)) in below for atom, _ in atoms):
+            for atom, _ in atoms:
+                self.tokens[atom] = ("name", self.rewriter._widen(_unquote(self._text(atom)), below, True))
+            if not relationship:
+                # Colon conjunctions cannot be mixed with | in label expressions
+                for operator in operators:
+                    if self._text(operator) == ":":
+                        self.tokens[operator] = ("punct", "&")
+        return end
+
+    def _relationship(self, i):
+        """Widen the type expression of the relationship pattern opening at `i`, and undirect it if symmetric."""
+        close, depth = i, 0
+        while close < len(self.tokens):
+            depth += {"[": 1, "]": -1}.get(self._text(close), 0)
+            if depth == 0:
+                break
+            close += 1
+        j = self._next(i + 1)
+        if j < close and self.tokens[j][0] == "name":
+            self.relationship_variables.add(_unquote(self._text(j)))
+            j = self._next(j + 1)
+        if self._text(j) != ":" or j > close:
+            return i + 1
+        end, atoms, operators = self._expression(j + 1)
+        names = [_unquote(self._text(atom)) for atom, _ in atoms]
+        negated = any(negation for _, negation in atoms)
+        only_unions = all(self._text(operator) in ("|", ":") for operator in operators)
+        for atom, _ in atoms:
+            self.tokens[atom] = ("name", self.rewriter._widen(_unquote(self._text(atom)), self.rewriter.types_below,
+                                                             parenthesize=negated or not only_unions))
+        for operator in operators:
+            if self._text(operator) == ":":
+                self.tokens[operator] = ("punct", "")  # the legacy |:TYPE form
+        symmetric = self.rewriter.symmetric
+        if names and not negated and only_unions and all(name in symmetric for name in names):
+            self._undirect(i, close)
+        elif any(name in symmetric for queried in names
+                 for name in [queried, *self.rewriter.types_below.get(queried, ())]):
+            logger.warning(f"Relationship pattern over {'|'.join(names)} mixes symmetric and directed types; "
+                           f"reverse edges of the symmetric ones are not matched")
+        return end
+
+    def _undirect(self, open_bracket, close_bracket):
+        left = self._previous(self._previous(open_bracket))
+        if self._text(left) == "<":
+            self.tokens[left] = ("punct", "")
+        right = self._next(self._next(close_bracket + 1) + 1)
+        if self._text(self._next(close_bracket + 1)) == "-" and self._text(right) == ">":
+            self.tokens[right] = ("punct", "")
+
+    def _expression(self, i):
+        """Parse the label / type expression starting at `i`.
+
+        Returns the index right after it, its (atom index, negated) pairs and
+        the indexes of its binary operators.
+        """
+        atoms, operators, depth, expect_atom, negated = [], [], 0, True, False
+        end = i
+        while True:
+            j = self._next(i)
+            text = self._text(j)
+            if expect_atom:
+                if text == "!":
+                    negated = True
+                elif text == "(":
+                    depth += 1
+                elif text == "%":
+                    expect_atom = False
+                elif j < len(self.tokens) and self.tokens[j][0] == "name":
+                    atoms.append((j, negated))
+                    negated, expect_atom = False, False
+                else:
+                    return end, atoms, operators
+            elif text == ")" and depth > 0:
+                depth -= 1
+            elif text in ("|", "&", ":"):
+                operators.append(j)
+                expect_atom = True
+                if text == "|" and self._text(self._next(j + 1)) == ":":
+                    j = self._next(j + 1)
+                    operators.append(j)
+            else:
+                return end, atoms, operators
+            i = end = j + 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rewrite a Cypher query to answer hierarchy inferences "
+                                                 "at query time instead of reading materialized facts.")
+    parser.add_argument("query", nargs="?", help="Cypher query to rewrite (read from stdin if omitted)")
+    parser.add_argument("--virtual", nargs="+", choices=VIRTUAL_KINDS, default=list(VIRTUAL_KINDS),
+                        help="Inference kinds to answer at query time")
+    return parser.parse_args()
+
+
+def main():
+    from infer_to_convergence import (NEO4J_ONTOLOGY_DB_NAME, NEO4J_PASSWORD_ONTOLOGY, NEO4J_URI_ONTOLOGY,
+                                      NEO4J_USERNAME_ONTOLOGY, ONTOLOGY_QUERY, Neo4jConnection)
+    args = parse_args()
+    query = args.query or sys.stdin.read()
+    conn = Neo4jConnection(NEO4J_URI_ONTOLOGY, NEO4J_USERNAME_ONTOLOGY, NEO4J_PASSWORD_ONTOLOGY)
+    try:
+        records, _, _ = conn.driver.execute_query(ONTOLOGY_QUERY, database_=NEO4J_ONTOLOGY_DB_NAME)
+        print(QueryRewriter(records[0].data(), args.virtual).rewrite(query))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Provenance of inferred facts and their incremental retraction by delete-and-rederive (DRed).
+
+Inferred labels are listed in a node property and inferred relationships
+carry the rule that created them (their justification), so that retraction
+never touches asserted facts. When facts are removed, every stratum looks for
+the inferred facts its rules may have derived from them (`dependents_query`)
+and checks whether any rule writing them still derives them (`support_query`).
+Facts no recursive stratum writes cannot support themselves, so for them the
+check is exact and only the unsupported ones are deleted. Facts a recursive
+stratum writes may support each other, so they are deleted first, cascading
+through the stratum, and whatever the remaining graph still supports is
+restored once it has. Removed facts the rules still derive are restored too.
+"""
+import re
+import logging
+from collections import defaultdict
+
+from rule_dependencies import label, pattern_tokens, relationship_type
+
+logger = logging.getLogger(__name__)
+
+INFERRED_LABELS_PROPERTY = "_neoowl_inferred_labels"
+INFERRED_PROPERTY = "_neoowl_inferred"
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_QUANTIFIER = re.compile(r"[*+]|\{\s*\d*\s*,\s*\d*\s*\}|\{\s*\d+\s*\}")
+_RELATIONSHIP = re.compile(r"\[([^\]]*)\]")
+_HOP = re.compile(r"\)\s*<?-+>?\s*\(")
+
+HOLDING_LABELS_QUERY = """UNWIND $facts AS fact
+                    MATCH (x) WHERE elementId(x) = fact[1] AND fact[0] IN labels(x)
+                    RETURN fact"""
+HOLDING_RELATIONSHIPS_QUERY = """UNWIND $facts AS fact
+                    MATCH (s) WHERE elementId(s) = fact[1]
+                    MATCH (t) WHERE elementId(t) = fact[2]
+                    WITH fact, s, t WHERE EXISTS { MATCH (s)-[r]->(t) WHERE type(r) = fact[0] }
+                    RETURN fact"""
+
+
+def cypher_string(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def cypher_list(values):
+    return f"[{', '.join(cypher_string(value) for value in values)}]"
+
+
+def justification(kind, source):
+    """The Cypher string recorded on the relationships a `kind` rule compiled from `source` creates."""
+    return cypher_string(f"{kind}:{source}")
+
+
+def mark_labels(variable, names):
+    """A SET clause listing the labels of `names` that `variable` lacks as inferred, to run before setting them."""
+    inferred = f"coalesce({variable}.{INFERRED_LABELS_PROPERTY}, [])"
+    return (f"SET {variable}.{INFERRED_LABELS_PROPERTY} = {inferred} + [name IN {cypher_list(names)} "
+            f"WHERE NOT name IN labels({variable}) AND NOT name IN {inferred}]")
+
+
+def pattern_reach(pattern):
+    """(hops, types) bounding the path from any element of `pattern` to its variables.
+
+    `hops` is None when the pattern is quantified, `types` None when a
+    relationship of any type can be on the path.
+    """
+    text = _STRING_LITERAL.sub("''", pattern or "")
+    bodies, outside = _RELATIONSHIP.findall(text), _RELATIONSHIP.sub("", text)
+    if _QUANTIFIER.search(outside) or any("*" in body for body in bodies):
+        return None, None
+    hops = len(_HOP.findall(outside))
+    if hops > len(bodies) or any(":" not in body for body in bodies):
+        return hops, None
+    return hops, sorted(name for kind, name in pattern_tokens(pattern) if kind == "type")
+
+
+def _nearby(hops, types):
+    """Clauses binding `x` to every node within `hops` of the nodes of $neoowl_facts."""
+    expansion = "WITH removed AS x" if hops == 0 else \
+        f"MATCH (removed)-[{':' + '|'.join(types) if types else ''}*0..{hops}]-(x)"
+    return f"""UNWIND $neoowl_facts AS fact
+                    UNWIND fact AS id
+                    MATCH (removed) WHERE elementId(removed) = id
+                    {expansion}
+                    WITH DISTINCT x"""
+
+
+def label_dependents_query(names, hops=0, types=None):
+    """A query returning the inferred `names` labels (name, [node] fact) that may depend on $neoowl_facts."""
+    nodes = f"MATCH (x:{'|'.join(names)})" if hops is None else _nearby(hops, types)
+    return f"""{nodes}
+                    UNWIND [name IN coalesce(x.{INFERRED_LABELS_PROPERTY}, [])
+                            WHERE name IN {cypher_list(names)} AND name IN labels(x)] AS name
+                    RETURN name, [elementId(x)] AS fact"""
+
+
+def relationship_dependents_query(names, hops=0, types=None, reverse=False):
+    """A query returning the inferred `names` relationships (name, [start, end] fact) that may depend on $neoowl_facts.
+
+    With no `hops` the dependents join the same nodes as the removed facts,
+    in reverse order if `reverse`.
+    """
+    types_expression = "|".join(names)
+    if hops == 0:
+        start, end = ("fact[1]", "fact[0]") if reverse else ("fact[0]", "fact[1]")
+        return f"""UNWIND $neoowl_facts AS fact
+                    MATCH (s)-[f:{types_expression}]->(t)
+                    WHERE elementId(s) = {start} AND elementId(t) = {end} AND f.{INFERRED_PROPERTY} IS NOT NULL
+                    RETURN type(f) AS name, [elementId(s), elementId(t)] AS fact"""
+    match = f"MATCH (s)-[f:{types_expression}]->(t)" if hops is None else f"""{_nearby(hops, types)}
+                    MATCH (x)-[f:{types_expression}]-()
+                    WITH DISTINCT f, startNode(f) AS s, endNode(f) AS t"""
+    return f"""{match}
+                    WHERE f.{INFERRED_PROPERTY} IS NOT NULL
+                    RETURN type(f) AS name, [elementId(s), elementId(t)] AS fact"""
+
+
+def label_support_query(variable, condition):
+    """A query returning the [node] facts of $neoowl_facts whose node, bound to `variable`, satisfies `condition`."""
+    return f"""UNWIND $neoowl_facts AS fact
+                    MATCH ({variable}) WHERE elementId({variable}) = fact[0]
+                    WITH fact, {variable} WHERE {condition}
+                    RETURN fact"""
+
+
+def relationship_support_query(source, target, condition):
+    """A query returning the [start, end] facts of $neoowl_facts whose nodes satisfy `condition`.
+
+    The start and end nodes are bound to `source` and `target`.
+    """
+    return f"""UNWIND $neoowl_facts AS fact
+                    MATCH ({source}) WHERE elementId({source}) = fact[0]
+                    MATCH ({target}) WHERE elementId({target}) = fact[1]
+                    WITH fact, {source}, {target} WHERE {condition}
+                    RETURN fact"""
+
+
+class Retraction:
+    """One delete-and-rederive run over rule `strata` (see rule_dependencies.stratify).
+
+    Facts are (token, element ids) pairs: (label, (node,)) or
+    (relationship type, (start, end)). `run` is a transaction function;
+    the summary of every statement it ran is kept in `summaries` as
+    (kind, source, summary) for the metrics.
+    """
+    def __init__(self, strata):
+        self.strata = strata
+        self.writers = defaultdict(list)
+        # Tokens facts can support each other through, and the last stratum writing each token
+        self.recursive_tokens, self.last_writer = set(), {}
+        for i, (rules, recursive) in enumerate(strata):
+            for rule in rules:
+                if not rule.support_query:
+                    continue
+                for token in rule.writes:
+                    self.writers[token].append(rule)
+                    self.last_writer[token] = i
+                    if recursive:
+                        self.recursive_tokens.add(token)
+        self.summaries = []
+
+    def _run(self, tx, query, kind, source, **params):
+        result = tx.run(query, params)
+        records = list(result)
+        self.summaries.append((kind, source, result.consume()))
+        return records
+
+    def _holding(self, tx, facts):
+        holding = set()
+        for kind, query in (("label", HOLDING_LABELS_QUERY), ("type", HOLDING_RELATIONSHIPS_QUERY)):
+            rows = [[token[1], *ids] for token, ids in facts if token[0] == kind]
+            if rows:
+                holding.update(((kind, record["fact"][0]), tuple(record["fact"][1:]))
+                               for record in self._run(tx, query, "retraction", "holding", facts=rows))
+        return holding
+
+    def _dependents(self, tx, rules, removed):
+        dependents = set()
+        for rule in rules:
+            facts = [list(ids) for token, ids in removed if token in rule.reads]
+            if not rule.dependents_query or not facts:
+                continue
+            for record in self._run(tx, rule.dependents_query, rule.kind, rule.source, neoowl_facts=facts):
+                token = label(record["name"])
+                if token not in rule.writes:
+                    token = relationship_type(record["name"])
+                dependents.add((token, tuple(record["fact"])))
+        return dependents
+
+    def _supported(self, tx, facts):
+        """Map the `facts` some rule still derives to the first such rule."""
+        by_token, supported = defaultdict(set), {}
+        for token, ids in facts:
+            by_token[token].add(ids)
+        for token, pending in by_token.items():
+            for rule in self.writers[token]:
+                if not pending:
+                    break
+                for record in self._run(tx, rule.support_query, rule.kind, rule.source,
+                                        neoowl_facts=[list(ids) for ids in pending]):
+                    ids = tuple(record["fact"])
+                    if ids in pending:
+                        pending.discard(ids)
+                        supported[(token, ids)] = rule
+        return supported
+
+    def _delete(self, tx, facts):
+        by_token = defaultdict(list)
+        for token, ids in facts:
+            by_token[token].append(list(ids))
+        for (kind, name), rows in by_token.items():
+            if kind == "label":
+                query = f"""UNWIND $facts AS fact
+                    MATCH (x) WHERE elementId(x) = fact[0]
+                    REMOVE x:{name}
+                    SET x.{INFERRED_LABELS_PROPERTY} = [inferred IN x.{INFERRED_LABELS_PROPERTY}
+                                                        WHERE inferred <> {cypher_string(name)}]"""
+            else:
+                query = f"""UNWIND $facts AS fact
+                    MATCH (s)-[f:{name}]->(t)
+                    WHERE elementId(s) = fact[0] AND elementId(t) = fact[1] AND f.{INFERRED_PROPERTY} IS NOT NULL
+                    DELETE f"""
+            self._run(tx, query, "retraction", name, facts=rows)
+
+    def _restore(self, tx, supported):
+        """Recreate the `supported` facts as inferred; return the element ids of the relationships created."""
+        created = set()
+        by_rule = defaultdict(list)
+        for (token, ids), rule in supported.items():
+            by_rule[(token, rule.kind, rule.source)].append(list(ids))
+        for ((kind, name), rule_kind, source), rows in by_rule.items():
+            if kind == "label":
+                query = f"""UNWIND $facts AS fact
+                    MATCH (x) WHERE elementId(x) = fact[0]
+                    {mark_labels('x', [name])}
+                    SET x:{name}"""
+            else:
+                query = f"""UNWIND $facts AS fact
+                    MATCH (s) WHERE elementId(s) = fact[0]
+                    MATCH (t) WHERE elementId(t) = fact[1]
+                    CREATE (s)-[f:{name}]->(t)
+                    SET f.{INFERRED_PROPERTY} = {justification(rule_kind, source)}
+                    RETURN elementId(f) AS relationship"""
+            created.update(record["relationship"] for record in self._run(tx, query, rule_kind, source, facts=rows))
+        return created
+
+    def run(self, tx, removed_facts):
+        """Retract the consequences of `removed_facts`; return (retracted facts, restored facts, restored relationship ids).
+
+        Removed facts that hold again (e.g. recreated since) are ignored;
+        removed facts the rules still derive are restored as inferred. Restored
+        facts can enable inferences that were retracted meanwhile, so they have
+        to be cascaded like additions.
+        """
+        self.summaries = []
+        removed = set(removed_facts)
+        removed -= self._holding(tx, removed)
+        overdeleted = {fact for fact in removed if fact[0] in self.writers}
+        retracted, restored, relationships = set(), set(), set()
+        for i, (rules, recursive) in enumerate(self.strata):
+            while True:
+                candidates = self._dependents(tx, rules, removed) - removed
+                if not candidates:
+                    break
+                cyclic = {fact for fact in candidates if fact[0] in self.recursive_tokens}
+                unsupported = candidates - cyclic - set(self._supported(tx, candidates - cyclic))
+                self._delete(tx, unsupported | cyclic)
+                removed |= unsupported | cyclic
+                retracted |= unsupported
+                overdeleted |= cyclic
+                if not recursive:
+                    break
+            # Rederive once every stratum writing them has run; restored
+            # facts can support further ones
+            ready = {fact for fact in overdeleted if self.last_writer[fact[0]] <= i}
+            overdeleted -= ready
+            while ready:
+                supported = self._supported(tx, ready)
+                if not supported:
+                    break
+                relationships |= self._restore(tx, supported)
+                ready -= set(supported)
+                removed -= set(supported)
+                restored |= set(supported)
+            retracted |= ready
+        retracted -= set(removed_facts)
+        logger.info(f"Retracted {len(retracted)} inferred facts after {len(removed_facts)} removals, "
+                    f"restored {len(restored)}")
+        return retracted, restored, relationships
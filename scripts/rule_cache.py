@@ -0,0 +1,50 @@
+"""On-disk cache of compiled NeoOWL rules, keyed by a fingerprint of what they were compiled from."""
+import os
+import json
+import hashlib
+import logging
+from dataclasses import asdict
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the generated Cypher changes, so stale cache entries are ignored
+COMPILER_VERSION = 7
+
+
+def fingerprint(*parts):
+    """A content hash of JSON-serializable `parts` and the compiler version."""
+    payload = json.dumps([COMPILER_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RuleCache:
+    """Compiled rules stored as one JSON file per fingerprint in `directory`."""
+    def __init__(self, directory, rule_type):
+        self.directory = directory
+        self.rule_type = rule_type
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        """Return the rules cached under `key`, or None."""
+        try:
+            with open(self._path(key), "r") as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable rule cache entry {key}: {e}")
+            return None
+        return [self.rule_type(**{**entry,
+                                  "reads": frozenset(tuple(token) for token in entry["reads"]),
+                                  "writes": frozenset(tuple(token) for token in entry["writes"])})
+                for entry in entries]
+
+    def save(self, key, rules):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = [{**asdict(rule), "reads": sorted(rule.reads), "writes": sorted(rule.writes)} for rule in rules]
+        temporary = f"{self._path(key)}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(entries, file)
+        os.replace(temporary, self._path(key))
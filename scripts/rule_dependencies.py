@@ -0,0 +1,165 @@
+"""Static read/write analysis of NeoOWL rules and their stratification."""
+import re
+from collections import defaultdict
+
+from ontology_closure import strongly_connected_components
+
+NAME = r"(?:[A-Za-z_][A-Za-z0-9_]*|`[^`]+`)"
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_RELATIONSHIP_PATTERN = re.compile(r"\[([^\]]*)\]")
+_MAP_KEY = re.compile(rf"([{{,]\s*)({NAME})\s*:(?!:)")
+_PROPERTY_ACCESS = re.compile(rf"\.({NAME})")
+_OPERAND = rf"[!(\s]*{NAME}\s*\)*"
+_TOKEN_EXPRESSION = re.compile(rf"(?<!:):(?!:)\s*({_OPERAND}(?:\s*[|&:]\s*{_OPERAND})*)")
+_ELEMENT_PATTERN = re.compile(rf"(?<![\w`])([(\[])\s*({NAME})?\s*"
+                              rf"(?::(?!:)\s*({_OPERAND}(?:\s*[|&:]\s*{_OPERAND})*))?\s*"
+                              rf"(\{{[^{{}}]*\}})?(?=\s*(?:[)\]*]|WHERE\b))")
+_SET_CLAUSE = re.compile(r"\bSET\b[^\n}]*", re.I)
+_NEGATION = re.compile(r"\bNOT\s*$", re.I)
+_SEEKABLE_PREDICATE = re.compile(rf"(?<![\w.`])({NAME})\.({NAME})\s*(?:<=|>=|=(?!~)|<(?!>)|>|IN\b|STARTS\s+WITH\b)",
+                                 re.I)
+
+
+def label(name):
+    return ("label", name)
+
+
+def relationship_type(name):
+    return ("type", name)
+
+
+def node_property(name):
+    return ("property", name)
+
+
+def _names(expression):
+    return {name.strip().lstrip("!( ").rstrip(") ").strip("`")
+            for name in re.split(r"[|&:]", expression) if name.strip()}
+
+
+def pattern_tokens(pattern):
+    """Return the labels, relationship types and properties a Cypher pattern reads."""
+    if not pattern:
+        return set()
+    text = _STRING_LITERAL.sub("''", pattern)
+    tokens = set()
+
+    def relationship(match):
+        body = match.group(1)
+        tokens.update(node_property(key.strip("`")) for _, key in _MAP_KEY.findall(body))
+        body = _MAP_KEY.sub(r"\1", body)
+        for expression in _TOKEN_EXPRESSION.findall(body):
+            tokens.update(relationship_type(name) for name in _names(expression))
+        return "[]"
+
+    text = _RELATIONSHIP_PATTERN.sub(relationship, text)
+    tokens.update(node_property(key.strip("`")) for _, key in _MAP_KEY.findall(text))
+    text = _MAP_KEY.sub(r"\1", text)
+    tokens.update(node_property(key.strip("`")) for key in _PROPERTY_ACCESS.findall(text))
+    text = _PROPERTY_ACCESS.sub("", text)
+    for expression in _TOKEN_EXPRESSION.findall(text):
+        tokens.update(label(name) for name in _names(expression))
+    return tokens
+
+
+def property_filters(query):
+    """Return the (entity, labels or types, property) filters of a Cypher query an index could serve.
+
+    `entity` is "node" or "relationship". Filters come from property maps in
+    patterns and from equality, range, IN and STARTS WITH predicates on a
+    pattern variable; the labels or types are empty when the element has none.
+    """
+    text = _STRING_LITERAL.sub("''", query)
+    variables, filters = {}, set()
+    for match in _ELEMENT_PATTERN.finditer(text):
+        if _NEGATION.search(text, 0, match.start()):
+            # A negated label predicate, such as a rule's own output, narrows no seek
+            continue
+        bracket, variable, expression, properties = match.groups("")
+        entity = "node" if bracket == "(" else "relationship"
+        tokens = frozenset(_names(expression)) if expression else frozenset()
+        if variable:
+            variable = variable.strip("`")
+            previous = variables.get(variable, (entity, frozenset()))[1]
+            variables[variable] = (entity, previous | tokens)
+        filters.update((entity, tokens, key.strip("`")) for _, key in _MAP_KEY.findall(properties))
+    for variable, key in _SEEKABLE_PREDICATE.findall(_SET_CLAUSE.sub("", text)):
+        if variable.strip("`") in variables:
+            entity, tokens = variables[variable.strip("`")]
+            filters.add((entity, tokens, key.strip("`")))
+    return filters
+
+
+def dependency_graph(rules):
+    """Map each rule index to the indexes of the rules that read what it writes."""
+    readers = defaultdict(set)
+    for i, rule in enumerate(rules):
+        for token in rule.reads:
+            readers[token].add(i)
+    return {i: {reader for token in rule.writes for reader in readers[token]}
+            for i, rule in enumerate(rules)}
+
+
+def stratify(rules):
+    """Split rules into strata in topological order.
+
+    Each stratum is a (rules, recursive) pair: the rules of one strongly
+    connected component of the dependency graph, and whether that component
+    contains a cycle and therefore has to be iterated to a fixpoint.
+    """
+    graph = dependency_graph(rules)
+    strata = []
+    for component in reversed(strongly_connected_components(graph)):
+        recursive = len(component) > 1 or component[0] in graph[component[0]]
+        strata.append(([rules[i] for i in component], recursive))
+    return strata
+
+
+_KEYWORDS = {"true", "false", "null", "not", "and", "or", "xor"}
+_NODE_PATTERN = re.compile(r"(?<![\w`])\(\s*([A-Za-z_]\w*)?(?=\s*[:{)])")
+
+
+def _top_level_spans(text):
+    """Yield (start, end) spans of `text` outside braces and string literals."""
+    depth, start, quote = 0, 0, None
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote and text[i - 1] != "\\":
+                quote = None
+            continue
+        if char in "'\"":
+            quote = char
+        elif char == "{":
+            if depth == 0:
+                yield start, i
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                start = i + 1
+    if depth == 0:
+        yield start, len(text)
+
+
+def anchor_variables(pattern):
+    """Name the anonymous top-level nodes of a pattern and list its top-level node variables.
+
+    Returns the rewritten pattern and the variables an anchored evaluation can
+    bind to changed nodes. Nodes that only appear inside EXISTS { } subqueries
+    or map literals are not anchors.
+    """
+    variables, counter = [], iter(range(len(pattern)))
+
+    def name_node(match):
+        name = match.group(1) or f"_neoowl_n{next(counter)}"
+        if name.lower() not in _KEYWORDS and name not in variables:
+            variables.append(name)
+        return f"({name}"
+
+    pieces, last = [], 0
+    for start, end in _top_level_spans(pattern):
+        pieces.append(pattern[last:start])
+        pieces.append(_NODE_PATTERN.sub(name_node, pattern[start:end]))
+        last = end
+    pieces.append(pattern[last:])
+    return "".join(pieces), variables
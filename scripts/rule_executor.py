@@ -0,0 +1,142 @@
+"""Concurrent execution of non-conflicting NeoOWL rules, or of the partitions of one rule, over a pool of sessions."""
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from connections import NEO4J_MAX_RETRIES, NEO4J_RETRY_DELAY, retry
+from rule_metrics import COUNTERS
+
+logger = logging.getLogger(__name__)
+
+
+def write_locks(rule):
+    """Tokens a rule must hold exclusively while it runs.
+
+    Relationship MERGEs and property SETs on the same token can race (duplicate
+    relationships, lost updates), so they conflict. Adding a label is idempotent,
+    so label writes never conflict; the resulting node-lock deadlocks are transient
+    and retried.
+    """
+    return {token for token in rule.writes if token[0] != "label"}
+
+
+def schedule_waves(rules):
+    """Group rules into waves of mutually non-conflicting rules.
+
+    Each rule goes into the first wave after the last wave holding a rule it
+    conflicts with, or a rule writing a token it reads, so conflicting rules
+    keep their original relative order and a rule sees what the rules before
+    it inferred, as when they run one after another.
+    """
+    waves, wave_locks, wave_writes = [], [], []
+    for rule in rules:
+        locks = write_locks(rule)
+        target = 0
+        for i, (held, written) in enumerate(zip(wave_locks, wave_writes)):
+            if locks & held or rule.reads & written:
+                target = i + 1
+        if target == len(waves):
+            waves.append([])
+            wave_locks.append(set())
+            wave_writes.append(set())
+        waves[target].append(rule)
+        wave_locks[target] |= locks
+        wave_writes[target] |= rule.writes
+    return waves
+
+
+def _probe(tx, probe, params):
+    result = tx.run(probe, params)
+    return result.single(strict=False) is not None, result.consume()
+
+
+def _run(session, query, params):
+    result = session.run(query, params)
+    record = result.single(strict=False)
+    return (record["rows"] if record else 0), result.consume()
+
+
+def run_rule(session, query, params, probe=None, max_retries=NEO4J_MAX_RETRIES, retry_delay=NEO4J_RETRY_DELAY):
+    """Run one rule on `session` and return (rows driven, result summary).
+
+    With a `probe` (see rule_optimizer.probe_query), the probe runs first in a
+    read transaction, and when it finds nothing to do the rule is skipped and
+    the probe's summary returned. Transient failures of the rule statement
+    are retried with backoff (see connections.retry).
+    """
+    if probe:
+        found, summary = session.execute_read(_probe, probe, params)
+        if not found:
+            return 0, summary
+    return retry(lambda: _run(session, query, params), max_retries, retry_delay, "rule")
+
+
+class PartitionedSummary:
+    """The result summaries of the partitions of one rule run, merged into one.
+
+    Counters are summed, the time is the wall time of the whole run, and the
+    PROFILE plans, if any, become the children of a single plan.
+    """
+    def __init__(self, summaries, seconds):
+        self.counters = SimpleNamespace(
+            contains_updates=any(summary.counters.contains_updates for summary in summaries),
+            **{counter: sum(getattr(summary.counters, counter) for summary in summaries) for counter in COUNTERS})
+        self.result_available_after = int(seconds * 1000)
+        self.result_consumed_after = 0
+        plans = [summary.profile for summary in summaries if summary.profile]
+        self.profile = {"operatorType": "Partitions", "dbHits": 0, "children": plans} if plans else None
+
+
+class ParallelRuleExecutor:
+    """Run rules concurrently, one session per worker, serializing conflicting rules."""
+    def __init__(self, conn, database, max_workers=4, max_retries=NEO4J_MAX_RETRIES, retry_delay=NEO4J_RETRY_DELAY):
+        self.conn = conn
+        self.database = database
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _run_rule(self, query, params, probe=None):
+        with self.conn.session(self.database) as session:
+            return run_rule(session, query, params, probe, self.max_retries, self.retry_delay)
+
+    def run(self, rules, params_for, query_for=lambda rule: rule.query, probe_for=lambda rule: None,
+            failed=lambda rule: None):
+        """Run `rules` and return their (rows, summary) results, in rule order.
+
+        A rule whose run raises is passed to `failed` before the error is.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for wave in schedule_waves(rules):
+                futures = {id(rule): pool.submit(self._run_rule, query_for(rule), params_for(rule), probe_for(rule))
+                           for rule in wave}
+                for rule in wave:
+                    try:
+                        results[id(rule)] = futures[id(rule)].result()
+                    except Exception:
+                        failed(rule)
+                        raise
+        return [results[id(rule)] for rule in rules]
+
+    def run_partitioned(self, query, params, partitions, probe=None):
+        """Run `query` once per partition, concurrently, and return the merged (rows, summary).
+
+        `partitions` is called for the lists of element ids to bind as
+        $neoowl_partition_ids. With a `probe`, it first runs on the whole rule
+        and the partitions are skipped when it finds nothing to do.
+        """
+        started = time.perf_counter()
+        if probe:
+            with self.conn.session(self.database) as session:
+                found, summary = session.execute_read(_probe, probe, params)
+            if not found:
+                return 0, summary
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._run_rule, query, {**params, "neoowl_partition_ids": ids})
+                       for ids in partitions()]
+            results = [future.result() for future in futures]
+        logger.debug(f"Ran {len(results)} partitions in {time.perf_counter() - started:.3f}s")
+        return (sum(rows for rows, _ in results),
+                PartitionedSummary([summary for _, summary in results], time.perf_counter() - started))
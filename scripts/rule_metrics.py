@@ -0,0 +1,201 @@
+"""Per-rule execution metrics, aggregated per iteration and per run, exported as JSON logs and Prometheus text."""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# One JSON document per message; send it to a file of its own with log_to_file()
+metrics_logger = logging.getLogger("neoowl.metrics")
+
+# ResultSummary counters recorded for every rule run
+COUNTERS = ("labels_added", "labels_removed", "relationships_created", "relationships_deleted",
+            "properties_set", "nodes_created", "nodes_deleted")
+FIELDS = ("runs", "seconds", "rows") + COUNTERS + ("db_hits",)
+
+
+def log_to_file(path):
+    """Write the metrics logs, and only them, as JSON lines to `path`."""
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    metrics_logger.addHandler(handler)
+    metrics_logger.setLevel(logging.DEBUG)
+    metrics_logger.propagate = False
+
+
+def db_hits(plan):
+    """Total database hits of a PROFILE plan (ResultSummary.profile)."""
+    if not plan:
+        return 0
+    return plan.get("dbHits", 0) + sum(db_hits(child) for child in plan.get("children", []))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def prometheus_labels(labels):
+    """`labels` as the start of a Prometheus label set: 'name="value",' for each of them."""
+    return "".join(f'{name}="{_escape(value)}",' for name, value in sorted((labels or {}).items()))
+
+
+def merge_prometheus(texts):
+    """Merge Prometheus text expositions, so that each metric family is declared once with all its samples."""
+    families = {}
+    for text in texts:
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# TYPE "):
+                family = families.setdefault(line.split()[2], [line])
+            elif line and family is not None:
+                family.append(line)
+    return "\n".join(line for lines in families.values() for line in lines) + "\n"
+
+
+def _empty():
+    return dict.fromkeys(FIELDS, 0)
+
+
+def _add(total, sample):
+    for field in FIELDS:
+        total[field] += sample[field]
+
+
+def _sum(aggregates):
+    total = _empty()
+    for aggregate in aggregates:
+        _add(total, aggregate)
+    return total
+
+
+def _rules(aggregates):
+    return sorted(({"kind": kind, "source": source, **aggregate} for (kind, source), aggregate in aggregates.items()),
+                  key=lambda entry: -entry["seconds"])
+
+
+class RuleMetrics:
+    """Time and counters of every rule run, keyed by rule kind and source ontology node.
+
+    Runs are aggregated over the current iteration, the current run (one call
+    to an inference method) and the lifetime of the process. With `profile`,
+    every rule runs under PROFILE so its database hits are counted too. With a
+    `slow_rule_threshold` (seconds), a rule running longer than that runs
+    under PROFILE the next time, and its plan is saved to `slow_rule_dir`
+    (once per run and rule).
+    """
+    def __init__(self, profile=False, slow_rule_threshold=None, slow_rule_dir="slow_rules"):
+        self.profile = profile
+        self.slow_rule_threshold = slow_rule_threshold
+        self.slow_rule_dir = slow_rule_dir
+        self.lock = threading.Lock()
+        self.totals = defaultdict(_empty)
+        self.run_counts = defaultdict(int)
+        self.iteration_count = 0
+        self.run = None
+        self.last_run = None
+        self.capture = set()
+        self.captured = set()
+
+    def query(self, rule, query):
+        """`query` as it should run for `rule`: under PROFILE when profiling or capturing its plan."""
+        if self.profile or (rule.kind, rule.source) in self.capture:
+            return f"PROFILE {query}"
+        return query
+
+    def record(self, kind, source, summary, rows=0, query=None):
+        """Record one run of the rule `kind` compiled from `source`, from its result summary."""
+        sample = {"runs": 1, "rows": rows,
+                  "seconds": ((summary.result_available_after or 0) + (summary.result_consumed_after or 0)) / 1000,
+                  "db_hits": db_hits(summary.profile),
+                  **{counter: getattr(summary.counters, counter) for counter in COUNTERS}}
+        with self.lock:
+            _add(self.totals[(kind, source)], sample)
+            if self.run:
+                _add(self.run["rules"][(kind, source)], sample)
+                _add(self.run["iteration"][(kind, source)], sample)
+        if metrics_logger.isEnabledFor(logging.DEBUG):
+            metrics_logger.debug(json.dumps({"event": "rule", "kind": kind, "source": source, **sample}))
+        if self.slow_rule_threshold is not None:
+            self._capture_slow(kind, source, sample["seconds"], summary, query)
+
+    def _capture_slow(self, kind, source, seconds, summary, query):
+        key = (kind, source)
+        if key in self.captured:
+            return
+        if summary.profile and (key in self.capture or seconds > self.slow_rule_threshold):
+            self.capture.discard(key)
+            self.captured.add(key)
+            self._save_plan(kind, source, seconds, summary.profile, query)
+        elif seconds > self.slow_rule_threshold and key not in self.capture:
+            logger.info(f"{kind} rule from {source} took {seconds:.3f}s, profiling its next run")
+            self.capture.add(key)
+
+    def _save_plan(self, kind, source, seconds, plan, query):
+        os.makedirs(self.slow_rule_dir, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{kind}-{source}")
+        path = os.path.join(self.slow_rule_dir, f"{name}-{int(time.time() * 1000)}.json")
+        with open(path, "w") as file:
+            json.dump({"kind": kind, "source": source, "seconds": seconds, "db_hits": db_hits(plan),
+                       "query": query, "plan": plan}, file, indent=2, default=str)
+        logger.info(f"Saved the PROFILE plan of the {kind} rule from {source} to {path}")
+
+    def start_run(self, mode):
+        with self.lock:
+            self.run = {"mode": mode, "started": time.perf_counter(), "iterations": 0,
+                        "rules": defaultdict(_empty), "iteration": defaultdict(_empty)}
+        self.captured = set()
+
+    def end_iteration(self, **context):
+        """Close the current iteration of the run and log its aggregates."""
+        with self.lock:
+            run = self.run
+            if not run:
+                return
+            run["iterations"] += 1
+            self.iteration_count += 1
+            iteration, run["iteration"] = run["iteration"], defaultdict(_empty)
+        metrics_logger.info(json.dumps({"event": "iteration", "mode": run["mode"], "iteration": run["iterations"],
+                                        **context, **_sum(iteration.values()), "rules": _rules(iteration)}))
+
+    def end_run(self):
+        """Close the current run, log its aggregates and return them."""
+        with self.lock:
+            run, self.run = self.run, None
+            if not run:
+                return None
+            self.run_counts[run["mode"]] += 1
+        self.last_run = {"event": "run", "mode": run["mode"], "wall_seconds": time.perf_counter() - run["started"],
+                         "iterations": run["iterations"], **_sum(run["rules"].values()),
+                         "rules": _rules(run["rules"])}
+        metrics_logger.info(json.dumps(self.last_run))
+        return self.last_run
+
+    def rules(self):
+        """The lifetime aggregates of every rule, slowest first."""
+        with self.lock:
+            return _rules({key: dict(aggregate) for key, aggregate in self.totals.items()})
+
+    def prometheus(self, labels=None):
+        """The lifetime metrics in the Prometheus text exposition format, with the constant `labels` if given."""
+        common = prometheus_labels(labels)
+        with self.lock:
+            totals = {key: dict(aggregate) for key, aggregate in self.totals.items()}
+            run_counts = dict(self.run_counts)
+            iteration_count = self.iteration_count
+        lines = []
+        for field in FIELDS:
+            name = f"neoowl_rule_{field}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f'{name}{{{common}kind="{_escape(kind)}",source="{_escape(source)}"}} {aggregate[field]}'
+                         for (kind, source), aggregate in sorted(totals.items(), key=str))
+        lines.append("# TYPE neoowl_inference_runs_total counter")
+        lines.extend(f'neoowl_inference_runs_total{{{common}mode="{_escape(mode)}"}} {count}'
+                     for mode, count in sorted(run_counts.items()))
+        lines.append("# TYPE neoowl_inference_iterations_total counter")
+        lines.append(f"neoowl_inference_iterations_total{{{common.rstrip(',')}}} {iteration_count}"
+                     if common else f"neoowl_inference_iterations_total {iteration_count}")
+        return "\n".join(lines) + "\n"
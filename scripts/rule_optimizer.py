@@ -0,0 +1,53 @@
+"""Rule optimizations: fusing rules that share a match, read-only probes skipping rules with nothing to do,
+and element id partitions splitting a heavy rule."""
+import re
+from functools import lru_cache
+
+# The batched write subquery every full rule statement ends with
+_WRITE_CALL = re.compile(r"\n\s*CALL\s*\([^()]*\)\s*\{")
+
+
+def group_records(records, *keys):
+    """Group ontology records by the values of `keys`, keeping their order; rules of a group share one match."""
+    groups = {}
+    for record in records:
+        groups.setdefault(tuple(record[key] for key in keys), []).append(record)
+    return list(groups.values())
+
+
+@lru_cache(maxsize=None)
+def probe_query(query):
+    """A read-only query returning a row when the rule statement `query` has anything to write, or None.
+
+    Rule statements filter out the facts that already hold before their
+    final `CALL (...) { ... } IN TRANSACTIONS` write, so whatever precedes it
+    is the probe.
+    """
+    matches = list(_WRITE_CALL.finditer(query))
+    if not matches or "TRANSACTIONS" not in query[matches[-1].end():]:
+        return None
+    return f"{query[:matches[-1].start()]}\n                    RETURN true AS found LIMIT 1"
+
+
+# The label expression of a node pattern, e.g. `:Person` or `:Actor|Director`
+_NODE_LABELS = r"\s*:\s*([\w`]+(?:\s*[:&|]\s*[\w`]+)*)"
+
+
+def partition_domain(pattern, variable):
+    """The node pattern `(variable:Labels)` enumerating the nodes a rule matching `pattern` can be split by, or None.
+
+    Only a labelled occurrence of `variable` at the top level of the pattern
+    counts: inside a quantified group it binds a list, inside a subquery it
+    does not restrict the match.
+    """
+    for match in re.finditer(rf"\(\s*{re.escape(variable)}{_NODE_LABELS}", pattern):
+        before = pattern[:match.start()]
+        if before.count("(") == before.count(")") and before.count("{") == before.count("}"):
+            return f"({variable}:{match.group(1)})"
+    return None
+
+
+def partitioned_query(query, variable):
+    """`query` restricted to the `variable` elements whose ids are passed as $neoowl_partition_ids."""
+    return f"""MATCH ({variable}) WHERE elementId({variable}) IN $neoowl_partition_ids
+                    {query.lstrip()}"""
@@ -0,0 +1,140 @@
+"""Cost-based rule ordering from EXPLAIN estimates and the timings of earlier runs.
+
+Within one pass, a rule only sees what the rules run before it wrote, so rules
+are ordered after the rules they read from: strongly connected components of
+the dependency graph in topological order, which lets a single pass carry an
+inference through the whole chain. Among the components whose inputs are
+ready, and inside each component, cheaper rules run first, so that the
+expensive ones see as many facts as possible when they run.
+
+A rule's cost is its mean run time when it has run before (in this process,
+or in an earlier one whose timings were saved), otherwise the rows its plan
+estimates times the seconds per estimated row of the rules that have run.
+"""
+import os
+import json
+import heapq
+import logging
+
+from neo4j.exceptions import Neo4jError
+
+from ontology_closure import strongly_connected_components
+from rule_dependencies import dependency_graph
+
+logger = logging.getLogger(__name__)
+
+# Plan operators that usually mean a rule lacks an index or a join predicate
+SUSPICIOUS_OPERATORS = {
+    "AllNodesScan": "full node scan",
+    "DirectedAllRelationshipsScan": "full relationship scan",
+    "UndirectedAllRelationshipsScan": "full relationship scan",
+    "CartesianProduct": "cartesian product",
+}
+
+# Seconds per estimated row until a rule with both has run
+_DEFAULT_SECONDS_PER_ROW = 1e-6
+
+
+def _key(rule):
+    return f"{rule.kind}:{rule.source}"
+
+
+def plan_operators(plan):
+    """Yield every operator of an EXPLAIN / PROFILE plan (ResultSummary.plan) as (name, arguments)."""
+    if not plan:
+        return
+    yield plan["operatorType"].split("@")[0], plan.get("args", {})
+    for child in plan.get("children", []):
+        yield from plan_operators(child)
+
+
+def estimate(plan):
+    """(estimated rows, suspicious operators) of a plan; the rows are summed over its operators."""
+    rows, warnings = 0.0, set()
+    for name, arguments in plan_operators(plan):
+        rows += arguments.get("EstimatedRows", 0)
+        if name in SUSPICIOUS_OPERATORS:
+            warnings.add(SUSPICIOUS_OPERATORS[name])
+    return rows, sorted(warnings)
+
+
+class RulePlanner:
+    """Orders rules by their dependencies and expected cost.
+
+    `explain` estimates rules once per query; `record` takes the lifetime
+    aggregates of RuleMetrics.rules() after each run, and saves them to
+    `history_path` if given so that a restart starts from them.
+    """
+    def __init__(self, history_path=None):
+        self.history_path = history_path
+        self.estimates = {}
+        self.history = {}
+        if history_path:
+            try:
+                with open(history_path, "r") as file:
+                    self.history = json.load(file)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable rule timings {history_path}: {e}")
+
+    def explain(self, session, rules, params_for=lambda rule: {}):
+        """EXPLAIN the rules not estimated yet, logging those whose plans look like performance problems."""
+        for rule in rules:
+            if rule.reachability or (rule.kind, rule.query) in self.estimates:
+                continue
+            try:
+                summary = session.run(f"EXPLAIN {rule.query}", params_for(rule)).consume()
+            except Neo4jError as e:
+                logger.warning(f"Could not EXPLAIN the {rule.kind} rule from {rule.source}: {e}")
+                continue
+            rows, warnings = estimate(summary.plan)
+            self.estimates[(rule.kind, rule.query)] = rows
+            if warnings:
+                logger.warning(f"The plan of the {rule.kind} rule from {rule.source} has a {' and a '.join(warnings)}")
+
+    def record(self, aggregates):
+        """Take the timings of RuleMetrics.rules() `aggregates` and save them."""
+        for entry in aggregates:
+            if entry["runs"]:
+                self.history[f"{entry['kind']}:{entry['source']}"] = [entry["runs"], entry["seconds"]]
+        if self.history_path:
+            try:
+                os.makedirs(os.path.dirname(self.history_path) or ".", exist_ok=True)
+                with open(self.history_path, "w") as file:
+                    json.dump(self.history, file)
+            except OSError as e:
+                logger.warning(f"Could not save rule timings to {self.history_path}: {e}")
+
+    def costs(self, rules):
+        """Expected seconds of one run of each rule, in rule order."""
+        estimated = [(self.estimates.get((rule.kind, rule.query)), self.history.get(_key(rule))) for rule in rules]
+        rows = sum(rows for rows, timing in estimated if rows and timing)
+        seconds = sum(timing[1] / timing[0] for rows, timing in estimated if rows and timing)
+        per_row = seconds / rows if rows and seconds else _DEFAULT_SECONDS_PER_ROW
+        return [timing[1] / timing[0] if timing else (rows or 0) * per_row for rows, timing in estimated]
+
+    def order(self, rules):
+        """`rules` in dependency order, cheapest first among the rules that are ready."""
+        costs = self.costs(rules)
+        graph = dependency_graph(rules)
+        components = strongly_connected_components(graph)
+        component_of = {i: c for c, component in enumerate(components) for i in component}
+        waiting = [set() for _ in components]
+        for i, readers in graph.items():
+            for reader in readers:
+                if component_of[reader] != component_of[i]:
+                    waiting[component_of[reader]].add(component_of[i])
+        cost = [sum(costs[i] for i in component) for component in components]
+        ready = [(cost[c], c) for c, inputs in enumerate(waiting) if not inputs]
+        heapq.heapify(ready)
+        ordered = []
+        while ready:
+            _, c = heapq.heappop(ready)
+            ordered.extend(rules[i] for i in sorted(components[c], key=lambda i: (costs[i], i)))
+            for other, inputs in enumerate(waiting):
+                if c in inputs:
+                    inputs.discard(c)
+                    if not inputs:
+                        heapq.heappush(ready, (cost[other], other))
+        return ordered
@@ -0,0 +1,178 @@
+"""Snapshot-and-diff inference: read-only rule evaluation, applied in bulk at the end of each round.
+
+The pattern-defined rules run as read-only queries returning every fact they
+derive, rewritten (see query_rewriter) to see the hierarchy and symmetry
+facts that are not stored yet. Those facts are added to an in-memory
+projection of the graph, whose hierarchy, symmetry and reachability closures
+are computed as by the in-memory engine. The result is diffed against the
+stored graph and only the net additions are written, in large UNWIND batches
+tagged with SNAPSHOT_METADATA so that a CDC consumer can skip them.
+
+A pattern rule reading what another pattern rule infers sees it in the next
+round, after it has been applied; a round that finds nothing to write ends
+the run.
+"""
+import logging
+
+import numpy as np
+
+from cdc_changes import SNAPSHOT_METADATA
+from inmemory_engine import Delta, GraphProjection, InMemoryEngine, materialize, write_delta
+from path_distances import reachability_rule
+from query_rewriter import QueryRewriter
+from rule_optimizer import group_records
+
+logger = logging.getLogger(__name__)
+
+
+def extend(projection, node_ids=(), labels=None, relationships=None):
+    """A copy of `projection` with the `node_ids`, the {label: [id]} and the {type: [(start id, end id)]} facts added."""
+    all_ids = list(projection.node_ids)
+    index = dict(projection.index)
+    for node_id in node_ids:
+        if node_id not in index:
+            index[node_id] = len(all_ids)
+            all_ids.append(node_id)
+    size, padding = len(all_ids), len(all_ids) - projection.size
+    bitsets = {name: np.concatenate([members, np.zeros(padding, dtype=bool)])
+               for name, members in projection.labels.items()}
+    for name, ids in (labels or {}).items():
+        bitsets.setdefault(name, np.zeros(size, dtype=bool))[[index[node_id] for node_id in ids]] = True
+    keys = {}
+    for rel_type in projection.adjacency:
+        sources, targets = np.divmod(projection.edge_keys(rel_type), projection.size)
+        keys[rel_type] = sources * size + targets
+    for rel_type, pairs in (relationships or {}).items():
+        encoded = np.array([index[start] * size + index[end] for start, end in pairs], dtype=np.int64)
+        keys[rel_type] = np.union1d(keys.get(rel_type, np.empty(0, dtype=np.int64)), encoded)
+    return GraphProjection(all_ids, bitsets, keys, projection.properties)
+
+
+def diff(stored, derived, closure, properties):
+    """The Delta taking `stored` to `derived` and its `closure`, with the {property: {id: value}} `properties`.
+
+    `stored` and `derived` are projections over the same nodes, and `closure`
+    is what materialize adds to `derived`.
+    """
+    delta = Delta()
+    for name in set(derived.labels) | set(closure.labels):
+        added = np.flatnonzero(derived.label_bitset(name) & ~stored.label_bitset(name))
+        added = np.union1d(added, closure.labels.get(name, np.empty(0, dtype=np.int64)))
+        if len(added):
+            delta.labels[name] = added
+    for rel_type in set(derived.adjacency) | set(closure.relationships):
+        added = np.setdiff1d(derived.edge_keys(rel_type), stored.edge_keys(rel_type))
+        added = np.union1d(added, closure.relationships.get(rel_type, np.empty(0, dtype=np.int64)))
+        if len(added):
+            delta.relationships[rel_type] = added
+    delta.properties.update(closure.properties)
+    for name, by_id in properties.items():
+        current = stored.properties.get(name, {})
+        changed = [(stored.index[node_id], value) for node_id, value in by_id.items()
+                   if current.get(stored.index[node_id]) != value]
+        if changed:
+            values = np.empty(len(changed), dtype=object)
+            values[:] = [value for _, value in changed]
+            delta.properties[name] = (np.array([i for i, _ in changed], dtype=np.int64), values)
+    return delta
+
+
+class SnapshotEngine(InMemoryEngine):
+    """Run a NeoOWLReasoner's ontology to convergence, writing only the net changes of each round.
+
+    Each round evaluates the pattern-defined rules read-only, closes the
+    projected graph and their facts in memory, and applies the diff with the
+    stored graph in transactions carrying `metadata`.
+    """
+    def __init__(self, reasoner, database, batch_size=10000, metadata=SNAPSHOT_METADATA):
+        super().__init__(reasoner, database, batch_size)
+        self.metadata = metadata
+        rewriter = QueryRewriter(self.ontology)
+        self.label_queries, self.relationship_queries, self.property_queries = [], [], []
+        for group in group_records(self.ontology['pattern_labels'], 'pattern', 'classElementVariable'):
+            pattern, variable = rewriter.rewrite(group[0]['pattern']), group[0]['classElementVariable']
+            self.label_queries.append(([record['name'] for record in group],
+                                       f"MATCH {pattern} RETURN DISTINCT elementId({variable}) AS id"))
+        for group in group_records(self.ontology['pattern_relationships'], 'pattern', 'sourceElementVariable',
+                                   'targetElementVariable'):
+            pattern = rewriter.rewrite(group[0]['pattern'])
+            source, target = group[0]['sourceElementVariable'], group[0]['targetElementVariable']
+            self.relationship_queries.append(([record['name'] for record in group], f"""MATCH {pattern}
+                    RETURN DISTINCT elementId({source}) AS source, elementId({target}) AS target"""))
+        for record in self.ontology['pattern_properties']:
+            if reachability_rule(record):
+                continue
+            variable, value = record['variable'], record['val_variable']
+            self.property_queries.append((record['property_name'], f"""MATCH ({variable}:{rewriter.label_expression(record['label'])})
+                    CALL ({variable}) {{
+                        MATCH {rewriter.rewrite(record['pattern'])}
+                        WITH {variable}, {value}
+                        RETURN {value} AS neoowl_value
+                    }}
+                    RETURN elementId({variable}) AS id, neoowl_value AS value"""))
+
+    def _projected(self):
+        labels, types, properties = super()._projected()
+        labels |= {record['name'] for record in self.ontology['pattern_labels']}
+        labels |= {record['label'] for record in self.ontology['pattern_properties']}
+        types |= {record['name'] for record in self.ontology['pattern_relationships']}
+        return labels, types, properties | {name for name, _ in self.property_queries}
+
+    def _read(self, session, source, query):
+        def work(tx):
+            result = tx.run(query)
+            return [record.values() for record in result], result.consume()
+
+        records, summary = session.execute_read(work)
+        self.reasoner.metrics.record("snapshot", source, summary, len(records), query)
+        return records
+
+    def evaluate(self, session):
+        """Every fact the pattern-defined rules derive: ({label: [id]}, {type: [(start, end)]}, {property: {id: value}})."""
+        labels, relationships, properties = {}, {}, {}
+        for names, query in self.label_queries:
+            ids = [node_id for node_id, in self._read(session, ",".join(names), query)]
+            for name in names:
+                labels.setdefault(name, []).extend(ids)
+        for names, query in self.relationship_queries:
+            pairs = [tuple(pair) for pair in self._read(session, ",".join(names), query)]
+            for name in names:
+                relationships.setdefault(name, []).extend(pairs)
+        for name, query in self.property_queries:
+            properties.setdefault(name, {}).update(self._read(session, name, query))
+        return labels, relationships, properties
+
+    def infer_to_convergence(self, params=None, max_iterations=100):
+        labels, types, properties = self._projected()
+        logger.info(f"Snapshot engine: {len(self.label_queries) + len(self.relationship_queries)} pattern rules, "
+                    f"{len(self.property_queries)} pattern properties, {len(labels)} labels, "
+                    f"{len(types)} relationship types")
+        self.reasoner.metrics.start_run("snapshot")
+        try:
+            for iteration in range(1, max_iterations + 1):
+                with self.reasoner.main_conn.session(self.database) as session:
+                    fact_labels, fact_relationships, fact_properties = self.evaluate(session)
+                    projection = GraphProjection.from_database(session, labels, types, properties)
+                    node_ids = {node_id for ids in fact_labels.values() for node_id in ids}
+                    node_ids |= {node_id for pairs in fact_relationships.values() for pair in pairs for node_id in pair}
+                    node_ids |= {node_id for by_id in fact_properties.values() for node_id in by_id}
+                    stored = extend(projection, sorted(node_ids))
+                    derived = extend(stored, labels=fact_labels, relationships=fact_relationships)
+                    closure = materialize(derived, self.label_closure, self.relationship_closure,
+                                          self.symmetric_types, self.reachability_rules)
+                    delta = diff(stored, derived, closure, fact_properties)
+                    if delta:
+                        for summary in write_delta(session, stored, delta, self.batch_size, kind="snapshot",
+                                                   metadata=self.metadata):
+                            self.reasoner.metrics.record("snapshot", "delta", summary)
+                self.reasoner.metrics.end_iteration(projected_nodes=stored.size)
+                logger.info(f"Round {iteration}: projected {stored.size} nodes, applied "
+                            f"{sum(len(nodes) for nodes in delta.labels.values())} labels, "
+                            f"{sum(len(keys) for keys in delta.relationships.values())} relationships, "
+                            f"{sum(len(nodes) for nodes, _ in delta.properties.values())} property values")
+                if not delta:
+                    logger.info(f"Convergence reached after {iteration} rounds")
+                    return
+        finally:
+            self.reasoner.end_run()
+        logger.warning(f"Stopped after {max_iterations} rounds without reaching convergence")
@@ -0,0 +1,63 @@
+"""Adaptive batch sizing of rule runs."""
+from types import SimpleNamespace
+
+from batching import BatchSizer, load_batch_settings
+from infer_to_convergence import Rule
+
+RULE = Rule(kind="sco", query="rule", seminaive_query="")
+
+
+def summary(seconds):
+    return SimpleNamespace(result_available_after=int(seconds * 1000), result_consumed_after=0)
+
+
+def sizer(**options):
+    return BatchSizer(load_batch_settings(), adaptive=True, **options)
+
+
+def test_fast_batches_grow_towards_the_target_time():
+    batches = sizer()
+    batches.record(RULE, rows=1000, summary=summary(0.5))
+    assert batches.batch_size(RULE) == 316
+    batches.record(RULE, rows=10000, summary=summary(0))
+    assert batches.batch_size(RULE) == 1264
+
+
+def test_slow_batches_shrink_by_at_most_a_factor_of_four():
+    batches = sizer(min_size=1)
+    batches.record(RULE, rows=1000, summary=summary(50))
+    assert batches.batch_size(RULE) == 31
+    batches.record(RULE, rows=1000, summary=summary(5000))
+    assert batches.batch_size(RULE) == 7
+
+
+def test_batch_sizes_stay_within_bounds():
+    batches = sizer(min_size=20, max_size=150)
+    batches.record(RULE, rows=1000, summary=summary(0))
+    assert batches.batch_size(RULE) == 150
+    for _ in range(5):
+        batches.record(RULE, rows=1000, summary=summary(1000))
+    assert batches.batch_size(RULE) == 20
+
+
+def test_failed_runs_shrink_the_batch_size_down_to_the_minimum():
+    batches = sizer(min_size=10)
+    batches.record_failure(RULE)
+    assert batches.batch_size(RULE) == 25
+    batches.record_failure(RULE)
+    batches.record_failure(RULE)
+    assert batches.batch_size(RULE) == 10
+
+
+def test_a_single_short_transaction_or_no_rows_keeps_the_size():
+    batches = sizer()
+    batches.record(RULE, rows=50, summary=summary(0.01))
+    batches.record(RULE, rows=0, summary=summary(100))
+    assert batches.batch_size(RULE) == 100
+
+
+def test_fixed_batch_sizes_ignore_timings_and_failures():
+    batches = BatchSizer(load_batch_settings())
+    batches.record(RULE, rows=1000, summary=summary(50))
+    batches.record_failure(RULE)
+    assert batches.batch_size(RULE) == 100
@@ -0,0 +1,73 @@
+"""Change sets built from CDC events."""
+from cdc_changes import SNAPSHOT_METADATA, ChangeSet, is_snapshot_write
+from rule_dependencies import anchor_variables, label, node_property, relationship_type
+
+
+def node_event(operation, element_id, before=None, after=None, labels=()):
+    return {"eventType": "n", "operation": operation, "elementId": element_id, "labels": list(labels),
+            "state": {"before": before, "after": after}}
+
+
+def relationship_event(operation, element_id, rel_type, start, end, before=None, after=None):
+    return {"eventType": "r", "operation": operation, "elementId": element_id, "type": rel_type,
+            "start": {"elementId": start}, "end": {"elementId": end}, "state": {"before": before, "after": after}}
+
+
+def test_created_node_anchors_its_id_labels_and_properties():
+    changes = ChangeSet()
+    changes.add_event(node_event("c", "n1", after={"labels": ["Person"], "properties": {"name": "Keanu"}}))
+    assert changes.node_ids == {"n1"}
+    assert changes.relationship_ids == set()
+    assert changes.tokens == {label("Person"), node_property("name")}
+    assert not changes.removed_tokens
+
+
+def test_updated_node_records_added_and_removed_labels_and_overwritten_properties():
+    changes = ChangeSet()
+    changes.add_event(node_event("u", "n1", before={"labels": ["Person", "Actor"], "properties": {"born": 1964}},
+                                 after={"labels": ["Person", "Director"], "properties": {"born": 1965}}))
+    assert changes.tokens == {label("Director"), node_property("born")}
+    assert changes.removed_tokens == {label("Actor"), node_property("born")}
+    assert changes.removed_facts == {(label("Actor"), ("n1",)), (node_property("born"), ("n1",))}
+
+
+def test_created_relationship_anchors_its_id_and_both_ends():
+    changes = ChangeSet()
+    changes.add_event(relationship_event("c", "r1", "ACTED_IN", "p", "m", after={"properties": {"roles": ["Neo"]}}))
+    assert changes.node_ids == {"p", "m"}
+    assert changes.relationship_ids == {"r1"}
+    assert changes.tokens == {relationship_type("ACTED_IN"), node_property("roles")}
+
+
+def test_deletions_are_removed_facts_and_no_additions():
+    changes = ChangeSet()
+    changes.add_event(node_event("d", "n1", before={"labels": ["Person"], "properties": {"name": "Keanu"}}))
+    changes.add_event(relationship_event("d", "r1", "ACTED_IN", "p", "m", before={"properties": {}}))
+    assert changes.node_ids == {"n1", "p", "m"}
+    assert changes.relationship_ids == set()
+    assert not changes.tokens
+    assert changes.removed_facts == {(label("Person"), ("n1",)), (relationship_type("ACTED_IN"), ("p", "m"))}
+    assert changes
+
+
+def test_from_cdc_records_and_snapshot_writes():
+    records = [{"id": "c1", "metadata": {"txMetadata": SNAPSHOT_METADATA},
+                "event": node_event("c", "n1", after={"labels": ["Person"]})},
+               {"id": "c2", "metadata": {"txMetadata": None},
+                "event": node_event("c", "n2", after={"labels": ["Movie"]})}]
+    assert [is_snapshot_write(record) for record in records] == [True, False]
+    changes = ChangeSet.from_cdc_records(records)
+    assert changes.node_ids == {"n1", "n2"}
+    assert changes.tokens == {label("Person"), label("Movie")}
+
+
+def test_anchor_variables_names_anonymous_top_level_nodes():
+    pattern, variables = anchor_variables("(p:Person)-[:ACTED_IN]->(:Movie)<-[:DIRECTED]-(d)")
+    assert pattern == "(p:Person)-[:ACTED_IN]->(_neoowl_n0:Movie)<-[:DIRECTED]-(d)"
+    assert variables == ["p", "_neoowl_n0", "d"]
+
+
+def test_anchor_variables_skips_subqueries_and_repeated_variables():
+    pattern, variables = anchor_variables("(p)-[:KNOWS]->(q) WHERE EXISTS { (q)-[:ACTED_IN]->(:Movie) } AND (p)--(q)")
+    assert pattern == "(p)-[:KNOWS]->(q) WHERE EXISTS { (q)-[:ACTED_IN]->(:Movie) } AND (p)--(q)"
+    assert variables == ["p", "q"]
@@ -0,0 +1,141 @@
+"""CDCService inference loop over a reasoner that fails."""
+import asyncio
+
+import pytest
+
+import neoowl_server
+from cdc_changes import SNAPSHOT_METADATA, ChangeSet
+from neoowl_server import CDCService, ChangeBatch, run_service
+
+
+class FailingReasoner:
+    database = "neo4j"
+
+    def __init__(self):
+        self.calls = 0
+
+    def infer_incremental(self, changes):
+        self.calls += 1
+        raise RuntimeError("Invalid input 'MATCH'")
+
+
+def batch(first, last):
+    return ChangeBatch(events=[{"id": first}, {"id": last}], changes=ChangeSet(node_ids={"a"}), last_id=last)
+
+
+async def start(service, batches):
+    service.stopping = asyncio.Event()
+    service.batches = asyncio.Queue(maxsize=1)
+    service.inference_lock = asyncio.Lock()
+    service.unprocessed_events = 2 * len(batches)
+    task = asyncio.create_task(service._inference_loop())
+    for item in batches:
+        await service.batches.put(item)
+    return task
+
+
+def test_failing_batch_is_dead_lettered_after_max_attempts():
+    async def scenario():
+        reasoner = FailingReasoner()
+        service = CDCService(None, reasoner, retry_delay=0, max_attempts=3)
+        task = await start(service, [batch("c1", "c2"), batch("c3", "c4")])
+        await service.batches.put(None)
+        await asyncio.wait_for(task, 5)
+        return reasoner, service
+
+    reasoner, service = asyncio.run(scenario())
+    assert reasoner.calls == 6
+    assert service.cursor == "c4"
+    assert service.metrics["batches_dead_lettered"] == 2
+
+
+def test_failure_during_shutdown_drains_the_planned_batches():
+    async def scenario():
+        service = CDCService(None, FailingReasoner(), retry_delay=0, max_attempts=3)
+        task = await start(service, [batch("c1", "c2")])
+        service.stopping.set()
+        # The planner can still fill the queue and post its sentinel
+        await asyncio.wait_for(service.batches.put(batch("c3", "c4")), 5)
+        await asyncio.wait_for(service.batches.put(None), 5)
+        await asyncio.wait_for(task, 5)
+        return service
+
+    service = asyncio.run(scenario())
+    assert service.cursor is None
+
+
+def test_a_failing_tenant_does_not_stop_the_others():
+    class Service:
+        def __init__(self, database, fail):
+            self.reasoner = type("Reasoner", (), {"database": database})
+            self.fail = fail
+            self.finished = False
+
+        async def run(self):
+            await asyncio.sleep(0)
+            if self.fail:
+                raise RuntimeError("CDC is not enabled")
+            await asyncio.sleep(0.01)
+            self.finished = True
+
+    async def scenario(services):
+        await asyncio.gather(*(run_service(service) for service in services))
+
+    services = [Service("movies", True), Service("shop", False)]
+    asyncio.run(scenario(services))
+    assert services[1].finished
+
+
+def test_database_checkpoint_in_the_monitored_database_is_refused(monkeypatch):
+    monkeypatch.setattr(neoowl_server, "NEOOWL_CHECKPOINT_STORE", "database")
+    monkeypatch.setattr(neoowl_server, "NEO4J_URI", "neo4j://localhost")
+    monkeypatch.setattr(neoowl_server, "NEO4J_URI_ONTOLOGY", "neo4j://localhost")
+    with pytest.raises(ValueError):
+        neoowl_server.create_service(None, None, None, "neo4j", "neo4j")
+
+
+class ChangeLog:
+    """An async connection whose db.cdc.query reads `records` after the service's read cursor."""
+    def __init__(self, service, records):
+        self.service = service
+        self.records = records
+
+    def session(self, database):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute_read(self, work, limit):
+        ids = [record["id"] for record in self.records]
+        start = ids.index(self.service.read_cursor) + 1 if self.service.read_cursor in ids else 0
+        page = self.records[start:]
+        return ids[-1], page[:limit] if limit is not None else page
+
+
+def change(change_id, metadata=None):
+    return {"id": change_id, "metadata": {"txMetadata": metadata},
+            "event": {"eventType": "n", "operation": "c", "elementId": change_id, "labels": ["Person"]}}
+
+
+def test_a_page_of_snapshot_writes_does_not_skip_the_rest_of_the_backlog():
+    async def scenario():
+        service = CDCService(None, None, poll_interval=60, catch_up_batch_size=2)
+        service.conn = ChangeLog(service, [change("c1", SNAPSHOT_METADATA), change("c2", SNAPSHOT_METADATA),
+                                           change("c3")])
+        service.reasoner = type("Reasoner", (), {"database": "neo4j"})
+        service.read_cursor, service.catching_up = "c0", True
+        service.stopping, service.events = asyncio.Event(), asyncio.Queue()
+        task = asyncio.create_task(service._poll_loop())
+        events, bulk = await asyncio.wait_for(service.events.get(), 5)
+        service.stopping.set()
+        await asyncio.wait_for(task, 5)
+        return service, events
+
+    service, events = asyncio.run(scenario())
+    assert [event["id"] for event in events] == ["c3"]
+    assert service.cursor == "c2"
+    assert service.read_cursor == "c3"
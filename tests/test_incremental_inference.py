@@ -0,0 +1,46 @@
+"""Which rules NeoOWLReasoner.infer_incremental runs for a change set."""
+from cdc_changes import ChangeSet
+from infer_to_convergence import Rule
+from neoowl_server import NeoOWLReasoner
+from rule_dependencies import label, node_property, relationship_type
+from rule_metrics import RuleMetrics
+
+
+class Session:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Connection:
+    def session(self, database):
+        return Session()
+
+
+def reasoner(rules):
+    """A reasoner over `rules` recording the rules it runs in full, with nothing to retract."""
+    instance = NeoOWLReasoner.__new__(NeoOWLReasoner)
+    instance.main_conn, instance.database, instance.planner = Connection(), "neo4j", None
+    instance.metrics = RuleMetrics()
+    instance.rules = instance.ordered_rules = rules
+    instance.full_runs = []
+    instance._retract = lambda session, removed: ChangeSet()
+    instance._run_full = lambda session, rule, params: instance.full_runs.append(rule.source) or ChangeSet()
+    return instance
+
+
+def test_deletions_rerun_pattern_properties_reading_them():
+    movies = Rule(kind="pattern_property", query="", seminaive_query="", source="Person.movies",
+                  reads=frozenset({label("Person"), relationship_type("ACTED_IN")}),
+                  writes=frozenset({node_property("movies")}))
+    unrelated = Rule(kind="pattern_property", query="", seminaive_query="", source="Person.directed",
+                     reads=frozenset({label("Person"), relationship_type("DIRECTED")}),
+                     writes=frozenset({node_property("directed")}))
+    instance = reasoner([movies, unrelated])
+    changes = ChangeSet(node_ids={"p", "m"})
+    changes.removed_tokens.add(relationship_type("ACTED_IN"))
+    changes.removed_facts.add((relationship_type("ACTED_IN"), ("p", "m")))
+    instance.infer_incremental(changes)
+    assert instance.full_runs == ["Person.movies"]
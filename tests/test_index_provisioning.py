@@ -0,0 +1,67 @@
+"""Indexes derived from the property filters of compiled rules."""
+from infer_to_convergence import DELTA_PROPERTY, NeoOWLReasoner
+from index_provisioning import index_requirements, index_statement
+from retraction import INFERRED_LABELS_PROPERTY, INFERRED_PROPERTY
+from rule_dependencies import property_filters
+
+IGNORED = (DELTA_PROPERTY, INFERRED_PROPERTY, INFERRED_LABELS_PROPERTY)
+ONTOLOGY = {
+    "pattern_labels": [
+        {"name": "_KevinBacon", "pattern": "(p:Person {name: 'Kevin Bacon'})", "classElementVariable": "p"},
+        {"name": "_Recent", "pattern": "(m:Movie) WHERE m.released >= 2000", "classElementVariable": "m"}],
+    "pattern_relationships": [
+        {"name": "_COACTOR", "pattern": "(s:Person)-[:ACTED_IN]->()<-[:ACTED_IN]-(t:Person)",
+         "sourceElementVariable": "s", "targetElementVariable": "t"}],
+    "hierarchy": [{"edge": "SCO", "is_relationship": False, "a": "Actor", "b": "Person"}],
+    "symmetric": [{"sim_rel": "COACTOR"}],
+    "pattern_properties": [
+        {"label": "Person", "property_name": "roles", "variable": "x", "val_variable": "n",
+         "pattern": "(x)-[r:ACTED_IN]->(m) WHERE r.year = 1999 WITH x, count(r) AS n"},
+        {"label": "Person", "property_name": "friends", "variable": "x", "val_variable": "n",
+         "pattern": "(x)-[:KNOWS]->(f) WHERE f.age > 30 WITH x, count(f) AS n"}],
+}
+
+
+class OntologyConnection:
+    def __init__(self, ontology):
+        self.ontology = ontology
+        self.driver = self
+
+    def execute_query(self, query, **options):
+        return [type("Record", (), {"data": lambda record: self.ontology})()], None, None
+
+
+def compiled_rules():
+    return NeoOWLReasoner(None, OntologyConnection(ONTOLOGY)).rules
+
+
+def test_property_filters_of_maps_and_seekable_predicates():
+    assert property_filters("MATCH (p:Person {name: 'A'})-[r:ACTED_IN {year: 1999}]->(m:Movie|Series) "
+                            "WHERE m.released > 2000 AND m.title STARTS WITH 'The' AND p.born <> 1964 "
+                            "SET m.seen = true") == {
+        ("node", frozenset({"Person"}), "name"), ("relationship", frozenset({"ACTED_IN"}), "year"),
+        ("node", frozenset({"Movie", "Series"}), "released"), ("node", frozenset({"Movie", "Series"}), "title")}
+
+
+def test_property_filters_ignore_negated_labels_and_string_literals():
+    assert property_filters("MATCH (m:Movie) WHERE m.released >= 2000 WITH m WHERE NOT (m:_Recent) "
+                            "RETURN 'n.x = 1'") == {("node", frozenset({"Movie"}), "released")}
+
+
+def test_index_requirements_of_compiled_rules():
+    rules = compiled_rules()
+    required, unindexable = index_requirements(rules, IGNORED)
+    assert {key: sorted(rules[i].source for i in positions) for key, positions in required.items()} == {
+        ("node", "Person", "name"): ["_KevinBacon"],
+        ("node", "Movie", "released"): ["_Recent"],
+        ("relationship", "ACTED_IN", "year"): ["Person.roles"],
+    }
+    assert {rules[i].source: filters for i, filters in unindexable.items()} == {
+        "Person.friends": {"node property age without label or type"}}
+
+
+def test_index_statements():
+    assert index_statement("node", "Movie", "released") == \
+        "CREATE INDEX neoowl_Movie_released IF NOT EXISTS FOR (n:`Movie`) ON (n.`released`)"
+    assert index_statement("relationship", "ACTED IN", "year") == \
+        "CREATE INDEX neoowl_ACTED_IN_year IF NOT EXISTS FOR ()-[n:`ACTED IN`]-() ON (n.`year`)"
@@ -0,0 +1,63 @@
+"""How NeoOWLReasoner.run_rules runs a pass over partitioned and distance rules."""
+from types import SimpleNamespace
+
+from batching import BatchSizer, load_batch_settings
+from infer_to_convergence import NeoOWLReasoner, Rule
+from rule_metrics import COUNTERS, RuleMetrics
+
+
+def summary():
+    return SimpleNamespace(counters=SimpleNamespace(contains_updates=False, **dict.fromkeys(COUNTERS, 0)),
+                           result_available_after=1, result_consumed_after=0, profile=None)
+
+
+class Session:
+    """Counts every partition domain it is asked to count."""
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.counted = []
+
+    def run(self, query):
+        pattern = query.split(" RETURN")[0][len("MATCH "):]
+        self.counted.append(pattern)
+        return SimpleNamespace(single=lambda: {"count": self.sizes[pattern]})
+
+
+class Executor:
+    """Logs the rules it runs, whole in waves or in partitions."""
+    def __init__(self, log):
+        self.log = log
+
+    def run(self, rules, params_for, query_for, probe_for, failed):
+        self.log.append([rule.source for rule in rules])
+        return [(0, summary()) for _ in rules]
+
+    def run_partitioned(self, query, params, partitions, probe=None):
+        assert "$neoowl_partition_ids" in query
+        self.log.append(f"partitioned {query.split()[-1]}")
+        return 0, summary()
+
+
+def rule(source, pattern=None, reachability=None):
+    return Rule(kind="sco", query=f"MATCH (n) SET n:{source}", seminaive_query="", source=source,
+                partition_variable="n" if pattern else None, partition_pattern=pattern, reachability=reachability)
+
+
+def reasoner(log):
+    instance = NeoOWLReasoner.__new__(NeoOWLReasoner)
+    instance.executor, instance.partition_size, instance.probe_rules = Executor(log), 10, False
+    instance.batch_sizer = BatchSizer(load_batch_settings())
+    instance.metrics = RuleMetrics()
+    instance.run_distance_rule = lambda session, rule: log.append(f"distances {rule.source}") or (set(), summary())
+    return instance
+
+
+def test_partitioned_and_distance_rules_run_in_their_place_in_the_pass():
+    log = []
+    session = Session({"(n:Big)": 100, "(n:Small)": 5})
+    rules = [rule("A"), rule("B", "(n:Small)"), rule("C", "(n:Big)"), rule("D"),
+             rule("E", reachability={"owner_label": "Person"}), rule("F", "(n:Big)")]
+    summaries = reasoner(log).run_rules(session, rules, {})
+    assert log == [["A", "B"], "partitioned n:C", ["D"], "distances E", "partitioned n:F"]
+    assert len(summaries) == len(rules)
+    assert session.counted == ["(n:Small)", "(n:Big)"]
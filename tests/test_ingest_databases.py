@@ -0,0 +1,19 @@
+"""Statement splitting and classification of the Cypher ingestion."""
+import io
+
+from ingest_databases import group_statements, read_statements, statement_kind
+
+
+def test_statement_kinds():
+    assert statement_kind("CREATE (:Person {name: 'MATCH'})") == "create"
+    assert statement_kind("MATCH (a:X) CREATE (a)-[:R]->(:Y)") == "serial"
+    assert statement_kind("MERGE (p:Person {name: 'Keanu'})") == "serial"
+    assert statement_kind("CREATE INDEX person_name FOR (p:Person) ON (p.name)") == "schema"
+    assert statement_kind("UNWIND range(1, 10) AS i CALL (i) { CREATE (:N {i: i}) } IN TRANSACTIONS") == "autocommit"
+
+
+def test_statements_reading_earlier_creations_are_not_grouped_as_parallel():
+    file = io.StringIO("CREATE (:X);\nCREATE (:X);\n"
+                       "MATCH (a:X) CREATE (a)-[:R]->(:Y);\nMATCH (y:Y) CREATE (y)-[:S]->(:Z);\n")
+    groups = list(group_statements(read_statements(file), 100))
+    assert [(kind, len(statements)) for kind, statements in groups] == [("create", 2), ("serial", 2)]
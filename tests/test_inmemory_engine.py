@@ -0,0 +1,83 @@
+"""In-memory closures over a small projection built with GraphProjection.from_records."""
+import numpy as np
+import pytest
+
+from inmemory_engine import GraphProjection, materialize, write_delta
+from ontology_closure import hierarchy_closure
+from path_distances import ReachabilityRule
+
+
+@pytest.fixture
+def projection():
+    nodes = [("keanu", ["Actor"]), ("carrie", ["Actor"]), ("lana", ["Director"]),
+             ("kevin", ["Actor", "_KevinBacon"]), ("matrix", ["Movie"])]
+    relationships = {"ACTED_IN": [("keanu", "matrix"), ("carrie", "matrix")],
+                     "DIRECTED": [("lana", "matrix")],
+                     "COACTOR": [("keanu", "carrie"), ("carrie", "kevin")]}
+    return GraphProjection.from_records(nodes, relationships, {"kb_number": {"carrie": 5}})
+
+
+def named(projection, delta):
+    """The delta as sets of element ids, for readable assertions."""
+    ids, size = projection.node_ids, projection.size
+    labels = {name: {ids[i] for i in nodes.tolist()} for name, nodes in delta.labels.items()}
+    relationships = {rel_type: {(ids[a], ids[b]) for a, b in zip(*np.divmod(keys, size))}
+                     for rel_type, keys in delta.relationships.items()}
+    properties = {name: dict(zip((ids[i] for i in nodes.tolist()), values.tolist()))
+                  for name, (nodes, values) in delta.properties.items()}
+    return labels, relationships, properties
+
+
+def test_from_records_indexes_relationship_endpoints(projection):
+    assert projection.size == 5
+    assert projection.label_bitset("Actor").tolist() == [True, True, False, True, False]
+    assert len(projection.edge_keys("ACTED_IN")) == 2
+    assert projection.properties == {"kb_number": {1: 5}}
+
+
+def test_materialize_closes_hierarchies_symmetry_and_reachability(projection):
+    label_closure = hierarchy_closure([("Actor", "Person"), ("Director", "Person")], [])
+    relationship_closure = hierarchy_closure([("ACTED_IN", "INVOLVED_IN"), ("DIRECTED", "INVOLVED_IN")], [])
+    rule = ReachabilityRule("Actor", "kb_number", "COACTOR", "both", "_KevinBacon")
+    delta = materialize(projection, label_closure, relationship_closure, ["COACTOR"], [rule])
+    labels, relationships, properties = named(projection, delta)
+    assert labels == {"Person": {"keanu", "carrie", "lana", "kevin"}}
+    assert relationships == {"INVOLVED_IN": {("keanu", "matrix"), ("carrie", "matrix"), ("lana", "matrix")},
+                             "COACTOR": {("carrie", "keanu"), ("kevin", "carrie")}}
+    assert properties == {"kb_number": {"keanu": 2, "carrie": 1, "kevin": 0}}
+
+
+def test_materialize_of_a_closed_projection_is_empty():
+    projection = GraphProjection.from_records([("a", ["Actor", "Person"])], {"KNOWS": [("a", "b"), ("b", "a")]})
+    delta = materialize(projection, {"Actor": {"Person"}}, {}, ["KNOWS"])
+    assert not delta
+
+
+def test_write_delta_batches_rows_with_metadata(projection):
+    delta = materialize(projection, {"Actor": {"Person"}}, {}, [])
+    statements = []
+
+    class Transaction:
+        def run(self, query, rows):
+            statements.append((query, rows))
+            return type("Result", (), {"consume": lambda self: "summary"})()
+
+    class Session:
+        def execute_write(self, work, *args):
+            statements.append(getattr(work, "metadata", None))
+            return work(Transaction(), *args)
+
+    summaries = write_delta(Session(), projection, delta, batch_size=2, metadata={"app": "test"})
+    assert summaries == ["summary", "summary"]
+    assert statements[0] == {"app": "test"}
+    assert [rows for _, rows in statements[1::2]] == [["keanu", "carrie"], ["kevin"]]
+    assert "SET n:Person" in statements[1][0]
+
+
+def test_materialize_removes_the_distance_of_owners_no_longer_reaching_a_target():
+    projection = GraphProjection.from_records(
+        [("keanu", ["Actor"]), ("carrie", ["Actor"]), ("hugo", ["Actor"]), ("kevin", ["Actor", "_KevinBacon"])],
+        {"COACTOR": [("carrie", "kevin")]}, {"kb_number": {"keanu": 2, "carrie": 1, "kevin": 0}})
+    rule = ReachabilityRule("Actor", "kb_number", "COACTOR", "both", "_KevinBacon")
+    _, _, properties = named(projection, materialize(projection, {}, {}, [], [rule]))
+    assert properties == {"kb_number": {"keanu": None}}
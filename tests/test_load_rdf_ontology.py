@@ -0,0 +1,88 @@
+"""Chunked Turtle and N-Triples parsing against a parse of the whole file."""
+import os
+
+import pytest
+import rdflib
+from rdflib.compare import isomorphic
+
+from load_rdf_ontology import read_triples
+
+ONTOLOGIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ontologies")
+CHUNK_SIZES = [1, 2, 7, 100000]
+
+
+def chunked(path, chunk_size, rdf_format=None):
+    graph = rdflib.Graph()
+    for chunk in read_triples(str(path), rdf_format, chunk_size):
+        for triple in chunk:
+            graph.add(triple)
+    return graph
+
+
+def assert_chunked_parse_matches(path, rdf_format="turtle"):
+    whole = rdflib.Graph().parse(str(path), format=rdf_format)
+    for chunk_size in CHUNK_SIZES:
+        assert isomorphic(chunked(path, chunk_size, rdf_format), whole), f"chunk size {chunk_size}"
+
+
+@pytest.mark.parametrize("path", ["movie_graph/movie_graph.ttl", "core/lpg_ontology.ttl"])
+def test_bundled_ontologies(path):
+    assert_chunked_parse_matches(os.path.join(ONTOLOGIES, path))
+
+
+def test_prefixes_apply_to_every_later_chunk(tmp_path):
+    path = tmp_path / "prefixes.ttl"
+    path.write_text("@prefix ex: <http://example.org/> .\n"
+                    "ex:a ex:p ex:b .\n"
+                    "PREFIX other: <http://other.org/>\n"
+                    "ex:b ex:p other:c .\n"
+                    "@prefix ex: <http://example.com/> .\n"
+                    "ex:c ex:p other:d .\n")
+    assert_chunked_parse_matches(path)
+    assert (rdflib.URIRef("http://example.com/c"), rdflib.URIRef("http://example.com/p"),
+            rdflib.URIRef("http://other.org/d")) in chunked(path, 1)
+
+
+def test_multi_line_literals_are_not_split(tmp_path):
+    path = tmp_path / "literals.ttl"
+    path.write_text('@prefix ex: <http://example.org/> .\n'
+                    'ex:a ex:comment """first line .\n'
+                    '# not a comment .\n'
+                    'last line""" .\n'
+                    "ex:b ex:comment '''it's .\n"
+                    "done''' ; ex:label \"a . b\" .\n"
+                    'ex:c ex:p ex:d .\n')
+    assert_chunked_parse_matches(path)
+    comments = {str(value) for value in chunked(path, 1).objects(None, rdflib.URIRef("http://example.org/comment"))}
+    assert comments == {"first line .\n# not a comment .\nlast line", "it's .\ndone"}
+
+
+def test_comments_do_not_end_or_split_statements(tmp_path):
+    path = tmp_path / "comments.ttl"
+    path.write_text("@prefix ex: <http://example.org/> .\n"
+                    "# a comment ending with a dot .\n"
+                    "ex:a ex:p ex:b ; # \"unbalanced quote and [ bracket .\n"
+                    "     ex:q [ ex:r ex:c ] .\n"
+                    "ex:d ex:p ex:e . # trailing comment .\n"
+                    "ex:f ex:p ( ex:g\n"
+                    "  ex:h ) .\n")
+    assert_chunked_parse_matches(path)
+    assert len(list(read_triples(str(path), "turtle", 1))) == 3
+
+
+def test_labelled_blank_nodes_keep_their_identity_across_chunks(tmp_path):
+    path = tmp_path / "bnodes.ttl"
+    path.write_text("@prefix ex: <http://example.org/> .\n"
+                    "_:x ex:p ex:a .\n"
+                    "ex:b ex:p _:x .\n")
+    assert_chunked_parse_matches(path)
+    graph = chunked(path, 1)
+    assert len(set(graph.subjects()) | set(graph.objects())) == 3
+
+
+def test_n_triples_chunks(tmp_path):
+    path = tmp_path / "triples.nt"
+    path.write_text("<http://example.org/a> <http://example.org/p> _:x .\n"
+                    "_:x <http://example.org/p> \"multi\\nline\" .\n"
+                    "_:x <http://example.org/q> <http://example.org/b> .\n")
+    assert_chunked_parse_matches(path, "nt")
@@ -0,0 +1,61 @@
+"""SCO / IMPLIES / EQUIVALENT closure with union-find and Tarjan's SCCs."""
+from ontology_closure import UnionFind, hierarchy_closure, split_hierarchy, strongly_connected_components
+
+
+def test_chains_imply_every_ancestor():
+    closure = hierarchy_closure([("Actor", "Person"), ("Person", "Agent")])
+    assert closure == {"Actor": {"Person", "Agent"}, "Person": {"Agent"}, "Agent": set()}
+
+
+def test_diamonds_reach_the_shared_ancestor_once():
+    closure = hierarchy_closure([("Actor", "Artist"), ("Actor", "Employee"),
+                                 ("Artist", "Person"), ("Employee", "Person")])
+    assert closure["Actor"] == {"Artist", "Employee", "Person"}
+    assert closure["Artist"] == closure["Employee"] == {"Person"}
+
+
+def test_cycles_collapse_into_one_class():
+    closure = hierarchy_closure([("A", "B"), ("B", "C"), ("C", "A"), ("C", "D")])
+    assert closure == {"A": {"B", "C", "D"}, "B": {"A", "C", "D"}, "C": {"A", "B", "D"}, "D": set()}
+
+
+def test_equivalent_names_share_their_ancestors_and_imply_each_other():
+    closure = hierarchy_closure([("Film", "Work"), ("Movie", "Media")], [("Film", "Movie")])
+    assert closure["Film"] == {"Movie", "Work", "Media"}
+    assert closure["Movie"] == {"Film", "Work", "Media"}
+    assert closure["Work"] == closure["Media"] == set()
+
+
+def test_equivalences_alone_and_chained():
+    closure = hierarchy_closure([], [("A", "B"), ("B", "C")])
+    assert closure == {"A": {"B", "C"}, "B": {"A", "C"}, "C": {"A", "B"}}
+
+
+def test_descendants_of_an_equivalence_class_reach_all_its_members():
+    closure = hierarchy_closure([("Actor", "Film"), ("Movie", "Work")], [("Film", "Movie")])
+    assert closure["Actor"] == {"Film", "Movie", "Work"}
+
+
+def test_union_find_groups():
+    classes = UnionFind()
+    classes.union("b", "a")
+    classes.union("c", "b")
+    classes.find("d")
+    assert classes.find("c") == "a"
+    assert dict(classes.groups()) == {"a": {"a", "b", "c"}, "d": {"d"}}
+
+
+def test_components_come_after_every_component_they_reach():
+    components = strongly_connected_components({"a": {"b"}, "b": {"c", "a"}, "c": {"d"}})
+    assert components == [["d"], ["c"], ["a", "b"]]
+
+
+def test_split_hierarchy_by_kind_and_edge():
+    records = [{"edge": "SCO", "is_relationship": False, "a": "Actor", "b": "Person"},
+               {"edge": "EQUIVALENT", "is_relationship": False, "a": "Film", "b": "Movie"},
+               {"edge": "IMPLIES", "is_relationship": True, "a": "ACTED_IN", "b": "WORKED_ON"},
+               {"edge": "EQUIVALENT", "is_relationship": True, "a": "KNOWS", "b": "ACQUAINTED"}]
+    assert split_hierarchy(records) == {"label_edges": [("Actor", "Person")],
+                                        "label_equivalences": [("Film", "Movie")],
+                                        "relationship_edges": [("ACTED_IN", "WORKED_ON")],
+                                        "relationship_equivalences": [("KNOWS", "ACQUAINTED")]}
@@ -0,0 +1,58 @@
+"""Compiling the movie graph ontology to the NeoOWL meta-model."""
+import os
+from collections import Counter
+
+import pytest
+
+from owl2neoowl import compile_ontology
+
+MOVIE_GRAPH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ontologies", "movie_graph",
+                           "movie_graph.ttl")
+
+
+@pytest.fixture(scope="module", params=[1, 100000])
+def compiled(request):
+    return compile_ontology(MOVIE_GRAPH, chunk_size=request.param)
+
+
+def test_node_and_edge_counts(compiled):
+    nodes, edges = compiled
+    assert (len(nodes), len(edges)) == (17, 23)
+    assert Counter(kind for kind, _ in nodes) == {"Label": 9, "Relationship": 7, "Property": 1}
+    assert Counter(edge_type for edge_type, _, _ in edges) == {"SCO": 5, "IMPLIES": 3, "EQUIVALENT": 4,
+                                                               "SOURCE": 5, "TARGET": 5, "HAS_PROPERTY": 1}
+
+
+def test_hierarchy_edges(compiled):
+    _, edges = compiled
+    names = {(edge_type, start[1], end[1]) for edge_type, start, end in edges}
+    assert {("SCO", "Actor", "Person"), ("SCO", "Director", "Person"), ("SCO", "_KevinBacon", "Actor"),
+            ("SCO", "_EasterEggActor", "Actor"), ("SCO", "_EasterEggActor", "Anomalous")} <= names
+    assert {("IMPLIES", "ACTED_IN", "INVOLVED_IN"), ("IMPLIES", "DIRECTED", "INVOLVED_IN"),
+            ("IMPLIES", "COACTOR", "COLLABORATOR")} <= names
+    assert {("EQUIVALENT", "_PersonActedInSome", "Actor"), ("EQUIVALENT", "_PersonDirectedSome", "Director"),
+            ("EQUIVALENT", "_COACTOR", "COACTOR"), ("EQUIVALENT", "_COLLABORATOR", "COLLABORATOR")} <= names
+
+
+def test_domains_ranges_and_properties(compiled):
+    _, edges = compiled
+    assert ("SOURCE", ("Relationship", "ACTED_IN"), ("Label", "Person")) in edges
+    assert ("TARGET", ("Relationship", "ACTED_IN"), ("Label", "Movie")) in edges
+    assert ("TARGET", ("Relationship", "COACTOR"), ("Label", "Person")) in edges
+    assert ("HAS_PROPERTY", ("Label", "Actor"), ("Property", "kb_number")) in edges
+
+
+def test_pattern_definitions_and_symmetry(compiled):
+    nodes, _ = compiled
+    labels, properties = nodes[("Label", "_KevinBacon")]
+    assert labels == {"PatternDefinedLabel"}
+    assert properties["pattern"] == "(p:Person {name: 'Kevin Bacon'})"
+    assert properties["classElementVariable"] == "p"
+    labels, properties = nodes[("Relationship", "_COACTOR")]
+    assert labels == {"PatternDefinedRelationship"}
+    assert (properties["sourceElementVariable"], properties["targetElementVariable"]) == ("s", "t")
+    labels, properties = nodes[("Property", "kb_number")]
+    assert labels == {"PatternDefinedNodeProperty"}
+    assert (properties["propertyOwnerVariable"], properties["valueVariable"]) == ("x", "kbn")
+    assert nodes[("Relationship", "COACTOR")][0] == {"Symmetric"}
+    assert nodes[("Relationship", "ACTED_IN")][0] == set()
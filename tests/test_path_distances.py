@@ -0,0 +1,98 @@
+"""PathDistances over an in-process graph standing in for a Neo4j session."""
+import pytest
+
+from path_distances import PathDistances, ReachabilityRule
+
+
+class Summary:
+    pass
+
+
+class Result(list):
+    def consume(self):
+        return Summary()
+
+
+class Graph:
+    """Labelled nodes and undirected COACTOR edges answering the PathDistances queries."""
+    def __init__(self, labels, edges):
+        self.labels = {node: set(names) for node, names in labels.items()}
+        self.edges = {frozenset(edge) for edge in edges}
+        self.properties = {}
+
+    def neighbours(self, node):
+        return [other for edge in self.edges if node in edge for other in edge if other != node]
+
+    def run(self, distances, query, params):
+        rule = distances.rule
+        if query == distances.targets_query:
+            return Result({"id": node} for node, names in self.labels.items() if rule.target_label in names)
+        if query == distances.owners_query:
+            return Result({"id": node} for node in self.properties)
+        if query in (distances.outward_query, distances.inward_query):
+            return Result({"id": node, "target": rule.target_label in self.labels[node],
+                           "neighbours": self.neighbours(node)} for node in params["ids"] if node in self.labels)
+        assert query == distances.write_query
+        written = Result()
+        for node, value in params["rows"]:
+            if rule.owner_label in self.labels.get(node, ()) and self.properties.get(node) != value:
+                if value is None:
+                    del self.properties[node]
+                else:
+                    self.properties[node] = value
+                written.append({"id": node})
+        return written
+
+    def session(self, distances):
+        graph = self
+
+        class Transaction:
+            def run(self, query, params):
+                return graph.run(distances, query, params)
+
+        class Session:
+            def execute_read(self, work):
+                return work(Transaction())
+
+            execute_write = execute_read
+
+        return Session()
+
+
+@pytest.fixture
+def chain():
+    """kb - a - b - c, where kb is the target and a and c are owners."""
+    graph = Graph({"kb": {"_KevinBacon"}, "a": {"Actor"}, "b": set(), "c": {"Actor"}},
+                  [("kb", "a"), ("a", "b"), ("b", "c")])
+    distances = PathDistances(ReachabilityRule("Actor", "kb_number", "COACTOR", "both", "_KevinBacon"))
+    distances.compute(graph.session(distances))
+    return graph, distances
+
+
+def test_compute_writes_owner_distances(chain):
+    graph, _ = chain
+    assert graph.properties == {"a": 1, "c": 3}
+
+
+def test_repair_sets_the_distance_of_a_new_owner(chain):
+    graph, distances = chain
+    graph.labels["b"].add("Actor")
+    written, _ = distances.repair(graph.session(distances), ["b"])
+    assert written == {"b"}
+    assert graph.properties == {"a": 1, "b": 2, "c": 3}
+
+
+def test_repair_after_edge_removal_drops_unreached_owners(chain):
+    graph, distances = chain
+    graph.edges.discard(frozenset(("a", "b")))
+    written, _ = distances.repair(graph.session(distances), ["a", "b"])
+    assert written == {"c"}
+    assert graph.properties == {"a": 1}
+    assert distances.distances == {"kb": 0, "a": 1}
+
+
+def test_repair_after_edge_addition_shortens_distances(chain):
+    graph, distances = chain
+    graph.edges.add(frozenset(("kb", "c")))
+    distances.repair(graph.session(distances), ["kb", "c"])
+    assert graph.properties == {"a": 1, "c": 1}
@@ -0,0 +1,45 @@
+"""Query-time rewriting of the hierarchy and symmetry inferences."""
+import pytest
+
+from query_rewriter import QueryRewriter
+
+ONTOLOGY = {"hierarchy": [dict(edge="SCO", is_relationship=False, a="Actor", b="Person"),
+                          dict(edge="SCO", is_relationship=False, a="Director", b="Person"),
+                          dict(edge="EQUIVALENT", is_relationship=False, a="_PersonActedInSome", b="Actor"),
+                          dict(edge="IMPLIES", is_relationship=True, a="ACTED_IN", b="INVOLVED_IN")],
+            "symmetric": [{"sim_rel": "COACTOR"}]}
+
+PERSON = "(Person|Actor|Director|_PersonActedInSome)"
+
+
+@pytest.fixture
+def rewriter():
+    return QueryRewriter(ONTOLOGY)
+
+
+def test_labels_and_types_are_widened(rewriter):
+    assert rewriter.rewrite("MATCH (p:Person)-[:INVOLVED_IN]->(m) RETURN p") == \
+        f"MATCH (p:{PERSON})-[:INVOLVED_IN|ACTED_IN]->(m) RETURN p"
+
+
+def test_strings_comments_and_map_keys_are_left_alone(rewriter):
+    assert rewriter.rewrite("MATCH (p:Person {name: 'Person'}) WHERE p:Actor RETURN p {.name, Person: 1} // :Person") \
+        == f"MATCH (p:{PERSON} {{name: 'Person'}}) WHERE p:(Actor|_PersonActedInSome) " \
+           "RETURN p {.name, Person: 1} // :Person"
+
+
+def test_symmetric_patterns_lose_their_direction_but_writes_are_kept(rewriter):
+    assert rewriter.rewrite("MATCH (a)-[:COACTOR]->(b) CREATE (a)-[:KNOWS]->(b:Person) RETURN a") == \
+        "MATCH (a)-[:COACTOR]-(b) CREATE (a)-[:KNOWS]->(b:Person) RETURN a"
+
+
+def test_subqueries_are_rewritten_but_set_clauses_are_not(rewriter):
+    assert rewriter.rewrite("MATCH (p) WHERE EXISTS { (p)-[:INVOLVED_IN]->(:Movie) } SET p:Person") == \
+        "MATCH (p) WHERE EXISTS { (p)-[:INVOLVED_IN|ACTED_IN]->(:Movie) } SET p:Person"
+
+
+def test_only_the_virtual_kinds_are_rewritten():
+    rewriter = QueryRewriter(ONTOLOGY, virtual=["implies"])
+    assert rewriter.rewrite("MATCH (p:Person)-[:INVOLVED_IN]->()-[:COACTOR]->() RETURN p") == \
+        "MATCH (p:Person)-[:INVOLVED_IN|ACTED_IN]->()-[:COACTOR]->() RETURN p"
+    assert rewriter.label_expression("Person") == "Person"
@@ -0,0 +1,86 @@
+"""Delete-and-rederive over labels held by an in-process graph standing in for a transaction."""
+import re
+
+from infer_to_convergence import Rule
+from retraction import HOLDING_LABELS_QUERY, Retraction
+from rule_dependencies import label, stratify
+
+
+def label_rule(reads, writes):
+    """A rule setting the `writes` labels on nodes with the `reads` label."""
+    return Rule(kind="sco", query=f"rule {reads}", seminaive_query="", source=reads,
+                reads=frozenset({label(reads)}), writes=frozenset(label(name) for name in writes),
+                dependents_query=f"dependents {reads}", support_query=f"support {reads}")
+
+
+# A SCO B, B EQUIVALENT E and D SCO E, compiled like the closure rules
+RULES = [label_rule("A", ["B", "E"]), label_rule("B", ["E"]), label_rule("E", ["B"]), label_rule("D", ["E"])]
+
+
+class Result(list):
+    def consume(self):
+        return None
+
+
+class Graph:
+    """Node labels, asserted or inferred, answering the queries of a Retraction."""
+    def __init__(self, asserted, inferred):
+        self.labels = {node: set(names) | set(inferred.get(node, ())) for node, names in asserted.items()}
+        self.inferred = {node: set(names) for node, names in inferred.items()}
+        self.rules = {rule.source: rule for rule in RULES}
+
+    def run(self, query, params):
+        if query == HOLDING_LABELS_QUERY:
+            return Result({"fact": fact} for fact in params["facts"] if fact[0] in self.labels[fact[1]])
+        kind, _, source = query.partition(" ")
+        if kind == "dependents":
+            rule = self.rules[source]
+            return Result({"name": name, "fact": [node]} for node, in params["neoowl_facts"]
+                          for name in sorted(self.inferred.get(node, ())) if label(name) in rule.writes)
+        if kind == "support":
+            return Result({"fact": [node]} for node, in params["neoowl_facts"] if source in self.labels[node])
+        removed, added = re.search(r"REMOVE x:(\w+)", query), re.search(r"SET x:(\w+)", query)
+        for node, in params["facts"]:
+            if removed:
+                self.labels[node].discard(removed.group(1))
+                self.inferred[node].discard(removed.group(1))
+            else:
+                self.labels[node].add(added.group(1))
+                self.inferred.setdefault(node, set()).add(added.group(1))
+        return Result()
+
+
+def retract(graph, removed):
+    for node, name in removed:
+        graph.labels[node].discard(name)
+    return Retraction(stratify(RULES)).run(graph, {(label(name), (node,)) for node, name in removed})
+
+
+def test_consequences_of_a_removed_label_are_retracted():
+    graph = Graph({"x": {"A"}}, {"x": {"B", "E"}})
+    retracted, restored, _ = retract(graph, [("x", "A")])
+    assert graph.labels["x"] == set()
+    assert retracted == {(label("B"), ("x",)), (label("E"), ("x",))}
+    assert restored == set()
+
+
+def test_facts_with_another_derivation_survive():
+    graph = Graph({"y": {"A", "D"}}, {"y": {"B", "E"}})
+    retract(graph, [("y", "A")])
+    assert graph.labels["y"] == {"D", "B", "E"}
+
+
+def test_removed_label_still_derived_is_restored():
+    graph = Graph({"z": {"D"}}, {"z": {"E"}})
+    graph.labels["z"] |= {"B"}
+    _, restored, _ = retract(graph, [("z", "B")])
+    # E is overdeleted with B, whose stratum is recursive, and rederived with it
+    assert restored == {(label("B"), ("z",)), (label("E"), ("z",))}
+    assert graph.labels["z"] == {"B", "D", "E"}
+
+
+def test_removed_label_that_holds_again_is_ignored():
+    graph = Graph({"w": {"A"}}, {"w": {"B", "E"}})
+    retracted, restored, _ = Retraction(stratify(RULES)).run(graph, {(label("A"), ("w",))})
+    assert (retracted, restored) == (set(), set())
+    assert graph.labels["w"] == {"A", "B", "E"}
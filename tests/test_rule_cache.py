@@ -0,0 +1,84 @@
+"""Rule cache entries, their fingerprints and incremental rule updates."""
+import rule_cache
+from infer_to_convergence import NeoOWLReasoner, Rule
+from rule_cache import RuleCache, fingerprint
+from rule_dependencies import label
+
+
+def ontology(*edges):
+    return {"pattern_labels": [], "pattern_relationships": [], "symmetric": [], "pattern_properties": [],
+            "hierarchy": [{"edge": "SCO", "is_relationship": False, "a": a, "b": b} for a, b in edges]}
+
+
+class OntologyConnection:
+    """Serves `self.ontology` as the result of the ontology query."""
+    def __init__(self, ontology):
+        self.ontology = ontology
+        self.driver = self
+
+    def execute_query(self, query, **options):
+        return [type("Record", (), {"data": lambda record: self.ontology})()], None, None
+
+
+def reasoner(cache, ontology):
+    return NeoOWLReasoner(None, OntologyConnection(ontology), rule_cache=str(cache))
+
+
+def sources(rules):
+    return sorted(rule.source for rule in rules)
+
+
+def test_fingerprint_depends_on_the_parts_and_the_compiler_version(monkeypatch):
+    key = fingerprint("hierarchy", [{"a": "Actor", "b": "Person"}])
+    assert key == fingerprint("hierarchy", [{"b": "Person", "a": "Actor"}])
+    assert key != fingerprint("hierarchy", [{"a": "Actor", "b": "Agent"}])
+    monkeypatch.setattr(rule_cache, "COMPILER_VERSION", rule_cache.COMPILER_VERSION + 1)
+    assert key != fingerprint("hierarchy", [{"a": "Actor", "b": "Person"}])
+
+
+def test_cache_entries_round_trip(tmp_path):
+    cache = RuleCache(str(tmp_path / "rules"), Rule)
+    rules = [Rule(kind="sco", query="q", seminaive_query="s", reads=frozenset({label("A")}),
+                  writes=frozenset({label("B")}), source="A", reachability={"owner_label": "A"})]
+    assert cache.load("key") is None
+    cache.save("key", rules)
+    assert cache.load("key") == rules
+
+
+def test_unreadable_cache_entries_are_ignored(tmp_path):
+    (tmp_path / "key.json").write_text("{not json")
+    assert RuleCache(str(tmp_path), Rule).load("key") is None
+
+
+def test_a_restart_on_an_unchanged_ontology_loads_the_cached_rules(tmp_path, monkeypatch):
+    first = reasoner(tmp_path, ontology(("Actor", "Person"), ("Person", "Agent")))
+    assert len(list(tmp_path.glob("*.json"))) == len(first.sections)
+
+    def compile_hierarchy(self, records):
+        raise AssertionError("the hierarchy was compiled again")
+
+    monkeypatch.setattr(NeoOWLReasoner, "_generate_hierarchy_rules", compile_hierarchy)
+    second = reasoner(tmp_path, ontology(("Actor", "Person"), ("Person", "Agent")))
+    assert second.rules == first.rules
+
+
+def test_a_new_compiler_version_recompiles(tmp_path, monkeypatch):
+    reasoner(tmp_path, ontology(("Actor", "Person")))
+    compiled = []
+    original = NeoOWLReasoner._generate_hierarchy_rules
+    monkeypatch.setattr(NeoOWLReasoner, "_generate_hierarchy_rules",
+                        lambda self, records: compiled.append(records) or original(self, records))
+    monkeypatch.setattr(rule_cache, "COMPILER_VERSION", rule_cache.COMPILER_VERSION + 1)
+    reasoner(tmp_path, ontology(("Actor", "Person")))
+    assert len(compiled) == 1
+
+
+def test_update_rules_returns_the_new_rules_and_keeps_the_unchanged_ones(tmp_path):
+    instance = reasoner(tmp_path, ontology(("Actor", "Person"), ("Director", "Person")))
+    actor = next(rule for rule in instance.rules if rule.source == "Actor")
+    assert instance.update_rules(ontology(("Actor", "Person"), ("Director", "Person"))) == []
+    new_rules = instance.update_rules(ontology(("Actor", "Person"), ("Director", "Agent")))
+    assert sources(new_rules) == ["Director"]
+    assert sources(instance.rules) == ["Actor", "Director"]
+    assert any(rule is actor for rule in instance.rules)
+
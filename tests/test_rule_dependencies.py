@@ -0,0 +1,39 @@
+"""Read/write analysis of rules and their stratification."""
+from infer_to_convergence import Rule
+from rule_dependencies import dependency_graph, label, node_property, pattern_tokens, relationship_type, stratify
+
+
+def rule(source, reads, writes):
+    return Rule(kind="sco", query=f"rule {source}", seminaive_query="", source=source,
+                reads=frozenset(label(name) for name in reads), writes=frozenset(label(name) for name in writes))
+
+
+def strata(rules):
+    return [([rule.source for rule in rules], recursive) for rules, recursive in stratify(rules)]
+
+
+def test_pattern_tokens():
+    tokens = pattern_tokens("(p:Person {name: 'A:B'})-[:ACTED_IN|DIRECTED]->(m:Movie) WHERE m.year > 2000")
+    assert tokens == {label("Person"), label("Movie"), relationship_type("ACTED_IN"),
+                      relationship_type("DIRECTED"), node_property("name"), node_property("year")}
+
+
+def test_dependency_graph_links_writers_to_readers():
+    rules = [rule("a", ["A"], ["B"]), rule("b", ["B"], ["C"]), rule("c", ["B", "C"], ["D"])]
+    assert dependency_graph(rules) == {0: {1, 2}, 1: {2}, 2: set()}
+
+
+def test_strata_follow_the_dependency_order():
+    rules = [rule("c", ["C"], ["D"]), rule("b", ["B"], ["C"]), rule("a", ["A"], ["B"])]
+    assert strata(rules) == [(["a"], False), (["b"], False), (["c"], False)]
+
+
+def test_rules_on_a_cycle_share_a_recursive_stratum():
+    rules = [rule("after", ["B"], ["Z"]), rule("a", ["A"], ["B"]), rule("b", ["B"], ["A"]),
+             rule("before", ["X"], ["A"])]
+    assert strata(rules) == [(["before"], False), (["a", "b"], True), (["after"], False)]
+
+
+def test_a_rule_reading_what_it_writes_is_recursive_on_its_own():
+    rules = [rule("transitive", ["KNOWS"], ["KNOWS"]), rule("other", ["X"], ["Y"])]
+    assert sorted(strata(rules)) == [(["other"], False), (["transitive"], True)]
@@ -0,0 +1,66 @@
+"""Wave scheduling of concurrent rules and merging the summaries of a partitioned rule run."""
+from types import SimpleNamespace
+
+from infer_to_convergence import Rule
+from rule_dependencies import label, node_property, relationship_type
+from rule_executor import PartitionedSummary, schedule_waves
+from rule_metrics import COUNTERS
+
+
+def summary(profile=None, **counters):
+    values = {counter: counters.get(counter, 0) for counter in COUNTERS}
+    return SimpleNamespace(counters=SimpleNamespace(contains_updates=any(values.values()), **values),
+                           result_available_after=50, result_consumed_after=5, profile=profile)
+
+
+def test_partition_counters_are_summed_over_the_wall_time():
+    merged = PartitionedSummary([summary(labels_added=2), summary(), summary(labels_added=3, properties_set=1)],
+                                seconds=1.2345)
+    assert merged.counters.contains_updates
+    assert merged.counters.labels_added == 5
+    assert merged.counters.properties_set == 1
+    assert merged.counters.relationships_created == 0
+    assert (merged.result_available_after, merged.result_consumed_after) == (1234, 0)
+    assert merged.profile is None
+
+
+def test_partitions_without_updates_merge_into_no_updates():
+    assert not PartitionedSummary([summary(), summary()], seconds=0.1).counters.contains_updates
+
+
+def test_partition_plans_become_children_of_one_plan():
+    plans = [{"operatorType": "ProduceResults", "dbHits": 3}, {"operatorType": "ProduceResults", "dbHits": 4}]
+    merged = PartitionedSummary([summary(plans[0]), summary(), summary(plans[1])], seconds=0.1)
+    assert merged.profile == {"operatorType": "Partitions", "dbHits": 0, "children": plans}
+
+
+def rule(source, reads=(), writes=()):
+    return Rule(kind="sco", query=source, seminaive_query="", source=source,
+                reads=frozenset(reads), writes=frozenset(writes))
+
+
+def sources(waves):
+    return [[rule.source for rule in wave] for wave in waves]
+
+
+def test_independent_rules_share_a_wave():
+    rules = [rule("a", [label("A")], [label("B")]), rule("b", [label("X")], [label("Y")]),
+             rule("c", [label("A")], [label("B")])]
+    assert sources(schedule_waves(rules)) == [["a", "b", "c"]]
+
+
+def test_rules_writing_the_same_relationship_type_or_property_are_serialized():
+    rules = [rule("a", [label("A")], [relationship_type("KNOWS")]), rule("b", [label("B")], [node_property("p")]),
+             rule("c", [label("C")], [relationship_type("KNOWS")]), rule("d", [label("D")], [node_property("p")])]
+    assert sources(schedule_waves(rules)) == [["a", "b"], ["c", "d"]]
+
+
+def test_a_rule_runs_after_the_rules_writing_what_it_reads():
+    rules = [rule("a", [label("A")], [label("B")]), rule("b", [label("B")], [label("C")]),
+             rule("c", [label("X")], [label("Y")]), rule("d", [label("C")], [label("D")])]
+    assert sources(schedule_waves(rules)) == [["a", "c"], ["b"], ["d"]]
+
+
+def test_a_rule_reading_what_a_later_rule_writes_is_not_delayed():
+    rules = [rule("b", [label("B")], [label("C")]), rule("a", [label("A")], [label("B")])]
+    assert sources(schedule_waves(rules)) == [["b", "a"]]
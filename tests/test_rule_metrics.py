@@ -0,0 +1,65 @@
+"""Rule metrics aggregation and their Prometheus exposition."""
+from types import SimpleNamespace
+
+from rule_metrics import COUNTERS, RuleMetrics, db_hits, merge_prometheus, prometheus_labels
+
+
+def summary(milliseconds, profile=None, **counters):
+    values = {counter: counters.get(counter, 0) for counter in COUNTERS}
+    return SimpleNamespace(counters=SimpleNamespace(contains_updates=any(values.values()), **values),
+                           result_available_after=milliseconds, result_consumed_after=0, profile=profile)
+
+
+def samples(text):
+    return {line.rsplit(" ", 1)[0]: line.rsplit(" ", 1)[1] for line in text.splitlines() if not line.startswith("#")}
+
+
+def recorded():
+    metrics = RuleMetrics()
+    metrics.start_run("naive")
+    metrics.record("sco", "Actor", summary(250, labels_added=3), rows=3)
+    metrics.record("sco", "Actor", summary(250, labels_added=1), rows=1)
+    metrics.record("symmetric", 'CO"ACTOR', summary(100, {"dbHits": 2, "children": [{"dbHits": 5}]},
+                                                        relationships_created=2))
+    metrics.end_iteration()
+    metrics.end_run()
+    return metrics
+
+
+def test_db_hits_sum_over_the_plan():
+    assert db_hits({"dbHits": 1, "children": [{"dbHits": 2, "children": [{"dbHits": 3}]}]}) == 6
+    assert db_hits(None) == 0
+
+
+def test_prometheus_renders_counters_per_rule():
+    text = recorded().prometheus()
+    values = samples(text)
+    assert "# TYPE neoowl_rule_runs_total counter" in text.splitlines()
+    assert values['neoowl_rule_runs_total{kind="sco",source="Actor"}'] == "2"
+    assert values['neoowl_rule_labels_added_total{kind="sco",source="Actor"}'] == "4"
+    assert values['neoowl_rule_rows_total{kind="sco",source="Actor"}'] == "4"
+    assert values['neoowl_rule_seconds_total{kind="sco",source="Actor"}'] == "0.5"
+    assert values['neoowl_rule_relationships_created_total{kind="symmetric",source="CO\\"ACTOR"}'] == "2"
+    assert values['neoowl_rule_db_hits_total{kind="symmetric",source="CO\\"ACTOR"}'] == "7"
+    assert values['neoowl_inference_runs_total{mode="naive"}'] == "1"
+    assert values["neoowl_inference_iterations_total"] == "1"
+
+
+def test_prometheus_constant_labels():
+    values = samples(recorded().prometheus({"database": "movies", "ontology": "movie_ontology"}))
+    assert values['neoowl_rule_runs_total{database="movies",ontology="movie_ontology",kind="sco",source="Actor"}'] == "2"
+    assert values['neoowl_inference_iterations_total{database="movies",ontology="movie_ontology"}'] == "1"
+    assert prometheus_labels({"b": "x\ny", "a": 1}) == 'a="1",b="x\\ny",'
+
+
+def test_merge_prometheus_declares_each_family_once():
+    merged = merge_prometheus([recorded().prometheus({"database": "movies"}),
+                               recorded().prometheus({"database": "shop"})])
+    lines = merged.splitlines()
+    assert lines.count("# TYPE neoowl_rule_runs_total counter") == 1
+    family = lines[lines.index("# TYPE neoowl_rule_runs_total counter") + 1:][:4]
+    assert family == ['neoowl_rule_runs_total{database="movies",kind="sco",source="Actor"} 2',
+                      'neoowl_rule_runs_total{database="movies",kind="symmetric",source="CO\\"ACTOR"} 1',
+                      'neoowl_rule_runs_total{database="shop",kind="sco",source="Actor"} 2',
+                      'neoowl_rule_runs_total{database="shop",kind="symmetric",source="CO\\"ACTOR"} 1']
+    assert samples(merged)['neoowl_inference_iterations_total{database="shop"}'] == "1"
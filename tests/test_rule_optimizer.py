@@ -0,0 +1,73 @@
+"""Rule grouping, read-only probes and element id partitions of heavy rules."""
+from batching import load_batch_settings
+from infer_to_convergence import NeoOWLReasoner
+from rule_optimizer import group_records, partition_domain, partitioned_query, probe_query
+
+
+def compiler():
+    instance = NeoOWLReasoner.__new__(NeoOWLReasoner)
+    instance.batch_settings = load_batch_settings()
+    return instance
+
+
+def lines(query):
+    return [line.strip() for line in query.strip().splitlines()]
+
+
+def test_group_records_by_keys_in_order():
+    records = [{"name": "A", "pattern": "(p:Person)", "v": "p"}, {"name": "B", "pattern": "(m:Movie)", "v": "m"},
+               {"name": "C", "pattern": "(p:Person)", "v": "p"}, {"name": "D", "pattern": "(p:Person)", "v": "q"}]
+    assert [[record["name"] for record in group] for group in group_records(records, "pattern", "v")] == \
+        [["A", "C"], ["B"], ["D"]]
+
+
+def test_labels_sharing_a_pattern_compile_to_one_rule():
+    rules = compiler()._generate_pattern_defined_label_rules([
+        {"name": "_Recent", "pattern": "(m:Movie) WHERE m.released >= 2000", "classElementVariable": "m"},
+        {"name": "_Modern", "pattern": "(m:Movie) WHERE m.released >= 2000", "classElementVariable": "m"}])
+    assert [rule.source for rule in rules] == ["_Recent,_Modern"]
+    assert "SET m:_Recent:_Modern" in rules[0].query
+
+
+def test_probe_of_a_label_rule_is_its_match_and_filter():
+    rule, = compiler()._generate_pattern_defined_label_rules([
+        {"name": "_Recent", "pattern": "(m:Movie) WHERE m.released >= 2000", "classElementVariable": "m"}])
+    assert lines(probe_query(rule.query)) == ["MATCH (m:Movie) WHERE m.released >= 2000",
+                                              "WITH DISTINCT m",
+                                              "WHERE NOT (m:_Recent)",
+                                              "RETURN true AS found LIMIT 1"]
+
+
+def test_probe_of_a_property_rule_keeps_its_value_subquery():
+    rule, = compiler()._generate_pattern_defined_property_rules([
+        {"label": "Person", "property_name": "roles", "variable": "x", "val_variable": "n",
+         "pattern": "(x)-[r:ACTED_IN]->(m) WITH x, count(r) AS n"}])
+    probe = lines(probe_query(rule.query))
+    assert probe[0] == "MATCH (x:Person)"
+    assert "WHERE x.roles IS NULL OR x.roles <> n" in probe
+    assert probe[-2:] == ["}", "RETURN true AS found LIMIT 1"]
+    assert not any("SET" in line for line in probe)
+
+
+def test_statements_without_a_batched_write_have_no_probe():
+    assert probe_query("MATCH (n:Actor) WHERE NOT n:Person SET n:Person") is None
+    assert probe_query("MATCH (n)\n    CALL (n) {\n        SET n:Seen\n    }\n    RETURN count(*)") is None
+
+
+def test_partition_domain_is_the_first_labelled_top_level_node_of_the_variable():
+    assert partition_domain("(p:Person)-[:ACTED_IN]->(m:Movie)", "p") == "(p:Person)"
+    assert partition_domain("(p)-[:ACTED_IN]->(m:Movie|Series)", "m") == "(m:Movie|Series)"
+    assert partition_domain("(p)-[:KNOWS]->(q), (p:Person&Actor)", "p") == "(p:Person&Actor)"
+
+
+def test_partition_domain_ignores_unlabelled_nested_and_other_variables():
+    assert partition_domain("(p)-[:ACTED_IN]->(m)", "p") is None
+    assert partition_domain("(x)((a:Person)-[:KNOWS]->(b)){1,3}(y)", "a") is None
+    assert partition_domain("(p) WHERE EXISTS { (p:Director) }", "p") is None
+    assert partition_domain("(pp:Person)-[:KNOWS]->(p)", "p") is None
+
+
+def test_partitioned_query_binds_the_partition_ids_first():
+    query = partitioned_query("\n    MATCH (p:Person) SET p:Human", "p")
+    assert query.split("\n")[0] == "MATCH (p) WHERE elementId(p) IN $neoowl_partition_ids"
+    assert query.split("\n")[1].strip() == "MATCH (p:Person) SET p:Human"
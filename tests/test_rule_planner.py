@@ -0,0 +1,50 @@
+"""Cost-based rule ordering."""
+from infer_to_convergence import Rule
+from rule_dependencies import label
+from rule_planner import RulePlanner, estimate
+
+
+def rule(source, reads, writes):
+    return Rule(kind="sco", query=f"rule {source}", seminaive_query="", source=source,
+                reads=frozenset(label(name) for name in reads), writes=frozenset(label(name) for name in writes))
+
+
+def sources(rules):
+    return [rule.source for rule in rules]
+
+
+def test_rules_run_after_the_rules_they_read_from_then_cheapest_first():
+    expensive, cheap = rule("expensive", ["A"], ["B"]), rule("cheap", ["X"], ["Y"])
+    reader = rule("reader", ["B"], ["C"])
+    planner = RulePlanner()
+    planner.history = {"sco:expensive": [1, 10.0], "sco:cheap": [2, 2.0], "sco:reader": [1, 0.1]}
+    assert sources(planner.order([reader, expensive, cheap])) == ["cheap", "expensive", "reader"]
+
+
+def test_recursive_rules_stay_together():
+    a, b = rule("a", ["A"], ["B"]), rule("b", ["B"], ["A"])
+    other = rule("other", ["A"], ["Z"])
+    planner = RulePlanner()
+    planner.history = {"sco:a": [1, 5.0], "sco:b": [1, 1.0], "sco:other": [1, 0.5]}
+    assert sources(planner.order([other, a, b])) == ["b", "a", "other"]
+
+
+def test_unrun_rules_are_costed_from_their_estimates():
+    known, unknown = rule("known", ["A"], ["B"]), rule("unknown", ["X"], ["Y"])
+    planner = RulePlanner()
+    planner.estimates = {("sco", known.query): 100, ("sco", unknown.query): 1000}
+    planner.history = {"sco:known": [1, 1.0]}
+    assert planner.costs([known, unknown]) == [1.0, 10.0]
+
+
+def test_timings_are_saved_and_reloaded(tmp_path):
+    path = str(tmp_path / "timings.json")
+    RulePlanner(path).record([{"kind": "sco", "source": "A", "runs": 2, "seconds": 3.0},
+                              {"kind": "sco", "source": "B", "runs": 0, "seconds": 0.0}])
+    assert RulePlanner(path).history == {"sco:A": [2, 3.0]}
+
+
+def test_estimate_sums_rows_and_flags_scans():
+    plan = {"operatorType": "ProduceResults@neo4j", "args": {"EstimatedRows": 10},
+            "children": [{"operatorType": "AllNodesScan@neo4j", "args": {"EstimatedRows": 90}}]}
+    assert estimate(plan) == (100, ["full node scan"])
@@ -0,0 +1,164 @@
+"""The snapshot engine over an in-process graph standing in for the database."""
+import re
+
+import pytest
+
+from cdc_changes import SNAPSHOT_METADATA, is_snapshot_write
+from rule_metrics import COUNTERS, RuleMetrics
+from snapshot_engine import SnapshotEngine
+
+ONTOLOGY = {
+    "pattern_labels": [
+        {"name": "_PersonActedInSome", "pattern": "(p:Person) WHERE EXISTS {(p)-[:ACTED_IN]->()}",
+         "classElementVariable": "p"},
+        {"name": "_KevinBacon", "pattern": "(p:Person {name: 'Kevin Bacon'})", "classElementVariable": "p"}],
+    "pattern_relationships": [
+        {"name": "_COACTOR", "pattern": "(s:Person)-[:ACTED_IN]->()<-[:ACTED_IN]-(t:Person)",
+         "sourceElementVariable": "s", "targetElementVariable": "t"}],
+    "hierarchy": [dict(edge="SCO", is_relationship=False, a="Actor", b="Person"),
+                  dict(edge="EQUIVALENT", is_relationship=False, a="_PersonActedInSome", b="Actor"),
+                  dict(edge="SCO", is_relationship=False, a="_KevinBacon", b="Actor"),
+                  dict(edge="EQUIVALENT", is_relationship=True, a="_COACTOR", b="COACTOR")],
+    "symmetric": [{"sim_rel": "COACTOR"}],
+    "pattern_properties": [
+        {"label": "Actor", "property_name": "kb_number", "variable": "x", "val_variable": "kbn",
+         "pattern": "SHORTEST 1 (x)-[ca:COACTOR]-*(y:_KevinBacon) WITH size(ca) AS kbn"}],
+}
+
+
+class Summary:
+    result_available_after = result_consumed_after = 1
+    profile = None
+
+    def __init__(self):
+        self.counters = type("Counters", (), dict.fromkeys(COUNTERS, 0))()
+
+
+class Result(list):
+    def consume(self):
+        return Summary()
+
+
+class Record(dict):
+    def values(self):
+        return list(dict.values(self))
+
+
+class Graph:
+    """Nodes, relationships and properties answering the snapshot engine's statements."""
+    def __init__(self):
+        self.labels = {"keanu": {"Person"}, "carrie": {"Person"}, "kevin": {"Person"}, "lana": {"Person"},
+                       "matrix": {"Movie"}, "apollo": {"Movie"}}
+        self.properties = {"kevin": {"name": "Kevin Bacon"}}
+        self.relationships = {("ACTED_IN", "keanu", "matrix"), ("ACTED_IN", "carrie", "matrix"),
+                              ("ACTED_IN", "carrie", "apollo"), ("ACTED_IN", "kevin", "apollo"),
+                              ("DIRECTED", "lana", "matrix")}
+        self.writes = []
+        self.engine = None
+
+    def pairs(self, rel_type):
+        return [(start, end) for name, start, end in self.relationships if name == rel_type]
+
+    def facts(self, query):
+        """The rows of the pattern rule `query` of the engine."""
+        for names, label_query in self.engine.label_queries:
+            if query == label_query and names == ["_PersonActedInSome"]:
+                return [Record(id=node) for node in sorted({start for start, _ in self.pairs("ACTED_IN")})]
+            if query == label_query and names == ["_KevinBacon"]:
+                return [Record(id=node) for node, values in self.properties.items()
+                        if values.get("name") == "Kevin Bacon"]
+        _, coactor_query = self.engine.relationship_queries[0]
+        assert query == coactor_query
+        return [Record(source=s, target=t) for s, m in self.pairs("ACTED_IN") for t, n in self.pairs("ACTED_IN")
+                if m == n and s != t]
+
+    def run(self, query, params=None, **kwargs):
+        params = {**(params or {}), **kwargs}
+        if query.startswith("MATCH (n) WHERE any(l IN labels(n)"):
+            return Result({"id": node, "labels": [name for name in names if name in params["labels"]],
+                           "properties": [[key, value] for key, value in self.properties.get(node, {}).items()
+                                          if key in params["properties"]]}
+                          for node, names in self.labels.items() if names & set(params["labels"]))
+        match = re.match(r"MATCH \(a\)-\[:(\w+)\]->\(b\)", query)
+        if match:
+            return Result({"a": start, "b": end} for start, end in self.pairs(match.group(1)))
+        if query.startswith("UNWIND $rows"):
+            for row in params["rows"]:
+                if "SET n:" in query:
+                    self.labels[row].add(re.search(r"SET n:(\w+)", query).group(1))
+                elif "CREATE (a)-[inferred:" in query:
+                    self.relationships.add((re.search(r"inferred:(\w+)", query).group(1), *row))
+                else:
+                    self.properties.setdefault(row[0], {})[re.search(r"SET n\.(\w+)", query).group(1)] = row[1]
+            return Result()
+        return Result(self.facts(query))
+
+    def session(self, database):
+        graph = self
+
+        class Session:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                pass
+
+            def run(self, query, params=None, **kwargs):
+                return graph.run(query, params, **kwargs)
+
+            def execute_read(self, work):
+                return work(self)
+
+            def execute_write(self, work, *args):
+                graph.writes.append(getattr(work, "metadata", None))
+                return work(self, *args)
+
+        return Session()
+
+
+class Reasoner:
+    def __init__(self, graph):
+        self.main_conn, self.metrics, self.rules = graph, RuleMetrics(), []
+
+    def load_ontology(self):
+        return ONTOLOGY
+
+    def order_rules(self, rules):
+        return list(rules)
+
+    def end_run(self):
+        self.metrics.end_run()
+
+
+@pytest.fixture
+def graph():
+    graph = Graph()
+    graph.engine = SnapshotEngine(Reasoner(graph), "neo4j")
+    return graph
+
+
+def test_snapshot_applies_the_closure_in_one_round(graph):
+    graph.engine.infer_to_convergence()
+    actors = {"keanu", "carrie", "kevin"}
+    assert {node for node, names in graph.labels.items() if {"Actor", "_PersonActedInSome"} <= names} == actors
+    assert {node for node, names in graph.labels.items() if "_KevinBacon" in names} == {"kevin"}
+    coactors = {("keanu", "carrie"), ("carrie", "keanu"), ("carrie", "kevin"), ("kevin", "carrie")}
+    assert set(graph.pairs("_COACTOR")) == set(graph.pairs("COACTOR")) == coactors
+    assert {node: values["kb_number"] for node, values in graph.properties.items() if "kb_number" in values} \
+        == {"kevin": 0, "carrie": 1, "keanu": 2}
+    # One round writing the delta, one finding nothing left to write
+    assert graph.engine.reasoner.metrics.last_run["iterations"] == 2
+    assert graph.writes and all(metadata == SNAPSHOT_METADATA for metadata in graph.writes)
+
+
+def test_snapshot_of_a_converged_graph_writes_nothing(graph):
+    graph.engine.infer_to_convergence()
+    graph.writes.clear()
+    graph.engine.infer_to_convergence()
+    assert graph.writes == []
+
+
+def test_snapshot_writes_are_recognized_in_cdc_records():
+    assert is_snapshot_write({"metadata": {"txMetadata": dict(SNAPSHOT_METADATA)}})
+    assert not is_snapshot_write({"metadata": {"txMetadata": {"app": "neoowl-benchmark-stream"}}})
+    assert not is_snapshot_write({"metadata": None})